@@ -1,20 +1,15 @@
 from fastapi import APIRouter, Query
-from typing import List, Dict, Any
-import tiktoken
+from typing import List, Dict, Any, Optional
 
 from LLM.grok_client import generate_grok_insight
+from LLM.prompt_budget import fit_prompt, pair_lines
 from KPI.dashboard import fetch_processing_partner, fetch_top5_acquirers,fetch_payment_method_distribution
+from KPI.KPI_Dashboard import fetch_dashboard_data  # registers the dashboard units
+from KPI.registry import compute_units, find_unit
+from DB.cancellation import RequestAborted
 
 router = APIRouter()
 
-# ────────────────────────────────────────
-# Utility: Token Estimator
-# ────────────────────────────────────────
-def count_tokens(prompt: str, model: str = "gpt-3.5-turbo") -> int:
-    enc = tiktoken.encoding_for_model(model)
-    return len(enc.encode(prompt))
-
-
 # ────────────────────────────────────────
 # Prompt Builders (including extra_metrics)
 # ────────────────────────────────────────
@@ -23,9 +18,10 @@ def build_currency_revenue_prompt(
     yesterday: float,
     hist_avg: float,
     z_score: float,
-    p_value: float
+    p_value: float,
+    k: Optional[int] = None
 ) -> str:
-    lines = [f"{item['name']}: {item['value']}%" for item in data]
+    lines = pair_lines(((item['name'], item['value']) for item in data), k, "{name}: {value}%")
     return (
         "You're a senior payments strategist. Based on the revenue by currency data below, write a 60–80 word insight.\n\n"
         f"Yesterday’s total revenue: {yesterday:.2f}% of weekly average\n"
@@ -46,9 +42,10 @@ def build_acquirer_volume_prompt(
     yesterday: float,
     hist_avg: float,
     z_score: float,
-    p_value: float
+    p_value: float,
+    k: Optional[int] = None
 ) -> str:
-    lines = [f"{name}: {count} txns" for name, count in zip(x_axis, y_axis)]
+    lines = pair_lines(zip(x_axis, y_axis), k, "{name}: {value} txns")
     return (
         "You're a transaction operations analyst. Based on yesterday’s acquirer volume vs historical trend, write a 60–80 word insight.\n\n"
         f"Yesterday’s txn count: {yesterday:.0f}\n"
@@ -69,9 +66,10 @@ def build_payment_method_prompt(
     yesterday: float,
     hist_avg: float,
     z_score: float,
-    p_value: float
+    p_value: float,
+    k: Optional[int] = None
 ) -> str:
-    lines = [f"{method}: {cnt} txns" for method, cnt in zip(x_axis, y_axis)]
+    lines = pair_lines(zip(x_axis, y_axis), k, "{name}: {value} txns")
     return (
         "You're a digital payments specialist. Write a 60–80 word insight on yesterday’s payment method distribution vs historical.\n\n"
         f"Yesterday’s total txns: {yesterday:.0f}\n"
@@ -90,11 +88,27 @@ def build_payment_method_prompt(
 # Endpoint 1: KPI Dashboard Data
 # ────────────────────────────────────────
 @router.get("/dashboard")
-def get_dashboard_data():
+def get_dashboard_data(
+    limit: Optional[int] = Query(None, ge=1, description="Top N acquirers in the processing partner chart, rest as Other"),
+    offset: int = Query(0, ge=0),
+):
     """
     Returns the raw charts + metrics (including extra_metrics per chart).
+    Past the request deadline the charts finished so far are returned.
     """
-    return fetch_top5_acquirers(),fetch_payment_method_distribution(),fetch_processing_partner()
+    charts = []
+    for fetch in (
+        fetch_top5_acquirers,
+        fetch_payment_method_distribution,
+        lambda: fetch_processing_partner(limit=limit, offset=offset),
+    ):
+        try:
+            charts.append(fetch())
+        except RequestAborted:
+            if not charts:
+                raise
+            break
+    return charts
 
 
 # ────────────────────────────────────────
@@ -104,10 +118,11 @@ def get_dashboard_data():
 def dashboard_ai_insight(
     chart_id: str = Query(..., description="Title of the chart to analyze")
 ):
-    result = fetch_dashboard_data()
-    chart = next((c for c in result.get("charts", []) if c.get("title") == chart_id), None)
-    if not chart:
+    # compute only the requested chart, not every all-time dashboard query
+    unit = find_unit("dashboard", chart_id)
+    if not unit or unit["kind"] != "chart":
         return {"error": f"Chart with title '{chart_id}' not found."}
+    chart = compute_units([unit["key"]], None)[unit["key"]]
 
     # pull out the 4 statistical metrics from extra_metrics
     extra = chart.get("extra_metrics", {})
@@ -116,34 +131,34 @@ def dashboard_ai_insight(
     z_score    = extra.get("z_score", 0)
     p_value    = extra.get("p_value", 0)
 
-    # build the appropriate prompt
-    prompt = ""
+    # build the appropriate prompt, compacted to the token budget
     if chart_id == "Revenue by Currency":
-        prompt = build_currency_revenue_prompt(
+        render = lambda k: build_currency_revenue_prompt(
             chart.get("data", []),
-            yesterday, hist_avg, z_score, p_value
+            yesterday, hist_avg, z_score, p_value, k
         )
     elif chart_id == "Top 5 Acquirers by Volume":
-        prompt = build_acquirer_volume_prompt(
+        render = lambda k: build_acquirer_volume_prompt(
             chart.get("x", []),
             chart.get("y", []),
-            yesterday, hist_avg, z_score, p_value
+            yesterday, hist_avg, z_score, p_value, k
         )
     elif chart_id == "Payment Method Distribution":
-        prompt = build_payment_method_prompt(
+        render = lambda k: build_payment_method_prompt(
             chart.get("x", []),
             chart.get("y", []),
-            yesterday, hist_avg, z_score, p_value
+            yesterday, hist_avg, z_score, p_value, k
         )
     else:
         return {"error": f"No insight generator defined for '{chart_id}'."}
 
-    # count tokens
-    input_tokens = count_tokens(prompt)
+    compact = fit_prompt(render)
+    prompt = compact["prompt"]
+    input_tokens = compact["input_tokens"]
 
     # call your LLM client
     try:
-        resp = generate_grok_insight(prompt, return_usage=True)
+        resp = generate_grok_insight(prompt, return_usage=True, fallback_key=f"dashboard:{chart_id}")
         import json
         if isinstance(resp, dict):
             insight = resp["text"]
@@ -169,6 +184,8 @@ def dashboard_ai_insight(
         "token_usage": {
             "input_tokens":  input_tokens,
             "output_tokens": output_tokens,
-            "total_tokens":  total_tokens
+            "total_tokens":  total_tokens,
+            "raw_input_tokens": compact["raw_input_tokens"],
+            "tokens_saved":     compact["tokens_saved"],
         }
     }
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException
 from datetime import date
 from typing import Optional, Tuple, List
 
 from KPI.DemoGraphic import get_demo_kpi_data
+from KPI.registry import compute_units, parse_include
 from LLM.grok_client import generate_grok_insight
+from LLM.prompt_budget import fit_prompt, fmt_num
 
 router = APIRouter()
 
@@ -14,10 +16,16 @@ router = APIRouter()
 def demographic_kpis(
     filter_type: str = Query(default="YTD", description="Filter type like Daily, Weekly, MTD, etc."),
     start: Optional[date] = Query(default=None),
-    end: Optional[date] = Query(default=None)
+    end: Optional[date] = Query(default=None),
+    include: Optional[str] = Query(default=None, description="Comma-separated units, e.g. sales_by_region,issuer_country"),
+    limit: Optional[int] = Query(default=None, ge=1, description="Top N issuing countries / states per chart, rest as Other"),
+    offset: int = Query(default=0, ge=0),
 ):
     custom = (start, end) if start and end else None
-    return get_demo_kpi_data(filter_type, custom)
+    try:
+        return get_demo_kpi_data(filter_type, custom, parse_include(include), limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # ───────────────────────────
@@ -30,28 +38,27 @@ def demographic_insight(
     end: Optional[date] = Query(default=None)
 ):
     custom = (start, end) if start and end else None
-    result = get_demo_kpi_data(filter_type, custom)
+    summary = compute_units(["demographic.insight_summary"], filter_type, custom)["demographic.insight_summary"]
 
-    chart = result.get("charts", [])[0] if result.get("charts") else None
-    if not chart:
+    if summary["country_count"] == 0:
         return {"insight": "No data available to generate insight."}
 
-    # Unpack values from metrics for prompt generation
-    metrics = {m["title"]: m["value"] for m in result.get("metrics", [])}
-    country_count = metrics.get("Operational Countries", "N/A")
-    state_count = metrics.get("Operational States", "N/A")
-    us_sales = metrics.get("US Sales", "N/A")
-    gb_sales = metrics.get("GB Sales", "N/A")
-    us_success_rate = metrics.get("US Success Rate", "N/A")
-    gb_success_rate = metrics.get("GB Success Rate", "N/A")
-    top_issuer_country = metrics.get("Top Issuer Country", "N/A")
-    top_issuer_percent = metrics.get("Top Issuer Share", "N/A")
-    top_us_state = metrics.get("Top US State", "N/A")
-    us_txn_count = metrics.get("Top US State Txns", "N/A")
-    top_uk_state = metrics.get("Top UK State", "N/A")
-    gb_txn_count = metrics.get("Top UK State Txns", "N/A")
-
-    def build_demo_prompt() -> str:
+    country_count = summary["country_count"]
+    state_count = summary["state_count"]
+    us_sales = summary["us_sales"]
+    gb_sales = summary["gb_sales"]
+    us_success_rate = summary["us_success_rate"]
+    gb_success_rate = summary["gb_success_rate"]
+    top_issuer_country = summary["top_issuer_country"]
+    top_issuer_percent = summary["top_issuer_percent"]
+    top_us_state = summary["top_us_state"]
+    us_txn_count = summary["us_txn_count"]
+    top_uk_state = summary["top_uk_state"]
+    gb_txn_count = summary["gb_txn_count"]
+
+    def build_demo_prompt(k: Optional[int] = None) -> str:
+        # no category lists here; compaction only rounds the raw figures
+        num = fmt_num if k is not None else str
         return f"""
 You are a data analyst reviewing performance metrics from a payments platform. Below is demographic KPI data:
 
@@ -59,15 +66,15 @@ You are a data analyst reviewing performance metrics from a payments platform. B
 - Operational States Count: {state_count}
 
 - Sales by Region (US/GB):
-  - US: ${us_sales}
-  - GB: ${gb_sales}
+  - US: ${num(us_sales)}
+  - GB: ${num(gb_sales)}
 
 - Success Rate by Country (in %):
-  - US: {us_success_rate}%
-  - GB: {gb_success_rate}%
+  - US: {num(us_success_rate)}%
+  - GB: {num(gb_success_rate)}%
 
 - Card Issuing Country Distribution (Top % share):
-  - {top_issuer_country}: {top_issuer_percent}%
+  - {top_issuer_country}: {num(top_issuer_percent)}%
 
 - Top States/Provinces by Transaction Count (US & GB):
   - US: {top_us_state} ({us_txn_count} txns)
@@ -82,10 +89,17 @@ You are a data analyst reviewing performance metrics from a payments platform. B
 Keep it tight, sharp, and focused on business relevance.
         """
 
+    compact = fit_prompt(build_demo_prompt)
     try:
-        prompt = build_demo_prompt()
-        insight = generate_grok_insight(prompt)
+        insight = generate_grok_insight(compact["prompt"], fallback_key=f"demographic:{filter_type}")
     except Exception as e:
         insight = f"Insight generation failed: {str(e)}"
 
-    return {"insight": insight}
+    return {
+        "insight": insight,
+        "token_usage": {
+            "input_tokens":     compact["input_tokens"],
+            "raw_input_tokens": compact["raw_input_tokens"],
+            "tokens_saved":     compact["tokens_saved"],
+        }
+    }
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Query
+from datetime import date
+from typing import Optional
+
+from KPI.anomaly_scan import latest_scan, ANOMALY_SEASONAL, ANOMALY_ALPHA, ANOMALY_REFRESH_AGE
+
+router = APIRouter()
+
+
+@router.get("/anomalies", summary="Most significant deviations across every drill dimension slice")
+def anomalies(
+    day: Optional[date] = Query(default=None, description="Day to test (default yesterday)"),
+    limit: int = Query(default=50, ge=1, le=1000),
+    dimension: Optional[str] = Query(default=None, description="Only slices of this dimension"),
+    metric: Optional[str] = Query(default=None, description="transactions, revenue, success_rate or fraud_rate"),
+    seasonal: bool = Query(default=ANOMALY_SEASONAL, description="Compare with the same weekday only"),
+    refresh: bool = Query(default=False, description=f"Re-run the scan unless it is under {ANOMALY_REFRESH_AGE:g} s old"),
+):
+    result = latest_scan(day, seasonal, ANOMALY_ALPHA, refresh)
+    ranked = [
+        a for a in result["anomalies"]
+        if (dimension is None or a["dimension"] == dimension) and (metric is None or a["metric"] == metric)
+    ]
+    return {**result, "matched": len(ranked), "anomalies": ranked[:limit]}
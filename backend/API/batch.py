@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from datetime import date
+from typing import Optional, List, Dict, Any
+
+from KPI.batch_service import execute_batch
+
+router = APIRouter()
+
+
+class BatchSubRequest(BaseModel):
+    id:          str
+    kind:        str = Field(..., description="dashboard, financial-performance, customer-insights, demographic, "
+                                              "operational-efficiency, risk-and-fraud, gateway-fee or drill")
+    filter_type: str = "YTD"
+    start:       Optional[date] = None
+    end:         Optional[date] = None
+    params:      Dict[str, Any] = Field(default_factory=dict,
+                                        description="Extra arguments, e.g. chartKey/level/dimension/baseValue (or path instead of level) for drill")
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+
+
+@router.post("/batch", summary="Run several KPI / drill requests in one round trip")
+def batch(body: BatchRequest):
+    """
+    Identical sub-requests are executed once, the rest run concurrently and
+    share scalar totals / history queries. Results come back in request order.
+    """
+    try:
+        return execute_batch([r.dict() for r in body.requests])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
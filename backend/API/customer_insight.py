@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException
 from datetime import date
 from typing import Optional, Tuple
 from KPI.customer_insight import get_customer_insights_data
+from KPI.registry import compute_units, find_unit, parse_include
 from LLM.grok_client import generate_grok_insight  # Correct import
+from LLM.prompt_budget import fit_prompt, compact_chart
 import asyncio
 
 router = APIRouter()
@@ -24,10 +26,14 @@ def customer_insights(
         description="Predefined time filter"
     ),
     start: Optional[date] = Query(None, description="Start date for custom range (YYYY-MM-DD)"),
-    end: Optional[date] = Query(None, description="End date for custom range (YYYY-MM-DD)")
+    end: Optional[date] = Query(None, description="End date for custom range (YYYY-MM-DD)"),
+    include: Optional[str] = Query(None, description="Comma-separated units, e.g. transactions_by_acquirer")
 ):
     custom_range: Optional[Tuple[date, date]] = (start, end) if start and end else None
-    return get_customer_insights_data(filter_type, custom_range)
+    try:
+        return get_customer_insights_data(filter_type, custom_range, parse_include(include))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # ───────────────────────────────────────────────────────────────
 @router.get("/customer-insights/insight")
@@ -38,20 +44,26 @@ def customer_insights_ai_insight(
     end: Optional[date] = Query(None)
 ):
     custom_range = (start, end) if start and end else None
-    dashboard_data = get_customer_insights_data(filter_type, custom_range)
 
-    # Match the chart by its title
-    chart_data = next((chart for chart in dashboard_data["charts"] if chart["title"] == chart_id), None)
-
-    if chart_data is None:
+    # Match the chart by its title and compute only that chart
+    unit = find_unit("customer", chart_id) if chart_id else None
+    if unit is None or unit["kind"] != "chart":
         return {"error": "Please provide a valid chart_id."}
+    chart_data = compute_units([unit["key"]], filter_type, custom_range)[unit["key"]]
 
-    prompt = (
+    compact = fit_prompt(lambda k: (
         "You are an analytics assistant. Based on the following chart data, "
         "generate a short and actionable business insight. "
         "Keep it concise, relevant, and insightful.\n\n"
-        f"{chart_data}"
-    )
+        f"{compact_chart(chart_data, k)}"
+    ))
 
-    insight = generate_grok_insight(prompt=prompt)
-    return {"insight": insight}
+    insight = generate_grok_insight(prompt=compact["prompt"], fallback_key=f"customer:{chart_id}:{filter_type}")
+    return {
+        "insight": insight,
+        "token_usage": {
+            "input_tokens":     compact["input_tokens"],
+            "raw_input_tokens": compact["raw_input_tokens"],
+            "tokens_saved":     compact["tokens_saved"],
+        }
+    }
@@ -0,0 +1,93 @@
+import os
+import asyncio
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from DB.cancellation import RequestAborted, request_budget
+
+API_DEADLINE         = float(os.getenv("API_DEADLINE", "20"))          # KPI pages (s)
+API_DEADLINE_DRILL   = float(os.getenv("API_DEADLINE_DRILL", "10"))
+API_DEADLINE_INSIGHT = float(os.getenv("API_DEADLINE_INSIGHT", "45"))  # includes the LLM call
+API_DEADLINE_BATCH   = float(os.getenv("API_DEADLINE_BATCH", "30"))
+
+# longest matching prefix wins; exports and the live socket manage their own lifetime
+ENDPOINT_DEADLINES = {
+    "/api/dashboard":              API_DEADLINE,
+    "/api/financial-performance":  API_DEADLINE,
+    "/api/customer-insights":      API_DEADLINE,
+    "/api/demographic":            API_DEADLINE,
+    "/api/operational-efficiency": API_DEADLINE,
+    "/api/risk-and-fraud":         API_DEADLINE,
+    "/api/gateway-fee":            API_DEADLINE,
+    "/api/trends":                 API_DEADLINE,
+    "/api/anomalies":              API_DEADLINE,
+    "/api/percentiles":            API_DEADLINE,
+    "/api/drill":                  API_DEADLINE_DRILL,
+    "/api/batch":                  API_DEADLINE_BATCH,
+}
+INSIGHT_SUFFIXES = ("/insight", "/insights")
+
+
+def deadline_for(path: str) -> Optional[float]:
+    match = max((p for p in ENDPOINT_DEADLINES if path == p or path.startswith(p + "/")), key=len, default=None)
+    if match is None:
+        return None
+    if path.endswith(INSIGHT_SUFFIXES):
+        return API_DEADLINE_INSIGHT
+    return ENDPOINT_DEADLINES[match]
+
+
+class DeadlineMiddleware:
+    """
+    Gives every KPI / drill request a RequestBudget. The budget aborts at
+    the endpoint's deadline, or as soon as the client disconnects, and
+    cancels whatever statements the request still has running.
+
+    The request body is read up front; afterwards the only message the
+    server can send is http.disconnect, which a watcher task waits for.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        seconds = deadline_for(scope["path"]) if scope["type"] == "http" else None
+        if seconds is None:
+            return await self.app(scope, receive, send)
+
+        body = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message)
+            if not message.get("more_body"):
+                break
+
+        disconnected = asyncio.Event()
+
+        async def replay():
+            if body:
+                return body.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        with request_budget(seconds, scope["path"]) as budget:
+            async def watch():
+                while (await receive())["type"] != "http.disconnect":
+                    pass
+                disconnected.set()
+                budget.abort("client disconnected")
+
+            watcher = asyncio.create_task(watch())
+            try:
+                await self.app(scope, replay, send)
+            finally:
+                watcher.cancel()
+
+
+async def request_aborted_handler(request: Request, exc: RequestAborted):
+    # nothing partial to return (e.g. a drill): say so rather than hang
+    return JSONResponse(status_code=504, content={"detail": exc.reason, "degraded": True})
@@ -1,10 +1,10 @@
 # in app/routes/drill.py
 
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Header, Query, HTTPException
 from enum import Enum
 from datetime import date
-from typing import Optional, Tuple
-from KPI.drill_service import fetch_drill_data
+from typing import List, Optional, Tuple
+from KPI.drill_service import fetch_drill_data, fetch_drill_path
 
 class DrillLevel(str, Enum):
     DRILL_LVL1 = "DRILL_LVL1"
@@ -12,11 +12,28 @@ class DrillLevel(str, Enum):
 
 router = APIRouter()
 
+
+def parse_drill_path(path: List[str]) -> List[Tuple[str, str]]:
+    """
+    ["issuer_country_code:US", "fraud:true"] → [(dimension, value), ...]
+    """
+    pairs = []
+    for step in path:
+        dimension, sep, value = step.partition(":")
+        if not sep or not dimension:
+            raise ValueError(f"Drill path step '{step}' is not dimension:value")
+        pairs.append((dimension, value))
+    return pairs
+
+
 @router.get("/drill", summary="Get chart drill-down data")
 def drill(
     chartKey:       str,
-    level:          DrillLevel,
     dimension:      str,
+    level:          Optional[DrillLevel] = Query(
+                        None,
+                        description="DRILL_LVL1 / DRILL_LVL2; omit to drill along `path`"
+                    ),
     dimension1:    Optional[str] = Query(
                     None,
                     description="Dimension from first-level drill (needed for DRILL_LVL2)"
@@ -26,6 +43,10 @@ def drill(
                         None,
                         description="Value from first-level drill (needed for DRILL_LVL2)"
                     ),
+    path:           List[str] = Query(
+                        [],
+                        description="Drill path without a level: repeated dimension:value filters, outermost first"
+                    ),
     baseValue:      str = Query(
                         ...,
                         description="Value for the chart's base dimension (e.g. currency or acquirer name)"
@@ -33,6 +54,15 @@ def drill(
     filterType:     str = 'YTD',
     custom_start:   Optional[date] = None,
     custom_end:     Optional[date] = None,
+    limit:          Optional[int] = Query(
+                        None, ge=1,
+                        description="Return the top N groups plus an 'Other' row (default: all groups)"
+                    ),
+    offset:         int = Query(0, ge=0, description="Groups to skip before the top N (paging)"),
+    session:        Optional[str] = Header(
+                        None, alias="X-Drill-Session",
+                        description="Client drill session; its path prefixes are cached together"
+                    ),
 ):
     custom: Optional[Tuple[date, date]] = (
         (custom_start, custom_end) if custom_start and custom_end else None
@@ -46,6 +76,18 @@ def drill(
         )
 
     try:
+        if level is None:
+            return fetch_drill_path(
+                chartKey,
+                dimension,
+                baseValue,
+                parse_drill_path(path),
+                filter_type=filterType,
+                custom=custom,
+                limit=limit,
+                offset=offset,
+                session=session,
+            )
         return fetch_drill_data(
             chartKey,
             level.value,
@@ -54,7 +96,10 @@ def drill(
             baseValue,     # use this to filter the *base* dimension
             parentValue,   # None for L1, required for L2
             filter_type=filterType,
-            custom=custom
+            custom=custom,
+            limit=limit,
+            offset=offset,
+            session=session,
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Query, HTTPException
+from fastapi.responses import StreamingResponse
+from datetime import date
+from typing import Optional, Tuple
+
+from KPI.export_service import (
+    EXPORT_FORMATS,
+    drill_export_query,
+    gateway_fee_export_query,
+    parquet_available,
+)
+
+router = APIRouter()
+
+
+def _stream(sql: str, params: dict, fmt: str, filename: str, filter_type: str) -> StreamingResponse:
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{fmt}'")
+    if fmt == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export is not available on this server")
+    media_type, streamer = EXPORT_FORMATS[fmt]
+    return StreamingResponse(
+        streamer(sql, params, filter_type),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+
+# ────────────────────────────────────────
+# Raw rows behind a drill slice
+# ────────────────────────────────────────
+@router.get("/export/drill", summary="Stream the transactions behind a drill slice")
+def export_drill(
+    chartKey:     str,
+    baseValue:    str = Query(..., description="Value for the chart's base dimension"),
+    dimension1:   Optional[str] = Query(None, description="First-level drill dimension (for a LVL2 slice)"),
+    parentValue:  Optional[str] = Query(None, description="Value of dimension1 (for a LVL2 slice)"),
+    filterType:   str = 'YTD',
+    custom_start: Optional[date] = None,
+    custom_end:   Optional[date] = None,
+    format:       str = Query("csv", enum=list(EXPORT_FORMATS)),
+):
+    custom: Optional[Tuple[date, date]] = (
+        (custom_start, custom_end) if custom_start and custom_end else None
+    )
+    try:
+        sql, params = drill_export_query(
+            chartKey, baseValue, dimension1, parentValue,
+            filter_type=filterType, custom=custom,
+        )
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _stream(sql, params, format, f"drill_{chartKey}", filterType)
+
+
+# ────────────────────────────────────────
+# Per-transaction gateway fees
+# ────────────────────────────────────────
+@router.get("/export/gateway-fee", summary="Stream per-transaction gateway fees")
+def export_gateway_fee(
+    filter_type: str = Query("YTD", enum=["Daily", "Weekly", "MTD", "YTD", "Custom"]),
+    start_date:  Optional[date] = Query(None),
+    end_date:    Optional[date] = Query(None),
+    acquirer:    Optional[str] = Query(None, description="Restrict to one acquirer"),
+    format:      str = Query("csv", enum=list(EXPORT_FORMATS)),
+):
+    custom_range = (start_date, end_date) if filter_type == "Custom" and start_date and end_date else None
+    try:
+        sql, params = gateway_fee_export_query(
+            "custom" if custom_range else filter_type, custom_range, acquirer
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _stream(sql, params, format, "gateway_fee", filter_type)
@@ -1,23 +1,16 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException
 from typing import Optional, List, Tuple, Dict, Any
 from datetime import date
-import tiktoken
 
 from KPI.financial_analysis import get_financial_performance_data
+from KPI.registry import compute_units, find_unit, parse_include, degraded_fields
 from LLM.grok_client import generate_grok_insight
+from LLM.prompt_budget import fit_prompt, pair_lines
 from KPI.utils.stat_tests import compare_to_historical_single_point
 
 router = APIRouter()
 
 
-# ────────────────────────────────────────
-# Utility: Token Estimator
-# ────────────────────────────────────────
-def count_tokens(prompt: str, model: str = "gpt-3.5-turbo") -> int:
-    enc = tiktoken.encoding_for_model(model)
-    return len(enc.encode(prompt))
-
-
 # ────────────────────────────────────────
 # Prompt Builders (now include stats)
 # ────────────────────────────────────────
@@ -26,9 +19,10 @@ def build_sales_by_currency_prompt(
     yesterday: float,
     hist_avg: float,
     z_score: float,
-    p_value: float
+    p_value: float,
+    k: Optional[int] = None
 ) -> str:
-    lines = [f"{row['name']}: ${row['value']:.2f}" for row in data]
+    lines = pair_lines(((row['name'], row['value']) for row in data), k, "{name}: ${value}")
     return (
         "You are a senior payments analyst. Based on the currency‑wise sales data below, write a 60–80 word strategic insight.\n\n"
         f"Yesterday’s total sales: ${yesterday:.2f}\n"
@@ -47,9 +41,11 @@ def build_processing_fee_prompt(
     yesterday: float,
     hist_avg: float,
     z_score: float,
-    p_value: float
+    p_value: float,
+    k: Optional[int] = None
 ) -> str:
-    lines = [f"{name}: {fee:.2f}%" for name, fee in acquirer_data]
+    # fee % is a rate, so the roll-up is the mean of the remaining acquirers
+    lines = pair_lines(acquirer_data, k, "{name}: {value}%", rollup="mean")
     return (
         "You are a payments cost optimization specialist. Analyze the acquirer‑wise processing fee data and provide a concise 60–80 word business insight.\n\n"
         f"Yesterday’s avg fee %: {yesterday:.2f}\n"
@@ -71,16 +67,21 @@ def financial_kpis(
     filter_type: str = Query("YTD", enum=["Daily", "Weekly", "MTD", "YTD", "Custom"]),
     start_date: Optional[date] = Query(None),
     end_date:   Optional[date] = Query(None),
+    include:    Optional[str] = Query(None, description="Comma-separated units, e.g. total_volume,sales_by_currency"),
 ):
     custom_range = (
         (start_date, end_date)
         if filter_type == "Custom" and start_date and end_date
         else None
     )
-    result = get_financial_performance_data(filter_type, custom_range)
+    try:
+        result = get_financial_performance_data(filter_type, custom_range, parse_include(include))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "metrics": result.get("metrics", []),
         "charts":  result.get("charts",  []),
+        **degraded_fields(result),
     }
 
 
@@ -99,23 +100,21 @@ def financial_kpi_insight(
         if filter_type == "Custom" and start_date and end_date
         else None
     )
-    result = get_financial_performance_data(filter_type, custom_range)
-
-    # Find the requested chart
-    chart = next((c for c in result.get("charts", []) if c.get("title") == chart_id), None)
-    if not chart:
+    # Compute only the requested chart and its insight series
+    traces = {
+        "Sales by Currency":       "financial.sales_by_currency_pct",
+        "Processing Fee Analysis": "financial.processing_fee_pct",
+    }
+    unit = find_unit("financial", chart_id)
+    if not unit:
         return {"error": f"Chart with title '{chart_id}' not found."}
-
-    # Pull out the insight_data series
-    insight_data = result.get("insight_data", {})
-    trace = {}
-    if chart_id == "Sales by Currency":
-        trace = insight_data.get("sales_by_currency", {})
-    elif chart_id == "Processing Fee Analysis":
-        trace = insight_data.get("processing_fee_pct", {})
-    else:
+    if chart_id not in traces:
         return {"error": f"No insight builder defined for '{chart_id}'."}
 
+    results = compute_units([unit["key"], traces[chart_id]], filter_type, custom_range)
+    chart = results[unit["key"]]
+    trace = results[traces[chart_id]]
+
     # Compute stats from the series
     yesterday = trace.get("yesterday", 0.0)
     hist      = trace.get("historical", [])
@@ -124,28 +123,31 @@ def financial_kpi_insight(
     z_score   = comp["z_score"]
     p_value   = comp["p_value"]
 
-    # Build the prompt
+    # Build the prompt, compacted to the token budget
     if chart_id == "Sales by Currency":
-        prompt = build_sales_by_currency_prompt(
+        render = lambda k: build_sales_by_currency_prompt(
             chart.get("data", []),
-            yesterday, hist_avg, z_score, p_value
+            yesterday, hist_avg, z_score, p_value, k
         )
     else:  # Processing Fee Analysis
         x = chart.get("x", [])
         # Depending on how you named it, your data might live in chart['series'][0]['data']
         y = chart.get("series", [{}])[0].get("data", [])
         acquirer_data = list(zip(x, y))
-        prompt = build_processing_fee_prompt(
+        render = lambda k: build_processing_fee_prompt(
             acquirer_data,
-            yesterday, hist_avg, z_score, p_value
+            yesterday, hist_avg, z_score, p_value, k
         )
 
-    # Count input tokens
-    input_tokens = count_tokens(prompt)
+    compact = fit_prompt(render)
+    prompt = compact["prompt"]
+    input_tokens = compact["input_tokens"]
 
     # Generate the insight
     try:
-        resp = generate_grok_insight(prompt, return_usage=True)
+        resp = generate_grok_insight(
+            prompt, return_usage=True, fallback_key=f"financial:{chart_id}:{filter_type}"
+        )
         if isinstance(resp, dict):
             insight       = resp.get("text")
             usage         = resp.get("usage", {})
@@ -169,5 +171,7 @@ def financial_kpi_insight(
             "input_tokens":  input_tokens,
             "output_tokens": output_tokens,
             "total_tokens":  total_tokens,
+            "raw_input_tokens": compact["raw_input_tokens"],
+            "tokens_saved":     compact["tokens_saved"],
         }
     }
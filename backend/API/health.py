@@ -0,0 +1,78 @@
+import os
+
+from fastapi import APIRouter
+
+from DB.connector import pool_stats
+from DB.replicas import replica_stats
+from KPI.utils.single_flight import single_flight_stats
+from KPI.utils.baseline import baseline_stats
+from KPI.utils.dimensions import dimension_stats
+from KPI.utils.shared_cache import cache_stats
+from KPI.drill_cube import drill_cube_stats
+from KPI.drill_prefetch import drill_prefetch_stats
+from KPI.drill_bitmap import drill_bitmap_stats
+from KPI.drill_path import drill_session_stats
+from KPI.trends import rollup_stats
+from KPI.quantiles import sketch_stats
+
+router = APIRouter()
+
+
+@router.get("/health", summary="Liveness check")
+def health():
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@router.get("/health/pool", summary="DB connection pool usage of the worker serving the request")
+def health_pool():
+    return {"pid": os.getpid(), **pool_stats()}
+
+
+@router.get("/health/replicas", summary="Read-replica lag, availability and routing counters")
+def health_replicas():
+    return {"pid": os.getpid(), **replica_stats()}
+
+
+@router.get("/health/single-flight", summary="Coalesced KPI / LLM calls and waiter counts per key")
+def health_single_flight():
+    return {"pid": os.getpid(), **single_flight_stats()}
+
+
+@router.get("/health/baselines", summary="Weekday baselines fitted / served from cache today")
+def health_baselines():
+    return {"pid": os.getpid(), **baseline_stats()}
+
+
+@router.get("/health/drill-cube", summary="First-level drill cubes cached / built by this worker")
+def health_drill_cube():
+    return {"pid": os.getpid(), **drill_cube_stats()}
+
+
+@router.get("/health/drill-prefetch", summary="Speculative second-level drills: budget skips and hit rate")
+def health_drill_prefetch():
+    return {"pid": os.getpid(), **drill_prefetch_stats()}
+
+
+@router.get("/health/drill-bitmap", summary="Bitmap drill snapshot size, age and query latency")
+def health_drill_bitmap():
+    return {"pid": os.getpid(), **drill_bitmap_stats()}
+
+
+@router.get("/health/drill-sessions", summary="Drill path prefixes cached per session and their memory")
+def health_drill_sessions():
+    return {"pid": os.getpid(), **drill_session_stats()}
+
+
+@router.get("/health/dimensions", summary="Dimension lookup cache: last load, sizes and change checks")
+def health_dimensions():
+    return {"pid": os.getpid(), **dimension_stats()}
+
+
+@router.get("/health/cache", summary="Tiered cache hits per tier and namespace (memory, disk, network)")
+def health_cache():
+    return {"pid": os.getpid(), **cache_stats()}
+
+
+@router.get("/health/rollups", summary="Background rollup refreshes: last run, duration and rows written")
+def health_rollups():
+    return {"pid": os.getpid(), "trends": rollup_stats(), "sketches": sketch_stats()}
@@ -0,0 +1,57 @@
+import asyncio
+import json
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+
+from KPI.live_feed import live_feed
+
+router = APIRouter()
+
+
+@router.websocket("/live")
+async def live_kpis(websocket: WebSocket, page: str = "dashboard", filter_type: str = "Today"):
+    """
+    Pushes a snapshot of the live aggregates for (page, filter_type), then a
+    delta message whenever new live_transactions rows arrive.
+    Pages: dashboard, activity. Filters: Today, MTD, YTD.
+    """
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    try:
+        # seeding may hit the database, keep it off the event loop
+        sub_id, queue, snapshot = await run_in_threadpool(live_feed.subscribe, page, filter_type, loop)
+    except ValueError as e:
+        await websocket.send_text(json.dumps({"type": "error", "error": str(e)}))
+        await websocket.close(code=1008)
+        return
+
+    receiver = None
+    try:
+        await websocket.send_text(json.dumps(
+            {"page": page, "filter_type": filter_type, "type": "snapshot", "data": snapshot}, default=str
+        ))
+        # anything the client sends is ignored; receive() is only used to notice disconnects
+        receiver = asyncio.ensure_future(websocket.receive_text())
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                await websocket.send_text(getter.result())
+            else:
+                getter.cancel()
+            if receiver in done:
+                receiver.result()  # raises WebSocketDisconnect once the client is gone
+                receiver = asyncio.ensure_future(websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        # off the event loop (it takes the feed lock), and shielded so a
+        # cancelled handler still unsubscribes
+        await asyncio.shield(run_in_threadpool(live_feed.unsubscribe, page, filter_type, sub_id))
+
+
+@router.get("/live/stats")
+def live_stats():
+    return live_feed.stats()
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from LLM.grok_client import llm_stats
+
+router = APIRouter()
+
+
+@router.get("/llm/stats", summary="LLM client concurrency, breaker state and fallback counters")
+def get_llm_stats():
+    return llm_stats()
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException
 from KPI.operational_efficiency import get_operational_efficiency_data
+from KPI.registry import parse_include
 from datetime import date
 from typing import Optional, Tuple
 
@@ -9,8 +10,12 @@ router = APIRouter()
 def operational_efficiency(
     filter_type: str = Query(default="YTD", description="Time range filter (e.g., today, yesterday, daily, weekly, mtd, ytd)"),
     start: date = Query(None),
-    end:   date = Query(None)
+    end:   date = Query(None),
+    include: Optional[str] = Query(None, description="Comma-separated units, e.g. success_rate,partner_efficiency")
 ):
     
     custom = (start, end) if start and end else None
-    return get_operational_efficiency_data(filter_type, custom)
\ No newline at end of file
+    try:
+        return get_operational_efficiency_data(filter_type, custom, parse_include(include))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
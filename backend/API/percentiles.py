@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Query, HTTPException
+from datetime import date
+from typing import Optional
+
+from DB.replicas import read_connection
+from KPI.utils.time_utils import get_date_ranges
+from KPI.quantiles import percentiles, quantile_options
+
+router = APIRouter()
+
+
+@router.get("/percentiles", summary="Measures and dimensions available as percentiles")
+def list_percentiles():
+    return quantile_options()
+
+
+@router.get("/percentiles/{measure}", summary="p50 / p90 / p99 of a measure per dimension value, from daily sketches")
+def measure_percentiles(
+    measure: str,
+    dimension: str = Query(default="all", description="all, acquirer, currency or region"),
+    filter_type: str = Query(default="YTD", description="Filter type like Weekly, MTD, YTD or custom"),
+    start: Optional[date] = Query(default=None),
+    end: Optional[date] = Query(default=None),
+):
+    custom = (start, end) if start and end else None
+    s, e, _, _ = get_date_ranges(filter_type, custom)
+    try:
+        with read_connection(filter_type) as conn:
+            rows = percentiles(conn, measure, dimension, s, e)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    return {"measure": measure, "dimension": dimension, "start": s, "end": e, "data": rows}
@@ -1,21 +1,15 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException
 from typing import Optional, List, Tuple
 from datetime import date
-import tiktoken
 
 from KPI.report import get_gateway_fee_analysis
+from KPI.registry import parse_include, degraded_fields
 from LLM.grok_client import generate_grok_insight
+from LLM.prompt_budget import fit_prompt, pair_lines
 from KPI.utils.time_utils import get_date_ranges
 
 router = APIRouter()
 
-# ────────────────────────────────────────
-# Utility: Token Estimator
-# ────────────────────────────────────────
-def count_tokens(prompt: str, model: str = "gpt-3.5-turbo") -> int:
-    enc = tiktoken.encoding_for_model(model)
-    return len(enc.encode(prompt))
-
 # ────────────────────────────────────────
 # Utility: Prompt Builder
 # ────────────────────────────────────────
@@ -23,13 +17,14 @@ def build_gateway_fee_prompt(acquirer_data: List[Tuple[str, float]],
                              yesterday_val: float,
                              hist_avg: float,
                              z_score: float,
-                             p_value: float) -> str:
+                             p_value: float,
+                             k: Optional[int] = None) -> str:
     return (
         "You are a senior payments strategy analyst. Based on the data below, generate a 60–80 word actionable business insight with strategic recommendations.\n\n"
         f"Yesterday’s total gateway fee: ${yesterday_val:.2f}\n"
         f"7-day average: ${hist_avg:.2f}\n"
         "Acquirer-wise gateway fee distribution:\n" +
-        "\n".join([f"{name}: ${fee:.2f}" for name, fee in acquirer_data]) +
+        "\n".join(pair_lines(acquirer_data, k, "{name}: ${value}")) +
         f"\n\nZ-score: {z_score:.2f}, P-value: {p_value:.4f}\n\n"
         "In your insight:\n"
         "- Highlight if the fee change is notable and why\n"
@@ -48,14 +43,19 @@ def gateway_fee_kpi(
     filter_type: str = Query("YTD", enum=["Daily", "Weekly", "MTD", "YTD", "Custom"]),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None),
+    include: Optional[str] = Query(None, description="Comma-separated units, e.g. gateway_fee_distribution"),
 ):
     custom_range = (start_date, end_date) if filter_type == "Custom" and start_date and end_date else None
-    result = get_gateway_fee_analysis(filter_type, custom_range)
+    try:
+        result = get_gateway_fee_analysis(filter_type, custom_range, parse_include(include))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     print(result.get('metrics', []))
 
     return {
         "metrics": result.get('metrics', []),
-        "charts": result.get('charts', [])
+        "charts": result.get('charts', []),
+        **degraded_fields(result)
     }
 
 # ────────────────────────────────────────
@@ -75,7 +75,7 @@ def gateway_fee_insight(
         return {"insight": "No data available to generate insight."}
 
     # Prepare data for prompt
-    acquirer_data = list(zip(chart['x'], chart['y']))[:10]
+    acquirer_data = list(zip(chart['x'], chart['y']))
     # Fetch metrics for stat insight
     metric = result['metrics'][0] if result['metrics'] else {}
     yesterday_val = metric.get('value', 0)
@@ -83,19 +83,19 @@ def gateway_fee_insight(
     z_score = metric.get('z_score', 0)
     p_value = metric.get('p_value', 0)
 
-    prompt = build_gateway_fee_prompt(acquirer_data, yesterday_val, hist_avg, z_score, p_value)
+    compact = fit_prompt(lambda k: build_gateway_fee_prompt(
+        acquirer_data, yesterday_val, hist_avg, z_score, p_value, k
+    ))
+    prompt = compact["prompt"]
     print(f"Generated prompt: {prompt}")
-
-    # Count input tokens
-    input_tokens = count_tokens(prompt)
+    input_tokens = compact["input_tokens"]
 
     try:
         # Assuming the LLM client supports returning usage
-        response = generate_grok_insight(prompt, return_usage=True)
-        # If response is a list or tuple, use index access; adjust as needed based on actual response structure
-        insight = response[0]
-        output_tokens = response[1]['completion_tokens'] if isinstance(response[1], dict) and 'completion_tokens' in response[1] else None
-        total_tokens = response[1]['total_tokens'] if isinstance(response[1], dict) and 'total_tokens' in response[1] else None
+        response = generate_grok_insight(prompt, return_usage=True, fallback_key=f"gateway-fee:{filter_type}")
+        insight = response["text"]
+        output_tokens = response["usage"].get("completion_tokens")
+        total_tokens = response["usage"].get("total_tokens")
     except Exception as e:
         insight = f"Insight generation failed: {str(e)}"
         output_tokens = None
@@ -106,6 +106,8 @@ def gateway_fee_insight(
         "token_usage": {
             "input_tokens": input_tokens,
             "output_tokens": output_tokens,
-            "total_tokens": total_tokens
+            "total_tokens": total_tokens,
+            "raw_input_tokens": compact["raw_input_tokens"],
+            "tokens_saved": compact["tokens_saved"]
         }
     }
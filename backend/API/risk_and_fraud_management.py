@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException
 from datetime import date
+from typing import Optional
 from KPI.risk_and_fraud_management import get_risk_and_fraud_data
+from KPI.registry import parse_include
 
 router = APIRouter()
 
@@ -8,7 +10,11 @@ router = APIRouter()
 def risk_and_fraud_management(
     filter_type: str = Query(default="YTD", description="Filter type like Today, Daily, Weekly, MTD, etc."),
     start: date = Query(default=None),
-    end: date = Query(default=None)
+    end: date = Query(default=None),
+    include: Optional[str] = Query(default=None, description="Comma-separated units, e.g. fraud_loss,risk_by_region")
 ):
     custom = (start, end) if start and end else None
-    return get_risk_and_fraud_data(filter_type, custom)
\ No newline at end of file
+    try:
+        return get_risk_and_fraud_data(filter_type, custom, parse_include(include))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
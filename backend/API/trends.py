@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Query, HTTPException
+from datetime import date
+from typing import Optional
+
+from KPI.trends import fetch_trend, trend_metrics, TREND_DEFAULT_POINTS
+
+router = APIRouter()
+
+
+@router.get("/trends", summary="Metrics available as long-range trends")
+def list_trends():
+    return trend_metrics()
+
+
+@router.get("/trends/{metric}", summary="Daily / hourly trend of a metric, downsampled to a point budget")
+def trend(
+    metric: str,
+    filter_type: str = Query(default="YTD", description="Filter type like Weekly, MTD, YTD or custom"),
+    start: Optional[date] = Query(default=None),
+    end: Optional[date] = Query(default=None),
+    points: int = Query(default=TREND_DEFAULT_POINTS, description="Maximum points returned (LTTB downsampling)"),
+    grain: str = Query(default="auto", description="day, hour or auto"),
+):
+    custom = (start, end) if start and end else None
+    try:
+        return fetch_trend(metric, filter_type, custom, points, grain)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
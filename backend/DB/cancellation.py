@@ -0,0 +1,140 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestAborted(Exception):
+    """
+    The request's deadline passed or its client went away. `partial` holds
+    whatever was computed before that, for a degraded response.
+    """
+
+    def __init__(self, reason: str, partial: Optional[Dict[str, Any]] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial = partial or {}
+
+
+class RequestBudget:
+    """
+    Deadline and cancellation state of one API request. Every statement run
+    while the budget is active registers its DBAPI connection; abort()
+    sends a cancel request for the statements still running (the libpq
+    equivalent of pg_cancel_backend) and makes later statements fail fast.
+    """
+
+    def __init__(self, seconds: float, label: str = ""):
+        self.label = label
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        self.reason: Optional[str] = None
+        self.cancelled_statements = 0
+        self._lock = threading.Lock()
+        self._running: Dict[int, Any] = {}
+        self._closed = False
+        self._timer = threading.Timer(seconds, self.abort, args=("deadline exceeded",))
+        self._timer.daemon = True
+
+    @property
+    def aborted(self) -> bool:
+        return self.reason is not None
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        if self.reason is not None:
+            raise RequestAborted(self.reason)
+
+    def abort(self, reason: str) -> None:
+        with self._lock:
+            if self._closed or self.reason is not None:
+                return
+            self.reason = reason
+            running = list(self._running.values())
+        for dbapi_conn in running:
+            try:
+                dbapi_conn.cancel()
+                self.cancelled_statements += 1
+            except Exception as e:
+                print("🔴 Statement cancel failed:", e)
+        print(f"🔴 {self.label or 'request'} aborted ({reason}), "
+              f"cancelled {len(running)} running statement(s)")
+
+    def _register(self, dbapi_conn) -> None:
+        with self._lock:
+            self._running[id(dbapi_conn)] = dbapi_conn
+
+    def _unregister(self, dbapi_conn) -> None:
+        with self._lock:
+            self._running.pop(id(dbapi_conn), None)
+
+    def start(self) -> None:
+        self._timer.start()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._timer.cancel()
+
+
+_active_budget: ContextVar[Optional[RequestBudget]] = ContextVar("_active_budget", default=None)
+
+
+def current_budget() -> Optional[RequestBudget]:
+    return _active_budget.get()
+
+
+@contextmanager
+def request_budget(seconds: float, label: str = "") -> Iterator[RequestBudget]:
+    """
+    Activates a budget for the current context (and any thread running a
+    copy of it, such as FastAPI's threadpool or the batch executor).
+    """
+    budget = RequestBudget(seconds, label)
+    token = _active_budget.set(budget)
+    budget.start()
+    try:
+        yield budget
+    finally:
+        budget.close()
+        _active_budget.reset(token)
+
+
+# ─── Engine hooks (every engine, primary and replicas) ────────────────
+def _dbapi(conn):
+    fairy = conn.connection
+    return getattr(fairy, "dbapi_connection", None) or fairy.connection
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    budget = _active_budget.get()
+    if budget is not None:
+        budget.check()
+        budget._register(_dbapi(conn))
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    budget = _active_budget.get()
+    if budget is not None:
+        budget._unregister(_dbapi(conn))
+
+
+@event.listens_for(Engine, "handle_error")
+def _on_error(exception_context):
+    budget = _active_budget.get()
+    if budget is None:
+        return
+    conn = exception_context.connection
+    if conn is not None and not conn.invalidated:
+        budget._unregister(_dbapi(conn))
+    if budget.aborted:
+        # QueryCanceled and friends surface as one exception type
+        raise RequestAborted(budget.reason) from exception_context.original_exception
@@ -1,16 +1,49 @@
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 
+import DB.cancellation  # noqa: F401  (statement cancel hooks for request deadlines)
+
 load_dotenv()  # loads .env into environment
 
+DB_POOL_SIZE    = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+@lru_cache(maxsize=None)
 def get_engine():
     """
     Creates and returns a SQLAlchemy Engine using credentials from .env.
+    The engine (and its connection pool) is created once per process and
+    shared by every KPI module.
+    """
+    return create_engine(
+        db_url(os.getenv('DB_HOST'), os.getenv('DB_PORT')), future=True, pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+    )
+
+
+def db_url(host: str, port: str) -> str:
     """
-    url = (
+    Connection URL for a server with the .env credentials and database name.
+    """
+    return (
         f"postgresql+psycopg2://{os.getenv('DB_USER')}:"
-        f"{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:"
-        f"{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+        f"{os.getenv('DB_PASSWORD')}@{host}:"
+        f"{port}/{os.getenv('DB_NAME')}"
     )
-    return create_engine(url, future=True, pool_pre_ping=True)
\ No newline at end of file
+
+
+def pool_stats() -> dict:
+    """
+    Snapshot of this process's connection pool; checked_out reaching
+    capacity means requests are queueing for a connection.
+    """
+    pool = get_engine().pool
+    return {
+        "size":        pool.size(),
+        "capacity":    DB_POOL_SIZE + DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "checked_in":  pool.checkedin(),
+        "overflow":    pool.overflow(),
+    }
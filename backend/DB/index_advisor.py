@@ -0,0 +1,241 @@
+"""
+Index advisor: runs every registered KPI query under EXPLAIN and flags
+sequential scans that an index could avoid.
+
+The queries are collected by evaluating each KPI page, the dashboard
+charts and one drill per chart once while recording the statements sent
+to the database; each distinct statement is then explained with the
+parameters it actually ran with.
+
+    python -m DB.index_advisor [--filter YTD] [--analyze] [--json]
+"""
+import os
+import re
+import json
+import argparse
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from DB.connector import get_engine
+from DB.migrations import MIGRATIONS, applied_versions
+
+# seq scans over tables smaller than this are cheaper than any index
+ADVISOR_MIN_ROWS = int(os.getenv("ADVISOR_MIN_ROWS", "10000"))
+
+# statements that are not KPI queries
+_IGNORE = re.compile(r"^\s*(EXPLAIN|SELECT\s+CASE\s+WHEN\s+NOT\s+pg_is_in_recovery|select\s+pg_catalog|show\s)", re.I)
+
+
+class QueryRecorder:
+    """
+    Records (statement, parameters) of every cursor execute while active,
+    labelled with whatever the collector is currently evaluating.
+    """
+
+    def __init__(self):
+        self.label = ""
+        self.queries: Dict[str, Dict[str, Any]] = {}
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if _IGNORE.match(statement):
+            return
+        q = self.queries.setdefault(statement, {"sql": statement, "params": parameters, "sources": []})
+        if self.label not in q["sources"]:
+            q["sources"].append(self.label)
+
+    def __enter__(self):
+        event.listen(Engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, "before_cursor_execute", self._on_execute)
+
+
+def collect_queries(filter_type: str = "YTD") -> List[Dict[str, Any]]:
+    """
+    Evaluates every registered KPI unit, the dashboard charts and one
+    LVL1 drill per drillable chart, returning the distinct statements run.
+    """
+    # imported here: the advisor is a DB tool, the KPI layer sits above it
+    import KPI.KPI_Dashboard, KPI.financial_analysis, KPI.customer_insight  # noqa: F401,E401
+    import KPI.DemoGraphic, KPI.operational_efficiency                      # noqa: F401,E401
+    import KPI.risk_and_fraud_management, KPI.report                        # noqa: F401,E401
+    from KPI.registry import _UNITS, compute_units
+    from KPI.dashboard import fetch_top5_acquirers, fetch_payment_method_distribution, fetch_processing_partner
+    from KPI.drill_service import fetch_drill_data
+    from KPI.chart_configs import CHART_BASE_DIMENSION, chart_drill_options
+    from KPI.utils.shared_cache import cache_bypass
+
+    targets = []
+    for page in sorted({u["page"] for u in _UNITS.values()}):
+        keys = [k for k, u in _UNITS.items() if u["page"] == page]
+        page_filter = None if page == "dashboard" else filter_type  # the KPI dashboard is all-time
+        targets.append((f"page:{page}", lambda keys=keys, f=page_filter: compute_units(keys, f)))
+    for fetch in (fetch_top5_acquirers, fetch_payment_method_distribution, fetch_processing_partner):
+        targets.append((f"dashboard:{fetch.__name__}", lambda fetch=fetch: fetch(filter_type)))
+    for chart_key in CHART_BASE_DIMENSION:
+        dimension = chart_drill_options.get(chart_key, ["credit_card_type"])[0]
+        targets.append((f"drill:{chart_key}", lambda c=chart_key, d=dimension: fetch_drill_data(
+            c, "DRILL_LVL1", d, None, "", filter_type=filter_type)))
+
+    with QueryRecorder() as rec, cache_bypass():
+        for label, run in targets:
+            rec.label = label
+            try:
+                run()
+            except Exception as e:
+                print(f"🔴 {label} failed while collecting queries:", e)
+    return list(rec.queries.values())
+
+
+def _plan_nodes(node: Dict[str, Any]):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _norm(expr: str) -> str:
+    return re.sub(r"[\s()]", "", expr)
+
+
+def _leads_filter(lead: str, flt: str) -> bool:
+    # the index's leading key appears in the filter as a whole expression
+    return re.search(rf"(?<![\w.]){re.escape(_norm(lead))}(?![\w])", _norm(flt)) is not None
+
+
+def table_info(conn) -> Dict[str, Dict[str, Any]]:
+    """
+    Estimated rows, columns and leading index keys per public table.
+    """
+    info: Dict[str, Dict[str, Any]] = {}
+    for name, rows in conn.execute(text("""
+        SELECT c.relname, c.reltuples::bigint
+          FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = 'public' AND c.relkind = 'r'
+    """)):
+        info[name] = {"rows": rows, "columns": [], "indexes": {}}
+    for table, column in conn.execute(text("""
+        SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = 'public'
+    """)):
+        if table in info:
+            info[table]["columns"].append(column)
+    for table, index, lead in conn.execute(text("""
+        SELECT i.indrelid::regclass::text, i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid, 1, true)
+          FROM pg_index i JOIN pg_class c ON c.oid = i.indrelid
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE n.nspname = 'public'
+    """)):
+        if table in info:
+            info[table]["indexes"][index] = lead
+    return info
+
+
+def advise(queries: List[Dict[str, Any]], analyze: bool = False) -> Dict[str, Any]:
+    """
+    Explains each query and reports its sequential scans:
+      missing_index  a filtered scan of a large table with no index whose
+                     leading key appears in the filter
+      unused_index   an index matching the filter exists but the planner
+                     still scans (low selectivity, or a stale plan)
+      full_scan      an unfiltered scan (all-time totals); no index helps
+    """
+    explain = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " if analyze else "EXPLAIN (FORMAT JSON) "
+    report = []
+    with get_engine().connect() as conn:
+        tables = table_info(conn)
+        pending = [m for m in MIGRATIONS if m["version"] not in applied_versions(conn)]
+        conn.commit()
+        for q in queries:
+            try:
+                plan = conn.exec_driver_sql(explain + q["sql"], q["params"] or {}).scalar()[0]
+            except Exception as e:
+                conn.rollback()
+                report.append({**_summary(q), "error": str(e).splitlines()[0]})
+                continue
+            finally:
+                if analyze:
+                    conn.rollback()
+            findings = []
+            for node in _plan_nodes(plan["Plan"]):
+                if node.get("Node Type") != "Seq Scan":
+                    continue
+                table = node.get("Relation Name")
+                t = tables.get(table, {"rows": 0, "columns": [], "indexes": {}})
+                flt = node.get("Filter")
+                if t["rows"] < ADVISOR_MIN_ROWS:
+                    continue
+                if not flt:
+                    findings.append({"kind": "full_scan", "table": table, "rows": t["rows"]})
+                    continue
+                matching = [i for i, lead in t["indexes"].items() if _leads_filter(lead, flt)]
+                findings.append({
+                    "kind":           "unused_index" if matching else "missing_index",
+                    "table":          table,
+                    "rows":           t["rows"],
+                    "filter":         flt,
+                    "filter_columns": [c for c in t["columns"] if re.search(rf"\b{c}\b", flt)],
+                    "indexes":        matching,
+                })
+            report.append({
+                **_summary(q),
+                "total_cost": plan["Plan"].get("Total Cost"),
+                **({"execution_ms": plan.get("Execution Time")} if analyze else {}),
+                "findings":   findings,
+            })
+
+    report.sort(key=lambda r: (-sum(f["kind"] == "missing_index" for f in r.get("findings", [])),
+                               -(r.get("total_cost") or 0)))
+    return {
+        "queries":            len(report),
+        "missing_index":      sum(f["kind"] == "missing_index" for r in report for f in r.get("findings", [])),
+        "pending_migrations": [f"{m['version']}: {m['name']}" for m in pending],
+        "report":             report,
+    }
+
+
+def _summary(q: Dict[str, Any]) -> Dict[str, Any]:
+    return {"sources": q["sources"], "sql": " ".join(q["sql"].split())}
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    icons = {"missing_index": "🔴", "unused_index": "🟠", "full_scan": "⚪"}
+    for r in result["report"]:
+        if "error" in r:
+            print(f"\n⚠️  {', '.join(r['sources'])}: EXPLAIN failed: {r['error']}")
+            continue
+        if not r["findings"]:
+            continue
+        print(f"\n{', '.join(r['sources'])}  (cost {r['total_cost']:.0f})")
+        print(f"   {r['sql'][:160]}")
+        for f in r["findings"]:
+            line = f"   {icons[f['kind']]} {f['kind']} on {f['table']} (~{f['rows']} rows)"
+            if f.get("filter"):
+                line += f" filter columns: {', '.join(f['filter_columns']) or '?'}"
+            if f.get("indexes"):
+                line += f" (has {', '.join(f['indexes'])})"
+            print(line)
+    print(f"\n{result['queries']} queries explained, {result['missing_index']} scan(s) missing an index")
+    if result["pending_migrations"]:
+        print("Pending migrations (python -m DB.migrations up):")
+        for m in result["pending_migrations"]:
+            print(f"   {m}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="EXPLAIN every KPI query and flag missing indexes")
+    parser.add_argument("--filter", default="YTD", help="page filter the queries are collected with")
+    parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (runs each query again)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    result = advise(collect_queries(args.filter), args.analyze)
+    if args.json:
+        print(json.dumps(result, indent=2, default=str))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Versioned schema migrations for the analytics database.
+
+The KPI queries filter on the transaction day (`created_at::date`), mostly
+together with a merchant, an acquirer, a fraud flag or an SCA type. The
+indexes below match those predicates exactly: a plain index on created_at
+is of no use to `created_at::date BETWEEN :s AND :e`, so every index is
+built on the day expression.
+
+Applied versions are recorded in schema_migrations. Indexes are built
+CONCURRENTLY so a migration never blocks ingestion into live_transactions;
+a version is only recorded once each of its indexes is valid.
+
+    python -m DB.migrations status
+    python -m DB.migrations up [--to VERSION]
+    python -m DB.migrations down --to VERSION
+"""
+import re
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from DB.connector import get_engine
+
+DAY = "(created_at::date)"
+
+# (version, name, up statements, down statements); append only, never renumber
+MIGRATIONS: List[Dict[str, Any]] = [
+    {
+        "version": 1,
+        "name":    "day index covering the daily history series",
+        # every page's history / yesterday lookups group by the day and read
+        # only these columns, so they can be answered from the index
+        "up": [f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lt_day ON live_transactions ({DAY}) "
+               "INCLUDE (created_at, usd_value, payment_successful, gateway_fee, pricing_ic)"],
+        "down": ["DROP INDEX CONCURRENTLY IF EXISTS ix_lt_day"],
+    },
+    {
+        "version": 2,
+        "name":    "merchant + day (customer insights, demographics)",
+        "up": [f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lt_merchant_day ON live_transactions (merchant_id, {DAY})"],
+        "down": ["DROP INDEX CONCURRENTLY IF EXISTS ix_lt_merchant_day"],
+    },
+    {
+        "version": 3,
+        "name":    "acquirer + day (processing partner, drills by acquirer)",
+        "up": [f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lt_acquirer_day ON live_transactions (acquirer_id, {DAY}) "
+               "INCLUDE (usd_value, payment_successful)"],
+        "down": ["DROP INDEX CONCURRENTLY IF EXISTS ix_lt_acquirer_day"],
+    },
+    {
+        "version": 4,
+        "name":    "partial day indexes for fraud and predicted fraud",
+        # fraud is a small fraction of the rows, so partial indexes stay tiny
+        "up": [
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lt_fraud_day ON live_transactions ({DAY}) "
+            "INCLUDE (usd_value) WHERE fraud",
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lt_pred_fraud_day ON live_transactions ({DAY}) "
+            "INCLUDE (fraud) WHERE pred_fraud",
+        ],
+        "down": [
+            "DROP INDEX CONCURRENTLY IF EXISTS ix_lt_fraud_day",
+            "DROP INDEX CONCURRENTLY IF EXISTS ix_lt_pred_fraud_day",
+        ],
+    },
+    {
+        "version": 5,
+        "name":    "sca type + day (3DS effectiveness)",
+        "up": [f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lt_sca_day ON live_transactions (sca_type, {DAY}) "
+               "INCLUDE (fraud)"],
+        "down": ["DROP INDEX CONCURRENTLY IF EXISTS ix_lt_sca_day"],
+    },
+    {
+        "version": 6,
+        "name":    "daily and hourly rollups for trend series",
+        # filled and kept current by KPI/trends.py (refresh_rollup)
+        "up": [
+            f"""CREATE TABLE IF NOT EXISTS kpi_rollup_{grain} (
+                    bucket        {bucket_type} PRIMARY KEY,
+                    txn_count     bigint      NOT NULL,
+                    usd_sum       numeric     NOT NULL,
+                    success_count bigint      NOT NULL,
+                    fraud_count   bigint      NOT NULL,
+                    fee_sum       numeric     NOT NULL,
+                    refreshed_at  timestamptz NOT NULL DEFAULT now()
+                )"""
+            for grain, bucket_type in (("daily", "date"), ("hourly", "timestamp"))
+        ],
+        "down": ["DROP TABLE IF EXISTS kpi_rollup_daily", "DROP TABLE IF EXISTS kpi_rollup_hourly"],
+    },
+    {
+        "version": 7,
+        "name":    "daily quantile sketches per dimension value",
+        # one log-bucket sketch (KPI/utils/quantile_sketch.py) per day,
+        # dimension value and measure; filled by KPI/quantiles.py
+        "up": ["""CREATE TABLE IF NOT EXISTS kpi_sketch_daily (
+                    bucket       date             NOT NULL,
+                    dimension    text             NOT NULL,
+                    value        text             NOT NULL,
+                    measure      text             NOT NULL,
+                    zeros        bigint           NOT NULL,
+                    bins         integer[]        NOT NULL,
+                    counts       bigint[]         NOT NULL,
+                    min_value    double precision,
+                    max_value    double precision,
+                    refreshed_at timestamptz      NOT NULL DEFAULT now(),
+                    PRIMARY KEY (measure, dimension, bucket, value)
+                )"""],
+        "down": ["DROP TABLE IF EXISTS kpi_sketch_daily"],
+    },
+]
+
+VERSION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version    integer PRIMARY KEY,
+        name       text        NOT NULL,
+        applied_at timestamptz NOT NULL DEFAULT now(),
+        duration_s real
+    )
+"""
+
+
+def _autocommit():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    return get_engine().connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+_CONCURRENT_INDEX = re.compile(r"CREATE\s+INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I)
+
+
+def _index_valid(conn, name: str) -> bool:
+    return bool(conn.execute(text("""
+        SELECT i.indisvalid
+          FROM pg_index i
+          JOIN pg_class c ON c.oid = i.indexrelid
+         WHERE c.oid = to_regclass(:name)
+    """), {"name": name}).scalar())
+
+
+def _run_step(conn, stmt: str) -> None:
+    """
+    Executes one up statement. A failed CREATE INDEX CONCURRENTLY leaves
+    an INVALID index behind that IF NOT EXISTS would then skip, so each
+    index is checked afterwards: an invalid one is dropped and rebuilt
+    once, and the migration fails if it is still invalid.
+    """
+    match = _CONCURRENT_INDEX.search(stmt)
+    if match is None:
+        conn.execute(text(stmt))
+        return
+    name = match.group(1)
+    for _ in range(2):
+        try:
+            conn.execute(text(stmt))
+        except Exception:
+            if _index_valid(conn, name):
+                raise
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            raise
+        if _index_valid(conn, name):
+            return
+        print(f"🔴 Index {name} is INVALID (an earlier concurrent build failed), rebuilding")
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    raise RuntimeError(f"Index {name} is still INVALID after a rebuild")
+
+
+def applied_versions(conn) -> Dict[int, Any]:
+    conn.execute(text(VERSION_TABLE_SQL))
+    rows = conn.execute(text("SELECT version, applied_at FROM schema_migrations")).all()
+    return {r[0]: r[1] for r in rows}
+
+
+def current_version() -> int:
+    with _autocommit() as conn:
+        return max(applied_versions(conn), default=0)
+
+
+def status() -> List[Dict[str, Any]]:
+    with _autocommit() as conn:
+        applied = applied_versions(conn)
+    return [
+        {"version": m["version"], "name": m["name"], "applied_at": applied.get(m["version"])}
+        for m in MIGRATIONS
+    ]
+
+
+def upgrade(target: Optional[int] = None) -> List[int]:
+    """
+    Applies every pending migration up to target (default: latest), in
+    version order. Returns the versions applied.
+    """
+    done = []
+    with _autocommit() as conn:
+        applied = applied_versions(conn)
+        for m in sorted(MIGRATIONS, key=lambda m: m["version"]):
+            if m["version"] in applied or (target is not None and m["version"] > target):
+                continue
+            print(f"🔵 Applying {m['version']}: {m['name']}")
+            started = time.perf_counter()
+            for stmt in m["up"]:
+                _run_step(conn, stmt)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, duration_s) VALUES (:v, :n, :d)"),
+                {"v": m["version"], "n": m["name"], "d": time.perf_counter() - started},
+            )
+            done.append(m["version"])
+    return done
+
+
+def downgrade(target: int) -> List[int]:
+    """
+    Reverts applied migrations above target, newest first.
+    """
+    done = []
+    with _autocommit() as conn:
+        applied = applied_versions(conn)
+        for m in sorted(MIGRATIONS, key=lambda m: m["version"], reverse=True):
+            if m["version"] not in applied or m["version"] <= target:
+                continue
+            print(f"🔵 Reverting {m['version']}: {m['name']}")
+            for stmt in m["down"]:
+                conn.execute(text(stmt))
+            conn.execute(text("DELETE FROM schema_migrations WHERE version = :v"), {"v": m["version"]})
+            done.append(m["version"])
+    return done
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Analytics schema migrations")
+    parser.add_argument("command", choices=["status", "up", "down"])
+    parser.add_argument("--to", type=int, default=None, help="target version")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        for m in status():
+            mark = f"applied {m['applied_at']:%Y-%m-%d %H:%M}" if m["applied_at"] else "pending"
+            print(f"{m['version']:>4}  {mark:<24}  {m['name']}")
+    elif args.command == "up":
+        applied = upgrade(args.to)
+        print(f"🟢 Applied {len(applied)} migration(s); now at version {current_version()}")
+    else:
+        if args.to is None:
+            parser.error("down needs --to VERSION")
+        reverted = downgrade(args.to)
+        print(f"🟢 Reverted {len(reverted)} migration(s); now at version {current_version()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+from DB.connector import get_engine, db_url, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+# ─── Settings ─────────────────────────────────────────────────────────
+# read replicas as "host:port,host:port"; credentials and database name are
+# the primary's. Leave empty to send everything to the primary.
+DB_REPLICA_HOSTS       = os.getenv("DB_REPLICA_HOSTS", "")
+DB_REPLICA_MAX_LAG     = float(os.getenv("DB_REPLICA_MAX_LAG", "30"))      # seconds
+DB_REPLICA_CHECK_EVERY = float(os.getenv("DB_REPLICA_CHECK_EVERY", "5"))   # lag probe interval
+DB_REPLICA_RETRY_AFTER = float(os.getenv("DB_REPLICA_RETRY_AFTER", "30"))  # after a replica failed
+DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2"))
+
+# ─── Routing rules ────────────────────────────────────────────────────
+# long windows read mostly settled history and tolerate a little lag;
+# Today (and any unlisted filter) stays on the primary for freshness.
+# filter_type None is an all-time page such as the KPI dashboard.
+REPLICA_FILTERS = {None, "YTD", "Monthly", "custom", "Custom"}
+
+# 0 while the replica is streaming and has replayed everything it received,
+# else the age of the last replayed transaction (or of the server, if none
+# was replayed since it started): a replica whose WAL receiver stopped has
+# "replayed everything" yet falls behind. A primary (not in recovery)
+# reports 0. Without pg_read_all_stats the receiver's status reads NULL,
+# so a running receiver counts as streaming.
+LAG_SQL = """
+    SELECT CASE
+             WHEN NOT pg_is_in_recovery() THEN 0
+             WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+              AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver
+                           WHERE COALESCE(status, 'streaming') = 'streaming') THEN 0
+             ELSE EXTRACT(EPOCH FROM now() - COALESCE(pg_last_xact_replay_timestamp(),
+                                                      pg_postmaster_start_time()))
+           END::float
+"""
+
+
+def wants_replica(filter_type: Optional[str], history: bool = False) -> bool:
+    """
+    history=True marks long look-back queries (e.g. 180-day baselines)
+    that can go to a replica whatever the page filter is.
+    """
+    return history or filter_type in REPLICA_FILTERS
+
+
+class _Replica:
+    def __init__(self, name: str, engine: Engine):
+        self.name = name
+        self.engine = engine
+        self.lag: Optional[float] = None
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self.failures = 0
+        self.routed = 0
+
+
+class ReplicaSet:
+    """
+    Round-robin over replicas that are up and within DB_REPLICA_MAX_LAG.
+    Lag is probed at most every DB_REPLICA_CHECK_EVERY seconds per replica;
+    a replica that fails a probe or a connect is skipped for
+    DB_REPLICA_RETRY_AFTER seconds.
+    """
+
+    def __init__(self, hosts: List[str]):
+        self._lock = threading.Lock()
+        self._next = 0
+        self.replicas: List[_Replica] = []
+        for host in hosts:
+            hostname, _, port = host.partition(":")
+            engine = create_engine(
+                db_url(hostname, port or "5432"), future=True, pool_pre_ping=True,
+                pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                connect_args={"connect_timeout": DB_REPLICA_CONNECT_TIMEOUT},
+            )
+            self.replicas.append(_Replica(host, engine))
+        self.counters = {"primary": 0, "replica": 0, "fallback_lag": 0, "fallback_down": 0}
+
+    def mark_down(self, replica: _Replica, error: Exception) -> None:
+        print(f"🔴 Replica {replica.name} unavailable, using primary:", error)
+        with self._lock:
+            replica.failures += 1
+            replica.down_until = time.monotonic() + DB_REPLICA_RETRY_AFTER
+
+    def _usable(self, replica: _Replica) -> Optional[str]:
+        """
+        None if the replica can serve reads, else the reason it can't.
+        """
+        now = time.monotonic()
+        if replica.down_until > now:
+            return "down"
+        if now - replica.checked_at >= DB_REPLICA_CHECK_EVERY:
+            replica.checked_at = now
+            try:
+                with replica.engine.connect() as conn:
+                    replica.lag = conn.execute(text(LAG_SQL)).scalar() or 0.0
+            except DBAPIError as e:
+                self.mark_down(replica, e)
+                return "down"
+        if replica.lag is not None and replica.lag > DB_REPLICA_MAX_LAG:
+            return "lag"
+        return None
+
+    def pick(self) -> Optional[_Replica]:
+        reasons = set()
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = self.replicas[self._next % len(self.replicas)]
+                self._next += 1
+            reason = self._usable(replica)
+            if reason is None:
+                return replica
+            reasons.add(reason)
+        with self._lock:
+            self.counters["fallback_down" if reasons == {"down"} else "fallback_lag"] += 1
+        return None
+
+    def count(self, name: str, replica: Optional[_Replica] = None) -> None:
+        with self._lock:
+            self.counters[name] += 1
+            if replica is not None:
+                replica.routed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "routed":  dict(self.counters),
+                "max_lag": DB_REPLICA_MAX_LAG,
+                "replicas": [
+                    {
+                        "name":     r.name,
+                        "lag":      r.lag,
+                        "up":       r.down_until <= now,
+                        "failures": r.failures,
+                        "routed":   r.routed,
+                        "pool":     {"checked_out": r.engine.pool.checkedout(), "size": r.engine.pool.size()},
+                    }
+                    for r in self.replicas
+                ],
+            }
+
+
+@lru_cache(maxsize=None)
+def get_replica_set() -> ReplicaSet:
+    hosts = [h.strip() for h in DB_REPLICA_HOSTS.split(",") if h.strip()]
+    return ReplicaSet(hosts)
+
+
+@contextmanager
+def read_connection(filter_type: Optional[str] = None, history: bool = False) -> Iterator[Connection]:
+    """
+    Connection for read-only KPI queries, routed by the page filter:
+    long windows to a healthy, caught-up replica, everything else (and any
+    replica failure at connect time) to the primary.
+    """
+    replicas = get_replica_set()
+    replica = replicas.pick() if replicas.replicas and wants_replica(filter_type, history) else None
+    conn = None
+    if replica is not None:
+        try:
+            conn = replica.engine.connect()
+            replicas.count("replica", replica)
+        except DBAPIError as e:
+            replicas.mark_down(replica, e)
+            replicas.count("fallback_down")
+    if conn is None:
+        conn = get_engine().connect()
+        replicas.count("primary")
+    with conn:
+        yield conn
+
+
+def replica_stats() -> Dict[str, Any]:
+    return get_replica_set().stats()
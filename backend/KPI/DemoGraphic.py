@@ -1,149 +1,181 @@
 from datetime import date
-from sqlalchemy import text
 from DB.connector import get_engine
-from KPI.utils.time_utils import get_date_ranges, fetch_one
-from typing import Optional, Tuple
+from KPI.registry import kpi_unit, build_page
+from KPI.query_planner import run_grouped, planned_charts
+from KPI.utils.top_n import top_n_rows, paging
+from typing import Optional, Tuple, Iterable
 
 engine = get_engine()
 MERCHANT_ID = 26  # Hardcoded merchant ID
+PAGE = "demographic"
+SCAN = f"{PAGE}.scan"
+
+
+# ─── Grouped scan ────────────────────────────────────────────────
+@kpi_unit(PAGE, "scan", "data")
+def _scan(ctx) -> dict:
+    # one GROUPING SETS pass: by country, by issuer country, by (country, state)
+    return run_grouped(ctx.conn, "merchant_window", planned_charts(PAGE, "merchant_window", ctx),
+                       {"m_id": MERCHANT_ID, "s": ctx.start, "e": ctx.end})
+
+
+# ─── Metric: Unique countries where merchant operates ─────────────
+@kpi_unit(PAGE, "countries_operational", "metric", "Countries Operational", depends=[SCAN])
+def _countries_operational(ctx) -> dict:
+    rows = ctx.get(SCAN)[f"{PAGE}.by_country"]
+    country_count = sum(1 for r in rows if r["country_code"] is not None)
+    return {
+        "title": "Countries Operational",
+        "value": int(country_count)
+    }
+
+
+# ─── Metric: Unique US/UK states/provinces ───────────────────────
+@kpi_unit(PAGE, "states_operational", "metric", "States Operational", depends=[SCAN])
+def _states_operational(ctx) -> dict:
+    rows = ctx.get(SCAN)[f"{PAGE}.by_state"]
+    state_count = len({r["state_or_province"] for r in rows})
+    return {
+        "title": "States Operational",
+        "value": int(state_count)
+    }
+
+
+# ─── Chart 1: Sales by Region (US/UK only) ───────────────────────
+@kpi_unit(PAGE, "sales_by_region", "chart", "Sales by Region", depends=[SCAN])
+def _sales_by_region(ctx) -> dict:
+    region_rows = sorted(
+        (r for r in ctx.get(SCAN)[f"{PAGE}.by_country"] if r["country_code"] in ("US", "GB")),
+        key=lambda r: r["usd_sum"], reverse=True,
+    )
+
+    return {
+        "title": "Sales by Region",
+        "type":  "bar",
+        "x":     [r["country_code"] for r in region_rows],
+        "y":     [round(r["usd_sum"], 2) for r in region_rows]
+    }
+
+
+# ─── Chart 2: Success Rate by Country ────────────────────────────
+@kpi_unit(PAGE, "success_rate_by_country", "chart", "Success Rate by Country", depends=[SCAN])
+def _success_rate_by_country(ctx) -> dict:
+    perf_rows = sorted(
+        (
+            {"country_code": r["country_code"],
+             "success_rate": r["success_count"] / r["txn_count"] * 100}
+            for r in ctx.get(SCAN)[f"{PAGE}.by_country"] if r["txn_count"]
+        ),
+        key=lambda r: r["success_rate"], reverse=True,
+    )
+
+    return {
+        "title": "Success Rate by Country",
+        "type":  "bar",
+        "x":     [r["country_code"] for r in perf_rows],
+        "y":     [round(r["success_rate"], 2) for r in perf_rows]
+    }
+
+
+# ─── Chart 3: Transactions by Card Issuing Country (Pie) ────────
+@kpi_unit(PAGE, "issuer_country", "chart", "Transactions by Card Issuing Country", depends=[SCAN])
+def _issuer_country(ctx) -> dict:
+    all_rows = ctx.get(SCAN)[f"{PAGE}.issuer_country"]
+    pie_rows = top_n_rows(all_rows, "name", {"txn_count": "SUM"}, ctx.limit, ctx.offset)
+
+    total_txns = sum(r["txn_count"] for r in all_rows) or 1
+    chart = {
+        "title": "Transactions by Card Issuing Country",
+        "type":  "pie",
+        "data": [
+            {
+                "name":  r["name"],
+                "value": round(r["txn_count"] / total_txns * 100, 1)
+            }
+            for r in pie_rows
+        ]
+    }
+    if ctx.limit is not None:
+        chart["paging"] = paging(pie_rows, ctx.limit, ctx.offset, groups=len(all_rows))
+    return chart
+
+
+# ─── Chart 4: Transactions by State or Province (USA & UK) ──────
+@kpi_unit(PAGE, "states_by_region", "chart", "Transactions by State or Province", depends=[SCAN])
+def _states_by_region(ctx) -> list:
+    state_rows = ctx.get(SCAN)[f"{PAGE}.by_state"]
+    charts = []
+    for country_code, region_label in [('US', 'USA'), ('GB', 'UK')]:
+        region_rows = [r for r in state_rows if r["country_code"] == country_code]
+        # already ranked by txn_count within the country in SQL
+        map_rows = top_n_rows(region_rows, "state_or_province", {"txn_count": "SUM"}, ctx.limit, ctx.offset)
+
+        if map_rows:
+            chart = {
+                "title": "Transactions by State or Province",
+                "type":  "horizontal_bar",
+                "region": region_label,  # Used by frontend to select geo map
+                "y":     [r["state_or_province"] for r in map_rows],
+                "series": [{
+                    "name": "Transactions",
+                    "data": [r["txn_count"] for r in map_rows]
+                }]
+            }
+            if ctx.limit is not None:
+                chart["paging"] = paging(map_rows, ctx.limit, ctx.offset, groups=len(region_rows))
+            charts.append(chart)
+    return charts
+
+
+# ─── Insight summary ─────────────────────────────────────────────
+@kpi_unit(PAGE, "insight_summary", "data", depends=[
+    f"{PAGE}.countries_operational",
+    f"{PAGE}.states_operational",
+    f"{PAGE}.sales_by_region",
+    f"{PAGE}.success_rate_by_country",
+    f"{PAGE}.issuer_country",
+    f"{PAGE}.states_by_region",
+])
+def _insight_summary(ctx) -> dict:
+    """
+    The handful of headline numbers the demographic insight prompt needs.
+    """
+    sales = ctx.get(f"{PAGE}.sales_by_region")
+    sales = dict(zip(sales["x"], sales["y"]))
+    success = ctx.get(f"{PAGE}.success_rate_by_country")
+    success = dict(zip(success["x"], success["y"]))
+    issuer = max(ctx.get(f"{PAGE}.issuer_country")["data"], key=lambda d: d["value"], default=None)
+    top_state = {
+        c["region"]: (c["y"][0], c["series"][0]["data"][0])
+        for c in ctx.get(f"{PAGE}.states_by_region")
+    }
+    return {
+        "country_count":      ctx.get(f"{PAGE}.countries_operational")["value"],
+        "state_count":        ctx.get(f"{PAGE}.states_operational")["value"],
+        "us_sales":           sales.get("US", "N/A"),
+        "gb_sales":           sales.get("GB", "N/A"),
+        "us_success_rate":    success.get("US", "N/A"),
+        "gb_success_rate":    success.get("GB", "N/A"),
+        "top_issuer_country": issuer["name"] if issuer else "N/A",
+        "top_issuer_percent": issuer["value"] if issuer else "N/A",
+        "top_us_state":       top_state.get("USA", ("N/A", "N/A"))[0],
+        "us_txn_count":       top_state.get("USA", ("N/A", "N/A"))[1],
+        "top_uk_state":       top_state.get("UK", ("N/A", "N/A"))[0],
+        "gb_txn_count":       top_state.get("UK", ("N/A", "N/A"))[1],
+    }
+
 
 def get_demo_kpi_data(
     filter_type: str = "YTD",
-    custom: Optional[Tuple[date, date]] = None
+    custom: Optional[Tuple[date, date]] = None,
+    include: Optional[Iterable[str]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
 ) -> dict:
     """
     Returns demographic KPI metrics and chart data based on the selected date range filter.
-    Uses live_transactions table for all lookups.
+    Uses live_transactions table for all lookups. `include` limits the payload
+    to the named units; `limit` / `offset` page the issuing-country and
+    state charts (top N plus an "Other" bucket).
     """
-    # Determine the current and comparison windows
-    start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
-    metrics, charts = [], []
-
-    with engine.connect() as conn:
-        # ─── Metric: Unique countries where merchant operates ─────────────
-        country_count = fetch_one(
-            conn,
-            """
-            SELECT COUNT(DISTINCT t.country_code)
-              FROM live_transactions t
-             WHERE t.merchant_id = :m_id
-               AND t.created_at::date BETWEEN :s AND :e
-            """,
-            {"m_id": MERCHANT_ID, "s": start, "e": end}
-        )
-        metrics.append({
-            "title": "Countries Operational",
-            "value": int(country_count)
-        })
-
-        # ─── Metric: Unique US/UK states/provinces ───────────────────────
-        state_count = fetch_one(
-            conn,
-            """
-            SELECT COUNT(DISTINCT t.state_or_province)
-              FROM live_transactions t
-             WHERE t.merchant_id = :m_id
-               AND t.created_at::date BETWEEN :s AND :e
-               AND t.state_or_province IS NOT NULL
-            """,
-            {"m_id": MERCHANT_ID, "s": start, "e": end}
-        )
-        metrics.append({
-            "title": "States Operational",
-            "value": int(state_count)
-        })
-
-        # ─── Chart 1: Sales by Region (US/UK only) ───────────────────────
-        region_rows = conn.execute(text("""
-            SELECT t.country_code, SUM(t.usd_value) AS total_sales
-              FROM live_transactions t
-             WHERE t.merchant_id = :m_id
-               AND t.created_at::date BETWEEN :s AND :e
-               AND t.country_code IN ('US','GB')
-             GROUP BY t.country_code
-             ORDER BY total_sales DESC
-        """), {"m_id": MERCHANT_ID, "s": start, "e": end}).mappings().all()
-
-        charts.append({
-            "title": "Sales by Region",
-            "type":  "bar",
-            "x":     [r["country_code"] for r in region_rows],
-            "y":     [round(r["total_sales"], 2) for r in region_rows]
-        })
-
-        # ─── Chart 2: Success Rate by Country ────────────────────────────
-        perf_rows = conn.execute(text("""
-            SELECT
-              t.country_code,
-              COUNT(*) FILTER (WHERE t.payment_successful = true)::float
-                / NULLIF(COUNT(*),0) * 100 AS success_rate
-            FROM live_transactions t
-           WHERE t.merchant_id = :m_id
-             AND t.created_at::date BETWEEN :s AND :e
-           GROUP BY t.country_code
-           ORDER BY success_rate DESC
-        """), {"m_id": MERCHANT_ID, "s": start, "e": end}).mappings().all()
-
-        charts.append({
-            "title": "Success Rate by Country",
-            "type":  "bar",
-            "x":     [r["country_code"] for r in perf_rows],
-            "y":     [round(r["success_rate"], 2) for r in perf_rows]
-        })
-
-        # ─── Chart 3: Transactions by Card Issuing Country (Pie) ────────
-        pie_rows = conn.execute(text("""
-            SELECT
-              t.issuer_country_code AS name,
-              COUNT(*)                   AS txn_count
-            FROM live_transactions t
-           WHERE t.merchant_id = :m_id
-             AND t.created_at::date BETWEEN :s AND :e
-             AND t.issuer_country_code IS NOT NULL
-           GROUP BY t.issuer_country_code
-        """), {"m_id": MERCHANT_ID, "s": start, "e": end}).mappings().all()
-
-        total_txns = sum(r["txn_count"] for r in pie_rows) or 1
-        charts.append({
-            "title": "Transactions by Card Issuing Country",
-            "type":  "pie",
-            "data": [
-                {
-                    "name":  r["name"],
-                    "value": round(r["txn_count"] / total_txns * 100, 1)
-                }
-                for r in pie_rows
-            ]
-        })
-
-        # ─── Chart 4: Transactions by State or Province (USA & UK) ──────
-        for country_code, region_label in [('US', 'USA'), ('GB', 'UK')]:
-            map_rows = conn.execute(text("""
-                SELECT
-                  t.state_or_province,
-                  COUNT(*) AS txn_count
-                FROM live_transactions t
-               WHERE t.merchant_id = :m_id
-                 AND t.created_at::date BETWEEN :s AND :e
-                 AND t.country_code = :c
-                 AND t.state_or_province IS NOT NULL
-               GROUP BY t.state_or_province
-               ORDER BY txn_count DESC
-            """), {"m_id": MERCHANT_ID, "s": start, "e": end, "c": country_code}).mappings().all()
-
-            if map_rows:
-                charts.append({
-                    "title": "Transactions by State or Province",
-                    "type":  "horizontal_bar",
-                    "region": region_label,  # Used by frontend to select geo map
-                    "y":     [r["state_or_province"] for r in map_rows],
-                    "series": [{
-                        "name": "Transactions",
-                        "data": [r["txn_count"] for r in map_rows]
-                    }]
-                })
-
-    return {
-        "metrics": metrics,
-        "charts":  charts
-    }
+    return build_page(PAGE, filter_type, custom, include, limit, offset)
@@ -0,0 +1,193 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import date
+from typing import Optional, Tuple, List, Dict, Any, Callable
+
+from DB.cancellation import RequestAborted
+from KPI.utils.time_utils import get_date_ranges, date_window_scope
+from KPI.utils.query_memo import query_memo_scope
+from KPI.dashboard import (
+    fetch_top5_acquirers,
+    fetch_payment_method_distribution,
+    fetch_processing_partner,
+)
+from KPI.financial_analysis import get_financial_performance_data
+from KPI.customer_insight import get_customer_insights_data
+from KPI.DemoGraphic import get_demo_kpi_data
+from KPI.operational_efficiency import get_operational_efficiency_data
+from KPI.risk_and_fraud_management import get_risk_and_fraud_data
+from KPI.report import get_gateway_fee_analysis
+from KPI.drill_service import fetch_drill_data, fetch_drill_path
+
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "50"))
+
+
+# ─── Handlers ─────────────────────────────────────────────────────────
+# every handler takes (filter_type, custom, params) and returns the same
+# payload as the equivalent single-request endpoint; page handlers accept
+# an "include" list in params, and the dashboard, demographic and drill
+# handlers "limit" / "offset" for their top-N charts
+def _dashboard(filter_type: str, custom, params: Dict[str, Any]):
+    return [
+        fetch_top5_acquirers(filter_type, custom),
+        fetch_payment_method_distribution(filter_type, custom),
+        fetch_processing_partner(filter_type, custom, params.get("limit"), params.get("offset", 0)),
+    ]
+
+
+def _drill(filter_type: str, custom, params: Dict[str, Any]):
+    if not params.get("level"):
+        # drill along a path: [["issuer_country_code", "US"], ...]
+        return fetch_drill_path(
+            params["chartKey"],
+            params["dimension"],
+            params["baseValue"],
+            [tuple(step) for step in params.get("path", [])],
+            filter_type=filter_type,
+            custom=custom,
+            limit=params.get("limit"),
+            offset=params.get("offset", 0),
+            session=params.get("session"),
+        )
+    return fetch_drill_data(
+        params["chartKey"],
+        params["level"],
+        params["dimension"],
+        params.get("dimension1"),
+        params["baseValue"],
+        params.get("parentValue"),
+        filter_type=filter_type,
+        custom=custom,
+        limit=params.get("limit"),
+        offset=params.get("offset", 0),
+    )
+
+
+BATCH_HANDLERS: Dict[str, Callable[[str, Any, Dict[str, Any]], Any]] = {
+    "dashboard":              _dashboard,
+    "financial-performance":  lambda f, c, p: get_financial_performance_data(f, c, p.get("include")),
+    "customer-insights":      lambda f, c, p: get_customer_insights_data(f, c, p.get("include")),
+    "demographic":            lambda f, c, p: get_demo_kpi_data(f, c, p.get("include"), p.get("limit"), p.get("offset", 0)),
+    "operational-efficiency": lambda f, c, p: get_operational_efficiency_data(f, c, p.get("include")),
+    "risk-and-fraud":         lambda f, c, p: get_risk_and_fraud_data(f, c, p.get("include")),
+    "gateway-fee":            lambda f, c, p: get_gateway_fee_analysis(f, c, p.get("include")),
+    "drill":                  _drill,
+}
+
+
+def _normalise_filter(filter_type: str) -> str:
+    # the single-request endpoints accept both spellings of the custom filter
+    return "custom" if filter_type.lower() == "custom" else filter_type
+
+
+def plan_batch(requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Validates the sub-requests and collapses identical ones into a single
+    task. Returns the task list plus, per task, the ids it answers, and
+    every distinct window resolved once.
+    """
+    if len(requests) > BATCH_MAX_REQUESTS:
+        raise ValueError(f"At most {BATCH_MAX_REQUESTS} sub-requests per batch")
+
+    tasks: Dict[tuple, Dict[str, Any]] = {}
+    windows: Dict[tuple, tuple] = {}
+    errors: Dict[str, str] = {}
+
+    ids = [req["id"] for req in requests]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Sub-request ids must be unique")
+
+    for req in requests:
+        req_id = req["id"]
+        kind = req["kind"]
+        if kind not in BATCH_HANDLERS:
+            errors[req_id] = f"Unknown kind '{kind}'"
+            continue
+
+        filter_type = _normalise_filter(req.get("filter_type") or "YTD")
+        custom: Optional[Tuple[date, date]] = (
+            (req["start"], req["end"]) if req.get("start") and req.get("end") else None
+        )
+
+        # resolve each distinct window once; bad filters fail here, not mid-batch
+        window_key = (filter_type, custom)
+        if window_key not in windows:
+            try:
+                windows[window_key] = get_date_ranges(filter_type, custom)
+            except ValueError as e:
+                windows[window_key] = e
+        if isinstance(windows[window_key], ValueError):
+            errors[req_id] = str(windows[window_key])
+            continue
+
+        params = req.get("params") or {}
+        key = (kind, filter_type, custom, json.dumps(params, sort_keys=True, default=str))
+        task = tasks.setdefault(key, {
+            "kind":        kind,
+            "filter_type": filter_type,
+            "custom":      custom,
+            "params":      params,
+            "ids":         [],
+        })
+        task["ids"].append(req_id)
+
+    return {
+        "tasks":   list(tasks.values()),
+        "errors":  errors,
+        "windows": {k: w for k, w in windows.items() if not isinstance(w, ValueError)},
+    }
+
+
+def execute_batch(requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Runs a planned batch concurrently. All tasks share one query memo, so a
+    scalar total or history series needed by several sub-requests is
+    queried once, and the windows resolved by the plan, so every handler
+    sees the same dates (Today's "now" included).
+    """
+    plan = plan_batch(requests)
+    tasks = plan["tasks"]
+    outcome: Dict[str, Dict[str, Any]] = {
+        req_id: {"id": req_id, "status": "error", "error": err}
+        for req_id, err in plan["errors"].items()
+    }
+
+    def run(task: Dict[str, Any]) -> Dict[str, Any]:
+        handler = BATCH_HANDLERS[task["kind"]]
+        try:
+            data = handler(task["filter_type"], task["custom"], task["params"])
+            return {"status": "ok", "data": data}
+        except (ValueError, KeyError) as e:
+            return {"status": "error", "error": str(e)}
+        except RequestAborted:
+            raise
+        except Exception as e:
+            # a failing query only fails its own sub-requests
+            message = str(e).splitlines()[0] if str(e) else type(e).__name__
+            print(f"🔴 Batch {task['kind']} failed:", message)
+            return {"status": "error", "error": message}
+
+    with query_memo_scope() as memo, date_window_scope(plan["windows"]):
+        if tasks:
+            workers = max(1, min(BATCH_MAX_WORKERS, len(tasks)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # each task runs in a copy of this context so it sees the memo
+                futures = [pool.submit(copy_context().run, run, t) for t in tasks]
+                for task, fut in zip(tasks, futures):
+                    res = fut.result()
+                    for req_id in task["ids"]:
+                        outcome[req_id] = {"id": req_id, **res}
+
+    return {
+        "results": [outcome[req["id"]] for req in requests],
+        "plan": {
+            "requested":      len(requests),
+            "executed":       len(tasks),
+            "windows":        len(plan["windows"]),
+            "shared_queries": memo.hits,
+            "queries_run":    memo.misses,
+        },
+    }
@@ -11,6 +11,7 @@ class ChartType(Enum):
 # ── Drill‑level keys ─────────────────────────────────────────
 DRILL_LVL1 = "DRILL_LVL1"
 DRILL_LVL2 = "DRILL_LVL2"
+DRILL_PATH = "DRILL_PATH"   # any depth: a path of (dimension, value) filters
 
 # ── Per‑chart drill‐field options ────────────────────────────
 # these are the only dimensions users can pick for each chart
@@ -81,6 +82,23 @@ chart_drill_options = {
 
 }
 
+# ── Drill dimensions → SQL ───────────────────────────────────
+# expression for every dimension in chart_drill_options, over
+# live_transactions t LEFT JOIN acquirer a
+DRILL_DIMENSIONS = {
+    "issuer_country_code": "t.issuer_country_code",
+    "credit_card_type":    "t.credit_card_type",
+    "funding_source":      "t.funding_source",
+    "creation_type":       "t.creation_type",
+    "sca_type":            "t.sca_type",
+    "acquirer_name":       "a.name",
+    "currency":            "t.transaction_currency",
+    "fraud":               "t.fraud",
+    "payment_successful":  "t.payment_successful",
+    "country":             "t.country",
+    "region":              "t.region",
+}
+
 # ── Drill‑level configs ───────────────────────────────────────
 drill_configs = {
     DRILL_LVL1: {
@@ -97,6 +115,13 @@ drill_configs = {
         "drill_field": None,
         "next_chart":  None,
     },
+    DRILL_PATH: {
+        "title":       "{dimension_label} breakdown for {path_label}{base_value}",
+        "type":        ChartType.BAR,
+        "drillable":   True,       # while dimensions are left to drill into
+        "drill_field": None,
+        "next_chart":  DRILL_PATH,
+    },
 }
 
 CHART_BASE_DIMENSION = {
@@ -114,4 +139,108 @@ CHART_METRICS = {
     "paymentMethodDistribution":   "COUNT(*)::float",
     "salesByCurrency":             "SUM(usd_value)::float",
     "processingFeeAnalysis":       "ROUND(SUM((t.pricing_ic/100.0)*t.usd_value + t.gateway_fee)/ NULLIF(SUM(t.usd_value),0) * 100, 2) "
-}
\ No newline at end of file
+}
+
+# how a drill's "Other" row (top-N paging) rolls up the groups beyond the
+# page; counts and sums add up, the fee percentage is recomputed from the
+# fee and USD totals the groups carry (CHART_OTHER_COLUMNS)
+CHART_OTHER_AGG = {
+    "processingFeeAnalysis":       "ROUND(SUM(fee_sum) * 100 / NULLIF(SUM(usd_sum), 0), 2)",
+}
+
+# extra per-group columns a drill's grouped SQL carries for its Other row
+CHART_OTHER_COLUMNS = {
+    "processingFeeAnalysis": {
+        "fee_sum": "SUM((t.pricing_ic/100.0)*t.usd_value + t.gateway_fee)",
+        "usd_sum": "SUM(t.usd_value)",
+    },
+}
+
+# ── Declarative grouped charts ───────────────────────────────
+# Charts that only differ in their GROUP BY are described here and
+# merged by KPI/query_planner.py into one GROUPING SETS query per scan.
+
+# a scan is the FROM + WHERE shared by several charts
+GROUPED_SCANS = {
+    # one merchant, current window (customer insights, demographics)
+    "merchant_window": {
+        "from":  "live_transactions t",
+        "where": "t.merchant_id = :m_id AND t.created_at::date BETWEEN :s AND :e",
+    },
+    # all merchants, current window (operational efficiency)
+    "window": {
+        "from":  "live_transactions t",
+        "where": "t.created_at::date BETWEEN :s AND :e",
+    },
+}
+
+# aggregates a grouped chart can ask for
+GROUP_MEASURES = {
+    "txn_count":     "COUNT(*)",
+    "usd_sum":       "COALESCE(SUM(t.usd_value), 0)::float",
+    "success_count": "COUNT(*) FILTER (WHERE t.payment_successful = true)",
+    "credit_count":  "COUNT(*) FILTER (WHERE t.funding_source = 'CREDIT')::float",
+    "debit_count":   "COUNT(*) FILTER (WHERE t.funding_source = 'DEBIT')::float",
+    "prepaid_count": "COUNT(*) FILTER (WHERE t.funding_source = 'PREPAID')::float",
+}
+
+# keyed by "<page>.<name>"; by default the KPI unit of the same key
+# consumes the rows, otherwise "units" lists the consumers
+#   group_by   {output column: SQL expression}  ({} = grand total)
+#   measures   names from GROUP_MEASURES
+#   drop_null  output columns whose NULL group is discarded
+#   rank       {"by": measure, "within": [output columns]}: adds a "rank"
+#              column (ROW_NUMBER by the measure, descending) for top-N
+#   names      {output column: "acquirer"}: the column is grouped by id and
+#              mapped to the name in Python (KPI/utils/dimensions.py)
+GROUPED_CHARTS = {
+    # ── customer insights ──
+    "customer.unique_payment_methods": {
+        "scan": "merchant_window", "group_by": {"credit_card_type": "t.credit_card_type"},
+        "measures": [], "drop_null": ["credit_card_type"],
+    },
+    "customer.transactions_by_acquirer": {
+        "scan": "merchant_window", "group_by": {"name": "t.acquirer_id"},
+        "measures": ["txn_count"], "drop_null": ["name"], "names": {"name": "acquirer"},
+    },
+    "customer.transaction_types": {
+        "scan": "merchant_window", "group_by": {"transaction_type": "t.transaction_type"},
+        "measures": ["txn_count"],
+    },
+    "customer.creation_patterns": {
+        "scan": "merchant_window", "group_by": {"creation_type": "t.creation_type"},
+        "measures": ["txn_count"],
+    },
+    # ── demographics ──
+    "demographic.by_country": {
+        "scan": "merchant_window", "group_by": {"country_code": "t.country_code"},
+        "measures": ["txn_count", "usd_sum", "success_count"],
+        "units": ["demographic.countries_operational", "demographic.sales_by_region",
+                  "demographic.success_rate_by_country"],
+    },
+    "demographic.issuer_country": {
+        "scan": "merchant_window", "group_by": {"name": "t.issuer_country_code"},
+        "measures": ["txn_count"], "drop_null": ["name"], "rank": {"by": "txn_count"},
+    },
+    "demographic.by_state": {
+        "scan": "merchant_window",
+        "group_by": {"country_code": "t.country_code", "state_or_province": "t.state_or_province"},
+        "measures": ["txn_count"], "drop_null": ["state_or_province"],
+        "rank": {"by": "txn_count", "within": ["country_code"]},
+        "units": ["demographic.states_operational", "demographic.states_by_region"],
+    },
+    # ── operational efficiency ──
+    "operational.success_rate": {
+        "scan": "window", "group_by": {},
+        "measures": ["txn_count", "success_count"],
+    },
+    "operational.partner_efficiency": {
+        "scan": "window", "group_by": {"acquirer_name": "t.acquirer_id"},
+        "measures": ["txn_count", "success_count"], "drop_null": ["acquirer_name"],
+        "names": {"acquirer_name": "acquirer"},
+    },
+    "operational.payment_methods": {
+        "scan": "window", "group_by": {"credit_card_type": "t.credit_card_type"},
+        "measures": ["credit_count", "debit_count", "prepaid_count"],
+    },
+}
@@ -1,16 +1,119 @@
-from datetime import date
-from typing import Optional, Tuple
-from sqlalchemy import text
+from datetime import date, timedelta
+from typing import Optional, Tuple, Iterable
 from DB.connector import get_engine
-from KPI.utils.time_utils import get_date_ranges, fetch_one, pct_diff
-from KPI.utils.stat_tests import compare_to_historical_single_point
+from KPI.utils.time_utils import fetch_one, pct_diff
+from KPI.utils.baseline import daily_baseline, compare_to_baseline
+from KPI.registry import kpi_unit, build_page
+from KPI.query_planner import run_grouped, planned_charts
 
 engine = get_engine()
 MERCHANT_ID = 26  # Adjust as needed
+PAGE = "customer"
+SCAN = f"{PAGE}.scan"
+
+
+# ─── Grouped scan ────────────────────────────────────────────────
+@kpi_unit(PAGE, 'scan', 'data')
+def _scan(ctx) -> dict:
+    # one GROUPING SETS pass over the merchant's window for every grouped chart
+    return run_grouped(ctx.conn, "merchant_window", planned_charts(PAGE, "merchant_window", ctx), {
+        'm_id': MERCHANT_ID, 's': ctx.start, 'e': ctx.end
+    })
+
+
+def _by_count(rows: list) -> list:
+    return sorted(rows, key=lambda r: r['txn_count'], reverse=True)
+
+
+# ─── Metric: Unique Payment Methods ──────────────────────────────
+@kpi_unit(PAGE, 'unique_payment_methods', 'metric', 'Unique Payment Methods', depends=[SCAN])
+def _unique_payment_methods(ctx) -> dict:
+    sql_methods = """
+        SELECT COUNT(DISTINCT credit_card_type)::float
+          FROM live_transactions
+         WHERE merchant_id = :m_id
+           AND created_at::date BETWEEN :s AND :e
+    """
+    curr_methods = float(len(ctx.get(SCAN)[f'{PAGE}.unique_payment_methods']))
+    prev_methods = fetch_one(ctx.conn, sql_methods, {
+        'm_id': MERCHANT_ID, 's': ctx.comp_start, 'e': ctx.comp_end
+    })
+    return {
+        'title': 'Unique Payment Methods',
+        'value': int(curr_methods),
+        'diff': pct_diff(curr_methods, prev_methods)
+    }
+
+
+# ─── Metric: Statistical Insight for Yesterday ───────────────────
+@kpi_unit(PAGE, 'unique_payment_methods_stat', 'metric', 'Unique Payment Methods (Stat Insight)')
+def _unique_payment_methods_stat(ctx) -> dict:
+    sql_yesterday = """
+        SELECT COUNT(DISTINCT credit_card_type)::float AS count
+          FROM live_transactions
+         WHERE merchant_id = :m_id
+           AND created_at::date = CURRENT_DATE - INTERVAL '1 day'
+    """
+    yesterday_val = fetch_one(ctx.conn, sql_yesterday, {'m_id': MERCHANT_ID})
+
+    # weekday-aware baseline over ~6 months, fitted once a day (KPI/utils/baseline.py)
+    model = daily_baseline(PAGE, "COUNT(DISTINCT credit_card_type)::float",
+                           "merchant_id = :m_id", {'m_id': MERCHANT_ID})
+    comparison_result = compare_to_baseline(model, yesterday_val, date.today() - timedelta(days=1))
+
+    return {
+        'title': 'Unique Payment Methods (Stat Insight)',
+        'value': int(yesterday_val),
+        'diff': None,
+        'insight': comparison_result['insight'],
+        'z_score': comparison_result['z_score'],
+        'p_value': comparison_result['p_value'],
+        'is_significant': comparison_result['is_significant']
+    }
+
+
+# ─── Chart 1: Transactions by Acquirer ───────────────────────────
+@kpi_unit(PAGE, 'transactions_by_acquirer', 'chart', 'Transactions by Acquirer', depends=[SCAN])
+def _transactions_by_acquirer(ctx) -> dict:
+    acquirer_rows = _by_count(ctx.get(SCAN)[f'{PAGE}.transactions_by_acquirer'])
+
+    return {
+        'title': 'Transactions by Acquirer',
+        'type':  'pie',
+        'data':  [{'name': row['name'], 'value': row['txn_count']} for row in acquirer_rows]
+    }
+
+
+# ─── Chart 2: Transaction Type Distribution ─────────────────────
+@kpi_unit(PAGE, 'transaction_types', 'chart', 'Transaction Type Distribution', depends=[SCAN])
+def _transaction_types(ctx) -> dict:
+    txn_type_rows = _by_count(ctx.get(SCAN)[f'{PAGE}.transaction_types'])
+
+    return {
+        'title': 'Transaction Type Distribution',
+        'type':  'bar',
+        'x':     [row['transaction_type'] for row in txn_type_rows],
+        'y':     [row['txn_count'] for row in txn_type_rows]
+    }
+
+
+# ─── Chart 3: Payment Creation Patterns ─────────────────────────
+@kpi_unit(PAGE, 'creation_patterns', 'chart', 'Payment Creation Patterns', depends=[SCAN])
+def _creation_patterns(ctx) -> dict:
+    creation_rows = _by_count(ctx.get(SCAN)[f'{PAGE}.creation_patterns'])
+
+    return {
+        'title': 'Payment Creation Patterns',
+        'type':  'bar',
+        'x':     [row['creation_type'] for row in creation_rows],
+        'y':     [row['txn_count'] for row in creation_rows]
+    }
+
 
 def get_customer_insights_data(
     filter_type: str = 'YTD',
-    custom: Optional[Tuple[date, date]] = None
+    custom: Optional[Tuple[date, date]] = None,
+    include: Optional[Iterable[str]] = None,
 ) -> dict:
     """
     Returns customer-insights metrics and charts based on the selected date range filter.
@@ -23,117 +126,7 @@ def get_customer_insights_data(
       - Transactions by Acquirer (pie)
       - Transaction Type Distribution (bar)
       - Payment Creation Patterns (bar)
-    """
-    # Determine current vs comparison windows
-    start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
-
-    metrics = []
-    charts  = []
-
-    with engine.connect() as conn:
-        # ─── Metric: Unique Payment Methods ──────────────────────────────
-        sql_methods = """
-            SELECT COUNT(DISTINCT credit_card_type)::float
-              FROM live_transactions
-             WHERE merchant_id = :m_id
-               AND created_at::date BETWEEN :s AND :e
-        """
-        curr_methods = fetch_one(conn, sql_methods, {
-            'm_id': MERCHANT_ID, 's': start, 'e': end
-        })
-        prev_methods = fetch_one(conn, sql_methods, {
-            'm_id': MERCHANT_ID, 's': comp_start, 'e': comp_end
-        })
-        metrics.append({
-            'title': 'Unique Payment Methods',
-            'value': int(curr_methods),
-            'diff': pct_diff(curr_methods, prev_methods)
-        })
-
-        # ─── Metric: Statistical Insight for Yesterday ───────────────────
-        sql_hist_methods = """
-            SELECT created_at::date AS day, COUNT(DISTINCT credit_card_type)::float AS count
-              FROM live_transactions
-             WHERE merchant_id = :m_id
-               AND created_at::date BETWEEN CURRENT_DATE - INTERVAL '180 days' AND CURRENT_DATE - INTERVAL '1 day'
-             GROUP BY created_at::date
-             ORDER BY day
-        """
-        hist_rows = conn.execute(text(sql_hist_methods), {'m_id': MERCHANT_ID}).mappings().all()
-        hist_values = [row['count'] for row in hist_rows]
-
-        sql_yesterday = """
-            SELECT COUNT(DISTINCT credit_card_type)::float AS count
-              FROM live_transactions
-             WHERE merchant_id = :m_id
-               AND created_at::date = CURRENT_DATE - INTERVAL '1 day'
-        """
-        yesterday_val = fetch_one(conn, sql_yesterday, {'m_id': MERCHANT_ID})
-
-        comparison_result = compare_to_historical_single_point(yesterday_val, hist_values)
-
-        metrics.append({
-            'title': 'Unique Payment Methods (Stat Insight)',
-            'value': int(yesterday_val),
-            'diff': None,
-            'insight': comparison_result['insight'],
-            'z_score': comparison_result['z_score'],
-            'p_value': comparison_result['p_value'],
-            'is_significant': comparison_result['is_significant']
-        })
-
-        # ─── Chart 1: Transactions by Acquirer ───────────────────────────
-        acquirer_rows = conn.execute(text("""
-            SELECT a.name AS name, COUNT(*) AS value
-              FROM live_transactions lt
-              JOIN acquirer a ON lt.acquirer_id = a.id
-             WHERE lt.merchant_id = :m_id
-               AND lt.created_at::date BETWEEN :s AND :e
-             GROUP BY a.name
-             ORDER BY value DESC
-        """), {'m_id': MERCHANT_ID, 's': start, 'e': end}).mappings().all()
-
-        charts.append({
-            'title': 'Transactions by Acquirer',
-            'type':  'pie',
-            'data':  [{'name': row['name'], 'value': row['value']} for row in acquirer_rows]
-        })
-
-        # ─── Chart 2: Transaction Type Distribution ─────────────────────
-        txn_type_rows = conn.execute(text("""
-            SELECT transaction_type, COUNT(*) AS txn_count
-              FROM live_transactions
-             WHERE merchant_id = :m_id
-               AND created_at::date BETWEEN :s AND :e
-             GROUP BY transaction_type
-             ORDER BY txn_count DESC
-        """), {'m_id': MERCHANT_ID, 's': start, 'e': end}).mappings().all()
-
-        charts.append({
-            'title': 'Transaction Type Distribution',
-            'type':  'bar',
-            'x':     [row['transaction_type'] for row in txn_type_rows],
-            'y':     [row['txn_count'] for row in txn_type_rows]
-        })
-
-        # ─── Chart 3: Payment Creation Patterns ─────────────────────────
-        creation_rows = conn.execute(text("""
-            SELECT creation_type, COUNT(*) AS txn_count
-              FROM live_transactions
-             WHERE merchant_id = :m_id
-               AND created_at::date BETWEEN :s AND :e
-             GROUP BY creation_type
-             ORDER BY txn_count DESC
-        """), {'m_id': MERCHANT_ID, 's': start, 'e': end}).mappings().all()
-
-        charts.append({
-            'title': 'Payment Creation Patterns',
-            'type':  'bar',
-            'x':     [row['creation_type'] for row in creation_rows],
-            'y':     [row['txn_count'] for row in creation_rows]
-        })
 
-    return {
-        'metrics': metrics,
-        'charts':  charts
-    }
+    `include` limits the payload to the named units.
+    """
+    return build_page(PAGE, filter_type, custom, include)
@@ -1,9 +1,14 @@
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from typing import Optional, Tuple, List, Dict, Any
 from sqlalchemy import text
 from DB.connector import get_engine
-from KPI.utils.time_utils import get_date_ranges
-from KPI.utils.stat_tests import compare_to_historical_single_point
+from DB.replicas import read_connection
+from KPI.utils.time_utils import get_date_ranges, fetch_one
+from KPI.utils.baseline import daily_baseline, compare_to_baseline
+from KPI.utils.single_flight import coalesced
+from KPI.utils.shared_cache import cached, CACHE_KPI_TTL
+from KPI.utils.top_n import top_n_rows, paging
+from KPI.utils.dimensions import dimensions
 from KPI.chart_configs import DRILL_LVL1
 
 engine = get_engine()
@@ -12,18 +17,15 @@ def fetch_processing_partners() -> Dict[str, Any]:
     """
     Fetch the count of processing partners.
     """
-    with engine.connect() as conn:
-        partners = conn.execute(
-            text("SELECT COUNT(*)::float AS val FROM acquirer"),
-            {}
-        ).scalar() or 0.0
     return {
         'title': 'Processing Partners',
-        'value': int(partners),
+        'value': len(dimensions.current().acquirers),
         'diff': None,
     }
 
 
+@cached("kpi", CACHE_KPI_TTL)
+@coalesced("kpi")
 def fetch_top5_acquirers(
     filter_type: str = 'YTD',
     custom: Optional[Tuple[date, date]] = None
@@ -33,19 +35,20 @@ def fetch_top5_acquirers(
     """
     start, end, _, _ = get_date_ranges(filter_type, custom)
 
-    with engine.connect() as conn:
+    with read_connection(filter_type) as conn:
         rows = conn.execute(
             text("""
-                SELECT a.name AS name,
+                SELECT t.acquirer_id,
                        COUNT(*)::float AS cnt
                   FROM live_transactions t
-                  JOIN acquirer a ON t.acquirer_id = a.id
                  WHERE t.created_at::date BETWEEN :s AND :e
-              GROUP BY a.name
+                   AND t.acquirer_id IS NOT NULL
+              GROUP BY t.acquirer_id
               ORDER BY cnt DESC
                  LIMIT 5
             """), {'s': start, 'e': end}
         ).mappings().all()
+    rows = dimensions.name_acquirers(rows)
 
     data = [{'name': r['name'], 'value': r['cnt']} for r in rows]
 
@@ -60,10 +63,12 @@ def fetch_top5_acquirers(
         'end':                end,
         'baseFilteredField':  'a.name',
         'baseFilteredValue':  None,
-        'extra_metrics':      _stat_metrics(start, end, "COUNT(*)"),
+        'extra_metrics':      _stat_metrics(start, end, "COUNT(*)", filter_type),
     }
 
 
+@cached("kpi", CACHE_KPI_TTL)
+@coalesced("kpi")
 def fetch_payment_method_distribution(
     filter_type: str = 'YTD',
     custom: Optional[Tuple[date, date]] = None
@@ -73,7 +78,7 @@ def fetch_payment_method_distribution(
     """
     start, end, _, _ = get_date_ranges(filter_type, custom)
 
-    with engine.connect() as conn:
+    with read_connection(filter_type) as conn:
         rows = conn.execute(
             text("""
                 SELECT credit_card_type AS name,
@@ -97,29 +102,56 @@ def fetch_payment_method_distribution(
         'end':                end,
         'baseFilteredField':  'credit_card_type',
         'baseFilteredValue':  None,
-        'extra_metrics':      _stat_metrics(start, end, "COUNT(*)"),
+        'extra_metrics':      _stat_metrics(start, end, "COUNT(*)", filter_type),
     }
 
+@cached("kpi", CACHE_KPI_TTL)
+@coalesced("kpi")
 def fetch_processing_partner(
     filter_type: str = 'YTD',
-    custom: Optional[Tuple[date, date]] = None
+    custom: Optional[Tuple[date, date]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
 ) -> Dict[str, Any]:
     """
     Fetch Success Rate and USD Value grouped by Acquirer for 3D-style chart.
+    With a limit, only the acquirers ranked offset+1 .. offset+limit by USD
+    value are returned, plus an "Other" bubble for the rest.
     """
     start, end, _, _ = get_date_ranges(filter_type, custom)
 
-    with engine.connect() as conn:
+    with read_connection(filter_type) as conn:
         rows = conn.execute(text("""
-            SELECT a.name AS name,
+            SELECT t.acquirer_id,
                    AVG(t.payment_successful::int)::float AS success_rate,
-                   SUM(t.usd_value)::float AS usd_value
+                   SUM(t.usd_value)::float AS usd_value,
+                   COUNT(*) AS txn_count,
+                   COUNT(*) FILTER (WHERE t.payment_successful) AS success_count
               FROM live_transactions t
-              JOIN acquirer a ON t.acquirer_id = a.id
              WHERE t.created_at::date BETWEEN :s AND :e
-          GROUP BY a.name
-          ORDER BY usd_value DESC
+               AND t.acquirer_id IS NOT NULL
+          GROUP BY t.acquirer_id
+          ORDER BY usd_value DESC NULLS LAST, t.acquirer_id
         """), {"s": start, "e": end}).mappings().all()
+    # one row per acquirer, so the top-N cut runs here, after unknown ids
+    # are dropped (as the former JOIN did): neither the Other bubble nor
+    # the group count includes them
+    rows = [{**r, 'rank': i} for i, r in enumerate(dimensions.name_acquirers(rows), 1)]
+    groups = len(rows)
+    if limit is not None:
+        rows = top_n_rows(
+            rows, label="name", limit=limit, offset=offset,
+            measures={
+                "success_rate":  "SUM(success_count)::float / NULLIF(SUM(txn_count), 0)",
+                "usd_value":     "SUM",
+                "txn_count":     "SUM",
+                "success_count": "SUM",
+            },
+        )
+        for r in rows:
+            if r['rank'] is None:
+                # the Other bubble's rate is weighted by its transactions
+                r['success_rate'] = r['success_count'] / r['txn_count'] if r['txn_count'] else None
 
     data = [
         {
@@ -140,42 +172,31 @@ def fetch_processing_partner(
         'end':                end,
         'baseFilteredField':  'a.name',
         'baseFilteredValue':  None,
-        'extra_metrics':      _stat_metrics(start, end, "AVG(payment_successful::int)::float"),
+        'extra_metrics':      _stat_metrics(start, end, "AVG(payment_successful::int)::float", filter_type),
+        **({'paging': paging(rows, limit, offset, groups)} if limit is not None else {}),
     }
 
-def _stat_metrics(start: date, end: date, agg_sql: str) -> Dict[str, Any]:
+def _stat_metrics(start: date, end: date, agg_sql: str, filter_type: Optional[str] = None) -> Dict[str, Any]:
     """
-    Helper to compute yesterday + historical stats for a given aggregate SQL.
+    Helper to compare the day before `end` with its weekday baseline for a
+    given aggregate SQL (see KPI/utils/baseline.py), fitted on the days
+    before that day so past windows see no later data.
     """
-    with engine.connect() as conn:
-        hist = conn.execute(
-            text(f"""
-                SELECT {agg_sql} AS val
-                  FROM live_transactions
-                 WHERE created_at::date BETWEEN :hs AND :he
-                 GROUP BY created_at::date
-                 ORDER BY created_at::date
-            """), {
-                'hs': start - timedelta(days=8),
-                'he': end - timedelta(days=1),
-            }
-        ).scalars().all()
-
-        yesterday = conn.execute(
-            text(f"""
+    day = (end.date() if isinstance(end, datetime) else end) - timedelta(days=1)
+    with read_connection(filter_type) as conn:
+        yesterday = fetch_one(conn, f"""
                 SELECT {agg_sql} AS val
                   FROM live_transactions
                  WHERE created_at::date = :d
-            """), {
-                'd': end - timedelta(days=1),
+            """, {
+                'd': day,
             }
-        ).scalar() or 0.0
+        )
 
-    hist_vals = [float(v) for v in hist]
-    comp = compare_to_historical_single_point(yesterday, hist_vals)
+    comp = compare_to_baseline(daily_baseline("dashboard", agg_sql, as_of=day), yesterday, day)
     return {
         'value':          round(yesterday, 2),
-        'historical_avg': round(sum(hist_vals) / len(hist_vals) if hist_vals else 0.0, 2),
+        'historical_avg': round(comp['mean'] or 0.0, 2),
         'z_score':        comp['z_score'],
         'p_value':        comp['p_value'],
-    }
\ No newline at end of file
+    }
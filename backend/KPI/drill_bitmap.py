@@ -0,0 +1,315 @@
+import os
+import time
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from DB.replicas import read_connection
+from KPI.chart_configs import CHART_BASE_DIMENSION, DRILL_DIMENSIONS
+
+try:  # compressed bitmaps need pyroaring; otherwise packed NumPy bit arrays
+    from pyroaring import BitMap
+except ImportError:  # pragma: no cover
+    BitMap = None
+
+DRILL_BITMAP          = os.getenv("DRILL_BITMAP", "0") == "1"            # opt-in drill backend
+DRILL_BITMAP_DAYS     = int(os.getenv("DRILL_BITMAP_DAYS", "400"))       # snapshot window
+DRILL_BITMAP_REFRESH  = float(os.getenv("DRILL_BITMAP_REFRESH", "300"))  # s between snapshot rebuilds
+DRILL_BITMAP_MAX_ROWS = int(os.getenv("DRILL_BITMAP_MAX_ROWS", "5000000"))
+DRILL_BITMAP_CHUNK    = int(os.getenv("DRILL_BITMAP_CHUNK", "50000"))    # rows per fetch while loading
+
+# chart -> its CHART_METRICS expression over the snapshot columns:
+# ("count",) COUNT(*), ("sum", col) SUM(col), ("pct", num, den) the
+# rounded SUM(num) / SUM(den) * 100. Other charts fall back to SQL.
+CHART_BITMAP_METRICS = {
+    "revenueByCurrency":         ("sum", "usd"),
+    "top5Acquirers":             ("count",),
+    "paymentMethodDistribution": ("count",),
+    "salesByCurrency":           ("sum", "usd"),
+    "processingFeeAnalysis":     ("pct", "fee", "usd"),
+}
+
+
+def _base_dimension(chart_key: str) -> Optional[str]:
+    # the drill dimension whose expression is the chart's base dimension
+    base = CHART_BASE_DIMENSION.get(chart_key)
+    for dim, expr in DRILL_DIMENSIONS.items():
+        if base in (expr, expr.removeprefix("t.")):
+            return dim
+    return None
+
+
+def _as_text(value: Any) -> Optional[str]:
+    # values are looked up as the query string sends them
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _as_day(value) -> date:
+    # Today's window ends at datetime.now(); the snapshot is by day
+    return value.date() if isinstance(value, datetime) else value
+
+
+# ─── Snapshot ─────────────────────────────────────────────────────────
+class DrillSnapshot:
+    """
+    The last DRILL_BITMAP_DAYS days of live_transactions in memory,
+    ordered by day: metric columns as NumPy arrays, every drill dimension
+    dictionary-encoded, and one bitmap of row numbers per dimension value.
+    A drill is the intersection of its filters' bitmaps, clipped to the
+    window's row range (or a parent level's rows refined by one more
+    filter), then a bincount of the metric over the grouped dimension's
+    codes. Immutable once built.
+    """
+
+    def __init__(self, start: date, days: np.ndarray, columns: Dict[str, np.ndarray],
+                 codes: Dict[str, np.ndarray], values: Dict[str, List[Any]]):
+        self.start = start
+        self.built_at = time.time()
+        self.rows = len(days)
+        self.days = days
+        self.columns = columns
+        self.codes = codes
+        self.values = values
+        self.index = {
+            dim: {_as_text(v): i for i, v in enumerate(vals) if v is not None}
+            for dim, vals in values.items()
+        }
+        self.bitmaps = {dim: self._bitmaps(c, len(values[dim])) for dim, c in codes.items()}
+
+    def _bitmaps(self, codes: np.ndarray, n_values: int) -> List[Any]:
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(n_values + 1))
+        rows = [order[bounds[i]:bounds[i + 1]] for i in range(n_values)]
+        if BitMap is not None:
+            return [BitMap(r.tolist()) for r in rows]
+        out = []
+        for r in rows:
+            bits = np.zeros(self.rows, dtype=bool)
+            bits[r] = True
+            out.append(np.packbits(bits))
+        return out
+
+    def nbytes(self) -> int:
+        arrays = [self.days, *self.columns.values(), *self.codes.values()]
+        size = sum(a.nbytes for a in arrays)
+        for maps in self.bitmaps.values():
+            size += sum(len(m.serialize()) if BitMap is not None else m.nbytes for m in maps)
+        return size
+
+    def _select(self, bitmaps: List[Any], lo: int, hi: int) -> np.ndarray:
+        """
+        Row numbers in [lo, hi) set in every bitmap.
+        """
+        if BitMap is not None:
+            acc = BitMap(range(lo, hi))
+            for bm in bitmaps:
+                acc &= bm
+            return np.fromiter(acc, dtype=np.int64, count=len(acc))
+        b0, b1 = lo // 8, (hi + 7) // 8
+        acc = bitmaps[0][b0:b1]
+        for bm in bitmaps[1:]:
+            acc = acc & bm[b0:b1]
+        bits = np.unpackbits(acc)[lo - b0 * 8:hi - b0 * 8]
+        return np.flatnonzero(bits) + lo
+
+    def covers(self, chart_key: str, dimensions: Sequence[str], start: date) -> bool:
+        """
+        Whether the snapshot can answer a drill of the chart over these
+        dimensions (grouped and filtered) from `start` on.
+        """
+        return (chart_key in CHART_BITMAP_METRICS and _base_dimension(chart_key) in self.index
+                and all(d in self.codes for d in dimensions) and _as_day(start) >= self.start)
+
+    def select(self, chart_key: str, base_value: str, start: date, end: date,
+               path: Sequence[Tuple[str, Any]] = ()) -> np.ndarray:
+        """
+        Row numbers of the chart's base value inside the window and below
+        `path`: the intersection of their bitmaps.
+        """
+        bitmaps = []
+        for dim, value in [(_base_dimension(chart_key), base_value), *path]:
+            code = self.index[dim].get(_as_text(value))
+            if code is None:
+                return np.zeros(0, dtype=np.int64)
+            bitmaps.append(self.bitmaps[dim][code])
+        lo = np.searchsorted(self.days, _as_day(start).toordinal(), side="left")
+        hi = np.searchsorted(self.days, _as_day(end).toordinal(), side="right")
+        return self._select(bitmaps, int(lo), int(hi))
+
+    def refine(self, rows: np.ndarray, dimension: str, value: Any) -> np.ndarray:
+        """
+        The subset of rows where dimension = value: one drill level down.
+        """
+        code = self.index[dimension].get(_as_text(value))
+        if code is None:
+            return rows[:0]
+        return rows[self.codes[dimension][rows] == code]
+
+    def aggregate(self, chart_key: str, dimension: str, rows: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        The chart's metric over rows grouped by dimension, ranked like
+        build_cube's groups.
+        """
+        metric = CHART_BITMAP_METRICS[chart_key]
+        codes = self.codes[dimension][rows]
+        n = len(self.values[dimension])
+        counts = np.bincount(codes, minlength=n)
+        if metric[0] == "count":
+            values = counts.astype(float)
+        elif metric[0] == "sum":
+            # float sums of money: drop the last-bit noise the numeric SQL sum lacks
+            values = np.round(np.bincount(codes, weights=self.columns[metric[1]][rows], minlength=n), 6)
+        else:
+            num = np.bincount(codes, weights=self.columns[metric[1]][rows], minlength=n)
+            den = np.bincount(codes, weights=self.columns[metric[2]][rows], minlength=n)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = np.round(num / den * 100, 2)
+            values[den == 0] = np.nan
+
+        out = [
+            {"name": self.values[dimension][c], "value": None if np.isnan(values[c]) else float(values[c])}
+            for c in np.flatnonzero(counts)
+        ]
+        out.sort(key=lambda g: (g["value"] is None, -(g["value"] or 0), str(g["name"])))
+        return out
+
+def load_snapshot(days: int = DRILL_BITMAP_DAYS) -> DrillSnapshot:
+    """
+    Reads the snapshot window with a server-side cursor.
+    """
+    start = date.today() - timedelta(days=days)
+    dims = list(DRILL_DIMENSIONS)
+    sql = f"""
+        SELECT t.created_at::date                                         AS day,
+               COALESCE(t.usd_value, 0)::float                            AS usd,
+               COALESCE((t.pricing_ic/100.0)*t.usd_value + t.gateway_fee, 0)::float AS fee,
+               {', '.join(f'{DRILL_DIMENSIONS[d]} AS {d}' for d in dims)}
+          FROM live_transactions t
+          LEFT JOIN acquirer a ON t.acquirer_id = a.id
+         WHERE t.created_at::date >= :start
+         ORDER BY t.created_at::date
+         LIMIT :max_rows
+    """
+    day_parts, usd_parts, fee_parts = [], [], []
+    lookups: Dict[str, Dict[Any, int]] = {d: {} for d in dims}
+    code_parts: Dict[str, List[np.ndarray]] = {d: [] for d in dims}
+    with read_connection(history=True) as conn:
+        result = conn.execution_options(stream_results=True, yield_per=DRILL_BITMAP_CHUNK).execute(
+            text(sql), {"start": start, "max_rows": DRILL_BITMAP_MAX_ROWS + 1}
+        )
+        for chunk in result.partitions():
+            cols = list(zip(*chunk))
+            day_parts.append(np.fromiter((d.toordinal() for d in cols[0]), dtype=np.int32, count=len(chunk)))
+            usd_parts.append(np.array(cols[1], dtype=float))
+            fee_parts.append(np.array(cols[2], dtype=float))
+            for i, d in enumerate(dims):
+                lookup = lookups[d]
+                code_parts[d].append(np.fromiter(
+                    (lookup.setdefault(v, len(lookup)) for v in cols[3 + i]), dtype=np.int32, count=len(chunk)
+                ))
+
+    rows = sum(len(p) for p in day_parts)
+    if rows > DRILL_BITMAP_MAX_ROWS:
+        raise ValueError(f"snapshot window holds more than DRILL_BITMAP_MAX_ROWS={DRILL_BITMAP_MAX_ROWS} rows")
+    cat = lambda parts, dtype: np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+    return DrillSnapshot(
+        start,
+        cat(day_parts, np.int32),
+        {"usd": cat(usd_parts, float), "fee": cat(fee_parts, float)},
+        {d: cat(code_parts[d], np.int32) for d in dims},
+        {d: list(lookups[d]) for d in dims},
+    )
+
+
+# ─── Engine ───────────────────────────────────────────────────────────
+class DrillBitmapEngine:
+    """
+    Holds the current snapshot and rebuilds it every DRILL_BITMAP_REFRESH
+    seconds on a background thread; lookups keep using the previous one
+    meanwhile. Until the first snapshot is ready drills fall back to SQL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.snapshot: Optional[DrillSnapshot] = None
+        self.build_ms: Optional[float] = None
+        self.counters = {"served": 0, "fallback": 0, "builds": 0, "build_errors": 0}
+        self._query_ms = 0.0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="drill-bitmap", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            try:
+                snapshot = load_snapshot()
+            except Exception as e:
+                print("🔴 Drill bitmap snapshot failed:", str(e).splitlines()[0])
+                with self._lock:
+                    self.counters["build_errors"] += 1
+            else:
+                with self._lock:
+                    self.snapshot = snapshot
+                    self.build_ms = round((time.perf_counter() - started) * 1000, 1)
+                    self.counters["builds"] += 1
+            self._stop.wait(DRILL_BITMAP_REFRESH)
+
+    def current(self) -> Optional[DrillSnapshot]:
+        """
+        The snapshot to answer drills from, None while disabled or loading.
+        """
+        if not DRILL_BITMAP:
+            return None
+        self.start()
+        return self.snapshot
+
+    def record(self, served: bool, ms: float = 0.0) -> None:
+        with self._lock:
+            if served:
+                self.counters["served"] += 1
+                self._query_ms += ms
+            else:
+                self.counters["fallback"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = self.snapshot
+            served = self.counters["served"]
+            return {
+                **self.counters,
+                "enabled":      DRILL_BITMAP,
+                "bitmaps":      "roaring" if BitMap is not None else "numpy",
+                "rows":         snapshot.rows if snapshot else None,
+                "since":        snapshot.start if snapshot else None,
+                "built_at":     snapshot.built_at if snapshot else None,
+                "build_ms":     self.build_ms,
+                "avg_query_ms": round(self._query_ms / served, 3) if served else None,
+            }
+
+
+drill_bitmaps = DrillBitmapEngine()
+
+
+def drill_bitmap_stats() -> Dict[str, Any]:
+    stats = drill_bitmaps.stats()
+    snapshot = drill_bitmaps.snapshot
+    stats["bytes"] = snapshot.nbytes() if snapshot else None
+    return stats
@@ -0,0 +1,125 @@
+import os
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from DB.replicas import read_connection
+from KPI.utils.shared_cache import tiered_cache
+from KPI.chart_configs import (
+    CHART_BASE_DIMENSION,
+    CHART_METRICS,
+    DRILL_DIMENSIONS,
+    chart_drill_options,
+)
+
+DRILL_CUBE         = os.getenv("DRILL_CUBE", "1") != "0"
+DRILL_CUBE_TTL     = float(os.getenv("DRILL_CUBE_TTL", "300"))      # s a cube is served for
+DRILL_CUBE_ENTRIES = int(os.getenv("DRILL_CUBE_ENTRIES", "128"))    # cubes kept per process (LRU)
+
+# ─── Cube ─────────────────────────────────────────────────────────────
+# The first-level drill of one (chart, base value, window) for every
+# dimension of chart_drill_options[chart] at once: one GROUPING SETS scan
+# instead of one query per dimension the user switches to. A cube is a
+# plain dict {dimension: [{"name", "value"}, ...]} ranked by value.
+
+
+def build_cube(chart_key: str, base_value: str, start: date, end: date,
+               filter_type: str = "YTD", path: Sequence[Tuple[str, Any]] = (),
+               timeout_ms: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Runs the GROUPING SETS query for every drill dimension of the chart.
+    path=[(dimension, value), ...] narrows it to the rows below a drill
+    path, i.e. every next-level drill under that path; timeout_ms caps the
+    statement (SET LOCAL statement_timeout).
+    """
+    dims = [d for d in chart_drill_options[chart_key] if d in DRILL_DIMENSIONS]
+    exprs = [DRILL_DIMENSIONS[d] for d in dims]
+    params = {"s": start, "e": end, "base_value": base_value}
+    path_sql = ""
+    for i, (dim, value) in enumerate(path):
+        path_sql += f" AND {DRILL_DIMENSIONS[dim]} = :p{i}"
+        params[f"p{i}"] = value
+    sql = f"""
+        SELECT GROUPING({', '.join(exprs)}) AS gid,
+               {', '.join(f'{e} AS g{i}' for i, e in enumerate(exprs))},
+               {CHART_METRICS[chart_key]} AS value
+          FROM live_transactions t
+          LEFT JOIN acquirer a ON t.acquirer_id = a.id
+         WHERE t.created_at::date BETWEEN :s AND :e
+           AND {CHART_BASE_DIMENSION[chart_key]} = :base_value
+           {path_sql}
+         GROUP BY GROUPING SETS ({', '.join(f'({e})' for e in exprs)})
+    """
+    with read_connection(filter_type) as conn:
+        if timeout_ms:
+            conn.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+        rows = conn.execute(text(sql), params).all()
+
+    # gid has every bit set except the one of the dimension grouped on
+    n = len(exprs)
+    dim_of_gid = {((1 << n) - 1) ^ (1 << (n - 1 - i)): i for i in range(n)}
+    cube: Dict[str, List[Dict[str, Any]]] = {d: [] for d in dims}
+    for r in rows:
+        i = dim_of_gid.get(r.gid)
+        if i is not None:
+            value = None if r.value is None else float(r.value)
+            cube[dims[i]].append({"name": r[1 + i], "value": value})
+    for groups in cube.values():
+        # the order top_n_query ranks in: value desc, nulls last, then name
+        groups.sort(key=lambda g: (g["value"] is None, -(g["value"] or 0), str(g["name"])))
+    return cube
+
+
+def path_key(path: Sequence[Tuple[str, Any]]) -> Tuple[Tuple[str, str], ...]:
+    """
+    Hashable form of a drill path, values as the query string sends them.
+    """
+    return tuple((dim, "true" if value is True else "false" if value is False else str(value))
+                 for dim, value in path)
+
+
+# ─── Cache ────────────────────────────────────────────────────────────
+class DrillCubeCache:
+    """
+    Cubes of recently drilled (chart, base value, window) keys, served for
+    DRILL_CUBE_TTL seconds from the tiered cache (this worker's LRU of
+    DRILL_CUBE_ENTRIES, then the tiers shared with the other workers).
+    Concurrent first requests for a key share one build.
+    """
+
+    def __init__(self, size: int = DRILL_CUBE_ENTRIES, ttl: float = DRILL_CUBE_TTL):
+        # cubes are read-only once built, so the memory tier hands out the object itself
+        self._cache = tiered_cache("drill_cube", ttl, size, copy=False)
+
+    def get(self, chart_key: str, base_value: str, start: date, end: date,
+            filter_type: str = "YTD") -> Dict[str, List[Dict[str, Any]]]:
+        return self._cache.get_or_build(
+            (chart_key, base_value, start, end),
+            lambda: build_cube(chart_key, base_value, start, end, filter_type),
+            label=chart_key,
+        )
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "enabled": DRILL_CUBE}
+
+
+drill_cubes = DrillCubeCache()
+
+
+def cube_groups(chart_key: str, dimension: str, base_value: str, start: date, end: date,
+                filter_type: str = "YTD") -> Optional[List[Dict[str, Any]]]:
+    """
+    The ranked first-level groups of one dimension from the cached cube,
+    or None when the cube is disabled.
+    """
+    if not DRILL_CUBE:
+        return None
+    return drill_cubes.get(chart_key, base_value, start, end, filter_type).get(dimension)
+
+
+def drill_cube_stats() -> Dict[str, Any]:
+    return drill_cubes.stats()
@@ -0,0 +1,168 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from KPI.drill_cube import path_key
+
+DRILL_SESSIONS          = int(os.getenv("DRILL_SESSIONS", "256"))            # sessions kept per process
+DRILL_SESSION_MAX_BYTES = int(os.getenv("DRILL_SESSION_MAX_BYTES", str(32 * 1024 * 1024)))
+DRILL_SESSION_IDLE      = float(os.getenv("DRILL_SESSION_IDLE", "1800"))     # s before an idle session is dropped
+DRILL_PATH_TTL          = float(os.getenv("DRILL_PATH_TTL", "300"))          # s a cached prefix is served for
+
+# rough in-memory size of one cached group ({"name", "value"} dict)
+_GROUP_BYTES = 200
+
+
+def _size(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):  # cube: {dimension: [groups]}
+        return _GROUP_BYTES * sum(len(groups) for groups in value.values())
+    return _GROUP_BYTES
+
+
+# ─── Session cache ────────────────────────────────────────────────────
+class DrillSession:
+    """
+    One client's cached drill prefixes: for every (chart, base value,
+    window, path prefix) it walked, the prefix's row set in the bitmap
+    snapshot or its cube. LRU-evicted once the estimated size passes
+    DRILL_SESSION_MAX_BYTES.
+    """
+
+    def __init__(self, max_bytes: int = DRILL_SESSION_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.last_used = time.monotonic()
+        self._items: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (monotonic time, value, size)
+        self.counters = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def get(self, key: tuple) -> Any:
+        item = self._items.get(key)
+        if item is not None and time.monotonic() - item[0] >= DRILL_PATH_TTL:
+            self._pop(key)
+            item = None
+        if item is None:
+            self.counters["misses"] += 1
+            return None
+        self._items.move_to_end(key)
+        self.counters["hits"] += 1
+        return item[1]
+
+    def put(self, key: tuple, value: Any) -> None:
+        if key in self._items:
+            self._pop(key)
+        size = _size(value)
+        self._items[key] = (time.monotonic(), value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._items) > 1:
+            self._pop(next(iter(self._items)))
+            self.counters["evicted"] += 1
+
+    def _pop(self, key: tuple) -> None:
+        self.bytes -= self._items.pop(key)[2]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "prefixes": len(self._items), "bytes": self.bytes}
+
+
+class DrillSessions:
+    """
+    Sessions by id (the X-Drill-Session header; requests without one share
+    the anonymous session). At most DRILL_SESSIONS are kept, and sessions
+    idle for DRILL_SESSION_IDLE seconds are dropped.
+    """
+
+    def __init__(self, size: int = DRILL_SESSIONS):
+        self.size = size
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, DrillSession]" = OrderedDict()
+        self.dropped = 0
+
+    def _session(self, session_id: Optional[str]) -> DrillSession:
+        # called with the lock held
+        now = time.monotonic()
+        sid = session_id or ""
+        session = self._sessions.get(sid)
+        if session is None:
+            session = self._sessions[sid] = DrillSession()
+        session.last_used = now
+        self._sessions.move_to_end(sid)
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.size and now - oldest.last_used < DRILL_SESSION_IDLE:
+                break
+            del self._sessions[oldest_id]
+            self.dropped += 1
+        return session
+
+    def cached(self, session_id: Optional[str], key: tuple, build: Callable[[], Any]) -> Any:
+        """
+        The session's value for key, built (outside the lock) on a miss.
+        """
+        with self._lock:
+            value = self._session(session_id).get(key)
+        if value is None:
+            value = build()
+            with self._lock:
+                self._session(session_id).put(key, value)
+        return value
+
+    def rows(self, session_id: Optional[str], snapshot, chart_key: str, base_value: str,
+             start: date, end: date, path: Sequence[Tuple[str, Any]]) -> np.ndarray:
+        """
+        The snapshot rows below `path`. Refines the longest prefix the
+        session has cached one level at a time (caching every level on the
+        way); without any, intersects the whole path's bitmaps at once.
+        """
+        base = ("rows", id(snapshot), snapshot.built_at, chart_key, base_value, start, end)
+        keys = [(*base, path_key(path[:depth])) for depth in range(len(path) + 1)]
+        with self._lock:
+            session = self._session(session_id)
+            depth, rows = len(path), None
+            while depth >= 0:
+                rows = session.get(keys[depth])
+                if rows is not None:
+                    break
+                depth -= 1
+
+        fresh = []
+        if rows is None:
+            rows = snapshot.select(chart_key, base_value, start, end, path)
+            fresh.append((keys[-1], rows))
+        else:
+            for d in range(depth, len(path)):
+                rows = snapshot.refine(rows, *path[d])
+                fresh.append((keys[d + 1], rows))
+        if fresh:
+            with self._lock:
+                session = self._session(session_id)
+                for key, value in fresh:
+                    session.put(key, value)
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_session = [s.stats() for s in self._sessions.values()]
+            return {
+                "sessions": len(per_session),
+                "dropped":  self.dropped,
+                "bytes":    sum(s["bytes"] for s in per_session),
+                "prefixes": sum(s["prefixes"] for s in per_session),
+                "hits":     sum(s["hits"] for s in per_session),
+                "misses":   sum(s["misses"] for s in per_session),
+                "evicted":  sum(s["evicted"] for s in per_session),
+                "max_bytes_per_session": DRILL_SESSION_MAX_BYTES,
+            }
+
+
+drill_sessions = DrillSessions()
+
+
+def drill_session_stats() -> Dict[str, Any]:
+    return drill_sessions.stats()
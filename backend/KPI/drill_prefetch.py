@@ -0,0 +1,195 @@
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from DB.connector import pool_stats
+from KPI.drill_cube import build_cube, path_key
+
+DRILL_PREFETCH             = os.getenv("DRILL_PREFETCH", "1") != "0"
+DRILL_PREFETCH_TOP_K       = int(os.getenv("DRILL_PREFETCH_TOP_K", "3"))        # first-level bars prefetched
+DRILL_PREFETCH_TTL         = float(os.getenv("DRILL_PREFETCH_TTL", "120"))      # s a prefetched drill is served for
+DRILL_PREFETCH_ENTRIES     = int(os.getenv("DRILL_PREFETCH_ENTRIES", "256"))
+DRILL_PREFETCH_WORKERS     = int(os.getenv("DRILL_PREFETCH_WORKERS", "1"))      # background queries at once
+DRILL_PREFETCH_QUEUE       = int(os.getenv("DRILL_PREFETCH_QUEUE", "32"))       # pending jobs; more are dropped
+DRILL_PREFETCH_MAX_LOAD    = float(os.getenv("DRILL_PREFETCH_MAX_LOAD", "0.75"))  # 1-min load per CPU
+DRILL_PREFETCH_POOL_SHARE  = float(os.getenv("DRILL_PREFETCH_POOL_SHARE", "0.5"))  # of the connection pool
+DRILL_PREFETCH_TIMEOUT_MS  = int(os.getenv("DRILL_PREFETCH_TIMEOUT_MS", "5000"))   # statement_timeout
+
+
+def _busy() -> Optional[str]:
+    """
+    Why the process is too busy to prefetch right now, if it is.
+    """
+    if hasattr(os, "getloadavg"):
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        if load > DRILL_PREFETCH_MAX_LOAD:
+            return "cpu"
+    pool = pool_stats()
+    if pool["checked_out"] >= DRILL_PREFETCH_POOL_SHARE * pool["capacity"]:
+        return "pool"
+    return None
+
+
+class DrillPrefetcher:
+    """
+    Speculative next-level drills. After a drill, the cubes below its
+    top-k groups (every dimension under path + that group, one GROUPING
+    SETS query each) are built by background workers and kept for
+    DRILL_PREFETCH_TTL seconds, so the click into a bar is usually served
+    from memory.
+
+    Prefetching yields to real traffic: jobs are dropped when the queue is
+    full, skipped while the CPU load or the connection pool is above its
+    budget, and each query runs under a statement_timeout. Workers are
+    plain threads, outside any request's deadline budget.
+    """
+
+    def __init__(self, workers: int = DRILL_PREFETCH_WORKERS, size: int = DRILL_PREFETCH_ENTRIES,
+                 ttl: float = DRILL_PREFETCH_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[tuple]" = queue.Queue(DRILL_PREFETCH_QUEUE)
+        self._pending: set = set()
+        # key -> [monotonic time, cube, served]
+        self._items: "OrderedDict[tuple, list]" = OrderedDict()
+        self._threads: List[threading.Thread] = []
+        self.counters = {
+            "scheduled":    0,
+            "dropped":      0,   # queue full
+            "skipped_cpu":  0,
+            "skipped_pool": 0,
+            "stale":        0,   # waited in the queue past the TTL
+            "completed":    0,
+            "failed":       0,
+            "hits":         0,
+            "misses":       0,
+            "used":         0,   # prefetched cubes served at least once
+            "unused":       0,   # expired / evicted without being served
+        }
+
+    @staticmethod
+    def key(chart_key: str, base_value: str, start: date, end: date,
+            path: Sequence[Tuple[str, Any]]) -> tuple:
+        return (chart_key, base_value, start, end, path_key(path))
+
+    def _start(self) -> None:
+        # called with the lock held
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"drill-prefetch-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _drop(self, key: tuple) -> None:
+        # called with the lock held
+        item = self._items.pop(key)
+        if not item[2]:
+            self.counters["unused"] += 1
+
+    def schedule(self, chart_key: str, path: Sequence[Tuple[str, Any]], dimension: str, base_value: str,
+                 start: date, end: date, filter_type: str, values: List[Any]) -> None:
+        """
+        Queues the cubes below the first DRILL_PREFETCH_TOP_K of `values`
+        (the group names of a drill by `dimension` under `path`, largest
+        first).
+        """
+        if not DRILL_PREFETCH or DRILL_PREFETCH_TOP_K <= 0:
+            return
+        with self._lock:
+            self._start()
+            for value in values[:DRILL_PREFETCH_TOP_K]:
+                child = [*path, (dimension, value)]
+                key = self.key(chart_key, base_value, start, end, child)
+                if key in self._pending or key in self._items:
+                    continue
+                try:
+                    self._queue.put_nowait((key, time.monotonic(), filter_type, child))
+                except queue.Full:
+                    self.counters["dropped"] += 1
+                    continue
+                self._pending.add(key)
+                self.counters["scheduled"] += 1
+
+    def _run(self) -> None:
+        while True:
+            key, queued_at, filter_type, path = self._queue.get()
+            try:
+                self._prefetch(key, queued_at, filter_type, path)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def _prefetch(self, key: tuple, queued_at: float, filter_type: str, path: List[Tuple[str, Any]]) -> None:
+        if time.monotonic() - queued_at > self.ttl:
+            self._bump("stale")
+            return
+        busy = _busy()
+        if busy:
+            self._bump(f"skipped_{busy}")
+            return
+        chart_key, base_value, start, end, _ = key
+        try:
+            cube = build_cube(chart_key, base_value, start, end, filter_type,
+                              path=path, timeout_ms=DRILL_PREFETCH_TIMEOUT_MS)
+        except Exception as e:
+            self._bump("failed")
+            print(f"🔴 Drill prefetch {chart_key} {path_key(path)} failed:", str(e).splitlines()[0])
+            return
+        with self._lock:
+            self._items[key] = [time.monotonic(), cube, False]
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._drop(next(iter(self._items)))
+            self.counters["completed"] += 1
+
+    def _bump(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def groups(self, chart_key: str, dimension: str, base_value: str, start: date, end: date,
+               path: Sequence[Tuple[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        The ranked groups of `dimension` below `path` if they were
+        prefetched, else None.
+        """
+        if not DRILL_PREFETCH:
+            return None
+        key = self.key(chart_key, base_value, start, end, path)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and time.monotonic() - item[0] >= self.ttl:
+                self._drop(key)
+                item = None
+            if item is None or dimension not in item[1]:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            if not item[2]:
+                item[2] = True
+                self.counters["used"] += 1
+            return item[1][dimension]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "enabled":  DRILL_PREFETCH,
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else None,
+                "entries":  len(self._items),
+                "pending":  len(self._pending),
+            }
+
+
+drill_prefetcher = DrillPrefetcher()
+
+
+def drill_prefetch_stats() -> Dict[str, Any]:
+    return drill_prefetcher.stats()
@@ -1,92 +1,193 @@
+import time
 from datetime import date
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List, Sequence
 
 from sqlalchemy import text
-from DB.connector import get_engine
+from DB.replicas import read_connection
 from KPI.utils.time_utils import get_date_ranges
+from KPI.utils.single_flight import coalesced
+from KPI.utils.top_n import top_n_query, top_n_rows, paging
+from KPI.drill_cube import DRILL_CUBE, build_cube, cube_groups, path_key
+from KPI.drill_prefetch import drill_prefetcher
+from KPI.drill_bitmap import drill_bitmaps, _as_day
+from KPI.drill_path import drill_sessions
 from KPI.chart_configs import (
     CHART_BASE_DIMENSION,
     CHART_METRICS,
+    CHART_OTHER_AGG,
+    CHART_OTHER_COLUMNS,
+    DRILL_DIMENSIONS,
+    DRILL_LVL2,
+    DRILL_PATH,
+    chart_drill_options,
     drill_configs,
 )
 
-# Track last drill context (if multi-step session needed)
-_last_drill_dimension1: Optional[str] = None
-_last_drill_base_value: Optional[str] = None
 
+def _dimension_sql(chart_key: str, dimension: str) -> str:
+    if dimension not in chart_drill_options.get(chart_key, ()) or dimension not in DRILL_DIMENSIONS:
+        raise ValueError(f"Unknown drill dimension {dimension} for {chart_key}")
+    return DRILL_DIMENSIONS[dimension]
 
-# in app/services/drill_service.py
 
-def fetch_drill_data(
+def _as_text(value: Any) -> Optional[str]:
+    # group names as Postgres' ::text renders them (top_n_query casts)
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _cube_rows(groups, limit: Optional[int], offset: int):
+    """
+    top_n_query's page + Other cut over a cube's ranked groups.
+    """
+    if limit is None:
+        return groups
+    ranked = [{"name": _as_text(g["name"]), "value": g["value"], "rank": i + 1, "groups": len(groups)}
+              for i, g in enumerate(groups)]
+    return top_n_rows(ranked, "name", {"value": "SUM"}, limit, offset)
+
+
+def _label(dimension: str) -> str:
+    return dimension.replace("_", " ").title()
+
+
+def _cached_groups(
     chart_key: str,
-    level: str,
     dimension: str,
-    dimension1: str,
     base_value: str,
-    parent_value: Optional[str] = None,
+    path: List[Tuple[str, Any]],
+    start: date,
+    end: date,
+    filter_type: str,
+    session: Optional[str],
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    """
+    The drill's ranked groups from memory, and where they came from: the
+    session's rows of the path in the bitmap snapshot, the shared
+    first-level cube, a prefetched cube, or the session's cube of the path
+    (built here on a miss). (None, None) when none applies.
+    """
+    snapshot = drill_bitmaps.current()
+    if snapshot is not None:
+        if snapshot.covers(chart_key, [dimension, *(d for d, _ in path)], start):
+            started = time.perf_counter()
+            rows = drill_sessions.rows(session, snapshot, chart_key, base_value, start, end, path)
+            groups = snapshot.aggregate(chart_key, dimension, rows)
+            drill_bitmaps.record(True, (time.perf_counter() - started) * 1000)
+            return groups, "bitmap"
+        drill_bitmaps.record(False)
+
+    if not path:
+        groups = cube_groups(chart_key, dimension, base_value, start, end, filter_type)
+        return groups, "cube" if groups is not None else None
+    groups = drill_prefetcher.groups(chart_key, dimension, base_value, start, end, path)
+    if groups is not None:
+        return groups, "prefetch"
+    if not DRILL_CUBE:
+        return None, None
+    cube = drill_sessions.cached(
+        session, ("cube", chart_key, base_value, start, end, path_key(path)),
+        lambda: build_cube(chart_key, base_value, start, end, filter_type, path=path),
+    )
+    return cube.get(dimension), "cube"
+
+
+@coalesced("kpi")
+def fetch_drill_path(
+    chart_key: str,
+    dimension: str,
+    base_value: str,
+    path: Sequence[Tuple[str, Any]] = (),
     filter_type: str = 'YTD',
     custom: Optional[Tuple[date, date]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    session: Optional[str] = None,
 ) -> Dict[str, Any]:
-    # 1) time window
-    start, end, _, _ = get_date_ranges(filter_type, custom)
-
-    # 2) config lookup
-    cfg = drill_configs.get(level)
-    if not cfg:
-        raise ValueError(f"Unknown drill level {level}")
+    """
+    The chart's metric for base_value grouped by `dimension`, below a
+    drill path of (dimension, value) filters, outermost first; path=()
+    is the first-level drill.
 
+    limit=None returns every group; otherwise the groups ranked
+    offset+1 .. offset+limit by value plus an "Other" row. Each prefix of
+    the path is cached for the session, so a level down refines its
+    parent and a dimension switch is served from memory; the cubes below
+    the top groups are prefetched. Drills whose Other row can't be rolled
+    up from cached groups run in SQL.
+    """
+    # 1) time window + validation
+    start, end, _, _ = get_date_ranges(filter_type, custom)
+    # every drill filters on the day, so Today's window (ending at now) is
+    # keyed by its dates too: cubes, prefetches and session prefixes stay hot
+    day_start, day_end = _as_day(start), _as_day(end)
+    if chart_key not in CHART_BASE_DIMENSION:
+        raise ValueError(f"Unknown drill chart {chart_key}")
+    path = [(d, v) for d, v in path]
+    if len({d for d, _ in path}) != len(path):
+        raise ValueError("A drill path can filter each dimension only once")
     base_dim   = CHART_BASE_DIMENSION[chart_key]
     metric_sql = CHART_METRICS[chart_key]
-    joins = []
-    if base_dim.startswith("a.") or dimension == "acquirer_name":
-        joins.append("JOIN acquirer a ON t.acquirer_id = a.id")
-    join_sql = "\n".join(joins)
-
-    # 3) build SQL + params
-    if level == "DRILL_LVL1":
-        # single filter: base_dim = base_value
-        sql = f"""
-            SELECT {metric_sql}       AS value,
-                   {dimension}         AS name
-              FROM live_transactions t
-             {join_sql}
-             WHERE t.created_at::date BETWEEN :s AND :e
-               AND {base_dim} = :base_value
-             GROUP BY {dimension}
-        """
-        params = {"s": start, "e": end, "base_value": base_value}
+    dim_sql    = _dimension_sql(chart_key, dimension)
+    path_sql   = [_dimension_sql(chart_key, d) for d, _ in path]
+    other_agg  = CHART_OTHER_AGG.get(chart_key, "SUM")
 
-    else:  # DRILL_LVL2
-        # must have a parent_value to filter the first drill
-        if parent_value is None:
-            raise ValueError("parent_value is required for level 2")
+    # 2) from memory when possible
+    rows, source = None, None
+    if limit is None or other_agg == "SUM":
+        groups, source = _cached_groups(chart_key, dimension, base_value, path, day_start, day_end,
+                                        filter_type, session)
+        if groups is not None:
+            rows = _cube_rows(groups, limit, offset)
+
+    # 3) otherwise build SQL + params and execute
+    if rows is None:
+        source = "sql"
+        filters = "".join(f"\n               AND {e} = :p{i}" for i, e in enumerate(path_sql))
+        carried = ""
+        if limit is not None:
+            carried = "".join(f",\n                   {e} AS {c}"
+                              for c, e in CHART_OTHER_COLUMNS.get(chart_key, {}).items())
         sql = f"""
             SELECT {metric_sql}       AS value,
-                   {dimension}         AS name
+                   {dim_sql}           AS name{carried}
               FROM live_transactions t
-             {join_sql}
+              LEFT JOIN acquirer a ON t.acquirer_id = a.id
              WHERE t.created_at::date BETWEEN :s AND :e
-               AND {base_dim}      = :base_value
-               AND {dimension1}     = :parent_value
-             GROUP BY {dimension}
+               AND {base_dim} = :base_value{filters}
+             GROUP BY {dim_sql}
         """
-        params = {
-            "s":           start,
-            "e":           end,
-            "base_value":  base_value,
-            "parent_value": parent_value,
-        }
-
-    # 4) execute + format
-    with get_engine().connect() as conn:
-        rows = conn.execute(text(sql), params).mappings().all()
-
-    data = [{"name": r["name"], "value": float(r["value"])} for r in rows]
+        params = {"s": day_start, "e": day_end, "base_value": base_value}
+        params.update({f"p{i}": v for i, (_, v) in enumerate(path)})
+
+        if limit is not None:
+            sql, top_params = top_n_query(
+                sql, label="name", measures={"value": other_agg},
+                order_by="value", limit=limit, offset=offset,
+            )
+            params.update(top_params)
+
+        with read_connection(filter_type) as conn:
+            rows = conn.execute(text(sql), params).mappings().all()
+
+    remaining = [d for d in chart_drill_options[chart_key] if d not in {p for p, _ in path} | {dimension}]
+    if source != "bitmap" and remaining:
+        # the next click is usually into one of the largest bars
+        top = sorted((r for r in rows if r.get("rank", 0) is not None),
+                     key=lambda r: -(r["value"] or 0))
+        drill_prefetcher.schedule(chart_key, path, dimension, base_value, day_start, day_end, filter_type,
+                                  [r["name"] for r in top])
+
+    # 4) format
+    cfg = drill_configs[DRILL_PATH]
+    data = [{"name": r["name"], "value": None if r["value"] is None else float(r["value"])} for r in rows]
     title = cfg["title"].format(
-        dimension_label  = dimension.replace("_"," ").title(),
-        base_value       = base_value,
-        lvl1_value       = parent_value or "",
-        lvl1_field_label = dimension.replace("_"," ").title(),
+        dimension_label = _label(dimension),
+        path_label      = "".join(f"{v} ({_label(d)}) for " for d, v in reversed(path)),
+        base_value      = base_value,
     )
 
     return {
@@ -94,10 +195,58 @@ def fetch_drill_data(
         "title":              title,
         "type":               cfg["type"].value,
         "data":               data,
-        "drillable":          cfg["drillable"],
-        "nextChart":          cfg["next_chart"],
+        "drillable":          bool(remaining),
+        "nextChart":          cfg["next_chart"] if remaining else None,
         "start":              start,
         "end":                end,
         "baseFilteredField":  base_dim,
         "baseFilteredValue":  base_value,
+        "path":               [{"dimension": d, "value": v} for d, v in path],
+        "drillDimensions":    remaining,
+        "source":             source,
+        **({"paging": paging(rows, limit, offset)} if limit is not None else {}),
+    }
+
+
+def fetch_drill_data(
+    chart_key: str,
+    level: str,
+    dimension: str,
+    dimension1: str,
+    base_value: str,
+    parent_value: Optional[str] = None,
+    filter_type: str = 'YTD',
+    custom: Optional[Tuple[date, date]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    session: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    The two-level drill (DRILL_LVL1 / DRILL_LVL2) as a drill path of zero
+    or one filters, with the level's title and next chart.
+    """
+    cfg = drill_configs.get(level)
+    if not cfg or level == DRILL_PATH:
+        raise ValueError(f"Unknown drill level {level}")
+    path = []
+    if level == DRILL_LVL2:
+        # must have a parent_value to filter the first drill
+        if parent_value is None:
+            raise ValueError("parent_value is required for level 2")
+        path = [(dimension1, parent_value)]
+
+    result = fetch_drill_path(chart_key, dimension, base_value, path, filter_type, custom,
+                              limit, offset, session)
+    title = cfg["title"].format(
+        dimension_label  = _label(dimension),
+        base_value       = base_value,
+        lvl1_value       = parent_value or "",
+        lvl1_field_label = _label(dimension1 or ""),
+    )
+    return {
+        **result,
+        "title":      title,
+        "type":       cfg["type"].value,
+        "drillable":  cfg["drillable"],
+        "nextChart":  cfg["next_chart"],
     }
@@ -0,0 +1,260 @@
+import io
+import csv
+import os
+from datetime import date
+from typing import Optional, Tuple, Dict, Any, Iterator, List, Callable
+
+from sqlalchemy import text
+from DB.replicas import read_connection
+from KPI.utils.time_utils import get_date_ranges
+from KPI.chart_configs import CHART_BASE_DIMENSION, chart_drill_options
+
+try:  # parquet export is optional
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+# raw columns handed to analysts; acquirer name comes from the join
+EXPORT_COLUMNS = """
+    t.id,
+    t.created_at,
+    t.merchant_id,
+    a.name AS acquirer_name,
+    t.transaction_currency,
+    t.usd_value,
+    t.gateway_fee,
+    t.pricing_ic,
+    t.credit_card_type,
+    t.funding_source,
+    t.creation_type,
+    t.transaction_type,
+    t.sca_type,
+    t.issuer_country_code,
+    t.country_code,
+    t.region,
+    t.fraud,
+    t.pred_fraud,
+    t.payment_successful
+"""
+
+
+def drill_export_query(
+    chart_key: str,
+    base_value: str,
+    dimension1: Optional[str] = None,
+    parent_value: Optional[str] = None,
+    filter_type: str = 'YTD',
+    custom: Optional[Tuple[date, date]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Raw rows behind a /drill slice: the chart's base filter plus, for a
+    level-2 slice, the first drill dimension.
+    """
+    if chart_key not in CHART_BASE_DIMENSION:
+        raise ValueError(f"Unknown chartKey {chart_key}")
+    start, end, _, _ = get_date_ranges(filter_type, custom)
+
+    where = [
+        "t.created_at::date BETWEEN :s AND :e",
+        f"{CHART_BASE_DIMENSION[chart_key]} = :base_value",
+    ]
+    params: Dict[str, Any] = {"s": start, "e": end, "base_value": base_value}
+    if dimension1:
+        if dimension1 not in chart_drill_options[chart_key]:
+            raise ValueError(f"Dimension {dimension1} is not drillable for {chart_key}")
+        if parent_value is None:
+            raise ValueError("parent_value is required with dimension1")
+        column = "a.name" if dimension1 == "acquirer_name" else f"t.{dimension1}"
+        where.append(f"{column} = :parent_value")
+        params["parent_value"] = parent_value
+
+    sql = f"""
+        SELECT {EXPORT_COLUMNS}
+          FROM live_transactions t
+          LEFT JOIN acquirer a ON t.acquirer_id = a.id
+         WHERE {' AND '.join(where)}
+         ORDER BY t.id
+    """
+    return sql, params
+
+
+def gateway_fee_export_query(
+    filter_type: str = 'YTD',
+    custom: Optional[Tuple[date, date]] = None,
+    acquirer: Optional[str] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Per-transaction gateway fees behind the Gateway Fee Distribution chart.
+    """
+    start, end, _, _ = get_date_ranges(filter_type, custom)
+    params: Dict[str, Any] = {"s": start, "e": end}
+    acquirer_sql = ""
+    if acquirer:
+        acquirer_sql = "AND a.name = :acquirer"
+        params["acquirer"] = acquirer
+
+    sql = f"""
+        SELECT t.id,
+               t.created_at,
+               a.name AS acquirer_name,
+               t.transaction_currency,
+               t.usd_value,
+               t.gateway_fee
+          FROM live_transactions t
+          JOIN acquirer a ON t.acquirer_id = a.id
+         WHERE t.created_at::date BETWEEN :s AND :e
+           {acquirer_sql}
+         ORDER BY t.id
+    """
+    return sql, params
+
+
+# ─── Streaming ────────────────────────────────────────────────────────
+def _stream_chunks(
+    sql: str, params: Dict[str, Any], filter_type: Optional[str] = None,
+) -> Iterator[Tuple[List[tuple], List[tuple]]]:
+    """
+    Yields (cursor description, rows) chunks from a server-side cursor;
+    each description entry starts with (name, type OID). If the consumer
+    stops early (client went away) the running statement is cancelled
+    instead of being left to finish on the server. Long windows are read
+    from a replica when one is configured.
+    """
+    with read_connection(filter_type) as conn:
+        finished = False
+        try:
+            result = conn.execution_options(
+                stream_results=True, yield_per=EXPORT_CHUNK_ROWS
+            ).execute(text(sql), params)
+            description = [tuple(d) for d in result.cursor.description]
+            yield description, []  # header first, so empty results still carry columns
+            for chunk in result.partitions():
+                yield description, chunk
+            finished = True
+        finally:
+            if not finished:
+                fairy = conn.connection
+                raw = getattr(fairy, "dbapi_connection", None) or fairy.connection
+                try:
+                    raw.cancel()
+                except Exception as e:
+                    print("🔴 Export cancel failed:", e)
+                conn.invalidate()
+
+
+def stream_csv(sql: str, params: Dict[str, Any], filter_type: Optional[str] = None) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for description, rows in _stream_chunks(sql, params, filter_type):
+        if not rows:
+            writer.writerow([d[0] for d in description])
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object that collects whatever the Parquet writer
+    flushes so it can be yielded and dropped chunk by chunk.
+    """
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+# Postgres type OID -> Arrow type; other types (text, enums, ...) are
+# written as strings. numeric is handled in _arrow_column.
+_ARROW_TYPES = {
+    16:   "bool_",
+    20:   "int64",
+    21:   "int16",
+    23:   "int32",
+    700:  "float32",
+    701:  "float64",
+    1082: "date32",
+}
+
+
+def _arrow_column(column: tuple) -> Tuple[Any, Optional[Callable[[Any], Any]]]:
+    """
+    (Arrow field, converter for non-NULL values or None) for one cursor
+    description entry, so the file's schema is fixed by the query rather
+    than inferred from whatever the first chunk happens to hold.
+    """
+    name, oid, precision, scale = column[0], column[1], column[4], column[5]
+    if oid == 1700:  # numeric: exact when its precision is declared
+        if precision and precision <= 38 and scale is not None:
+            return pa.field(name, pa.decimal128(precision, scale)), None
+        return pa.field(name, pa.float64()), float
+    if oid == 1114:
+        return pa.field(name, pa.timestamp("us")), None
+    if oid == 1184:
+        return pa.field(name, pa.timestamp("us", tz="UTC")), None
+    if oid in _ARROW_TYPES:
+        return pa.field(name, getattr(pa, _ARROW_TYPES[oid])()), None
+    return pa.field(name, pa.string()), str
+
+
+def stream_parquet(sql: str, params: Dict[str, Any], filter_type: Optional[str] = None) -> Iterator[bytes]:
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow installed")
+    sink = _ChunkSink()
+    writer = schema = None
+    columns: List[Tuple[Any, Optional[Callable[[Any], Any]]]] = []
+    try:
+        for description, rows in _stream_chunks(sql, params, filter_type):
+            if writer is None:
+                # the header chunk comes first, so even an empty export gets a schema
+                columns = [_arrow_column(d) for d in description]
+                schema = pa.schema([field for field, _ in columns])
+                writer = pq.ParquetWriter(sink, schema)
+            if rows:
+                # one row group per chunk keeps writer memory bounded
+                arrays = [
+                    pa.array(values if convert is None else [None if v is None else convert(v) for v in values],
+                             type=field.type)
+                    for (field, convert), values in zip(columns, zip(*rows))
+                ]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+        writer.close()  # writes the footer: a valid file even without rows
+        writer = None
+        yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def parquet_available() -> bool:
+    return pq is not None
+
+
+EXPORT_FORMATS = {
+    "csv":     ("text/csv", stream_csv),
+    "parquet": ("application/vnd.apache.parquet", stream_parquet),
+}
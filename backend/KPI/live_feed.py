@@ -0,0 +1,442 @@
+import os
+import json
+import time
+import select
+import asyncio
+import threading
+from collections import deque
+from datetime import date, datetime
+from typing import Optional, List, Dict, Any, Tuple
+
+from sqlalchemy import text
+from DB.connector import get_engine
+from KPI.utils.time_utils import get_date_ranges
+
+# ─── Settings ─────────────────────────────────────────────────────────
+LIVE_MODE           = os.getenv("LIVE_MODE", "notify")          # notify | poll
+LIVE_CHANNEL        = os.getenv("LIVE_CHANNEL", "live_transactions_insert")
+LIVE_POLL_SECONDS   = float(os.getenv("LIVE_POLL_SECONDS", "5"))
+LIVE_RETRY_SECONDS  = float(os.getenv("LIVE_RETRY_SECONDS", "5"))
+LIVE_FETCH_LIMIT    = int(os.getenv("LIVE_FETCH_LIMIT", "5000"))
+LIVE_QUEUE_SIZE     = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+LIVE_ACTIVITY_SIZE  = 20
+# ids are handed out at INSERT but become visible at COMMIT, so a row can
+# appear below the watermark; missing ids this close to it are re-read
+LIVE_GAP_IDS        = int(os.getenv("LIVE_GAP_IDS", "1000"))
+LIVE_GAP_SECONDS    = float(os.getenv("LIVE_GAP_SECONDS", "60"))
+
+# windows that end "now", so new rows can be folded in incrementally
+LIVE_FILTERS = ("Today", "MTD", "YTD")
+LIVE_PAGES   = ("dashboard", "activity")
+
+# statement-level trigger: one NOTIFY per insert statement, however many rows
+NOTIFY_TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION notify_live_transactions() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{LIVE_CHANNEL}', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS live_transactions_notify ON live_transactions;
+CREATE TRIGGER live_transactions_notify
+    AFTER INSERT ON live_transactions
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_live_transactions();
+"""
+
+_NEW_ROWS_SQL = """
+    SELECT t.id,
+           t.created_at,
+           t.usd_value::float          AS usd_value,
+           t.fraud,
+           t.payment_successful,
+           t.transaction_currency,
+           t.credit_card_type,
+           a.name                      AS acquirer
+      FROM live_transactions t
+      LEFT JOIN acquirer a ON t.acquirer_id = a.id
+     WHERE t.id > :wm
+        OR t.id = ANY(CAST(:gaps AS bigint[]))
+     ORDER BY t.id
+     LIMIT :lim
+"""
+
+
+def _as_day(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+# ─── Aggregates ───────────────────────────────────────────────────────
+class _Aggregate:
+    """
+    In-memory state for one (page, filter) pair, shared by every subscriber
+    of that pair. Seeded once from the database, then updated row by row.
+    """
+
+    def __init__(self, page: str, filter_type: str):
+        self.page = page
+        self.filter_type = filter_type
+        self.start: Optional[date] = None
+        self.state: Dict[str, Any] = {}
+
+    def current_start(self) -> date:
+        start, _, _, _ = get_date_ranges(self.filter_type, None)
+        return _as_day(start)
+
+    def seed(self, conn, watermark: int, gaps: List[int]) -> None:
+        # exactly the rows the feed has already seen: up to the watermark,
+        # minus the ids it is still waiting on
+        self.start = self.current_start()
+        params = {"s": self.start, "wm": watermark, "gaps": gaps}
+
+        if self.page == "activity":
+            rows = conn.execute(text("""
+                SELECT * FROM (
+                    SELECT t.id,
+                           t.created_at,
+                           t.usd_value::float          AS usd_value,
+                           t.fraud,
+                           t.payment_successful,
+                           t.transaction_currency,
+                           t.credit_card_type,
+                           a.name                      AS acquirer
+                      FROM live_transactions t
+                      LEFT JOIN acquirer a ON t.acquirer_id = a.id
+                     WHERE t.created_at::date >= :s
+                       AND t.id <= :wm
+                       AND t.id <> ALL(CAST(:gaps AS bigint[]))
+                     ORDER BY t.id DESC
+                     LIMIT :lim
+                ) r
+                ORDER BY id
+            """), {**params, "lim": LIVE_ACTIVITY_SIZE}).mappings().all()
+            self.state = {"events": deque((_activity_event(r) for r in rows), maxlen=LIVE_ACTIVITY_SIZE)}
+            return
+
+        totals = conn.execute(text("""
+            SELECT COUNT(*)::float                                  AS count,
+                   COALESCE(SUM(usd_value), 0)::float               AS volume,
+                   COUNT(*) FILTER (WHERE fraud)::float             AS fraud_count,
+                   COUNT(*) FILTER (WHERE payment_successful)::float AS success_count
+              FROM live_transactions
+             WHERE created_at::date >= :s
+               AND id <= :wm
+               AND id <> ALL(CAST(:gaps AS bigint[]))
+        """), params).mappings().first()
+
+        def grouped(expr: str, agg: str, join: str = "") -> Dict[str, float]:
+            rows = conn.execute(text(f"""
+                SELECT {expr} AS name, {agg}::float AS val
+                  FROM live_transactions t
+                  {join}
+                 WHERE t.created_at::date >= :s
+                   AND t.id <= :wm
+                   AND t.id <> ALL(CAST(:gaps AS bigint[]))
+                 GROUP BY {expr}
+            """), params).mappings().all()
+            return {r["name"]: r["val"] for r in rows}
+
+        self.state = {
+            "totals":       dict(totals),
+            "by_currency":  grouped("t.transaction_currency", "COALESCE(SUM(t.usd_value), 0)"),
+            "by_card_type": grouped("t.credit_card_type", "COUNT(*)"),
+            "by_acquirer":  grouped("a.name", "COUNT(*)", "JOIN acquirer a ON t.acquirer_id = a.id"),
+        }
+
+    def apply(self, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Folds new rows into the state and returns the delta, or None when
+        none of the rows fall inside this aggregate's window.
+        """
+        rows = [r for r in rows if _as_day(r["created_at"]) >= self.start]
+        if not rows:
+            return None
+
+        if self.page == "activity":
+            events = [_activity_event(r) for r in rows]
+            self.state["events"].extend(events)
+            return {"events": events[-LIVE_ACTIVITY_SIZE:]}
+
+        delta: Dict[str, Any] = {
+            "totals":       {"count": 0.0, "volume": 0.0, "fraud_count": 0.0, "success_count": 0.0},
+            "by_currency":  {},
+            "by_card_type": {},
+            "by_acquirer":  {},
+        }
+        for r in rows:
+            usd = r["usd_value"] or 0.0
+            d = delta["totals"]
+            d["count"] += 1
+            d["volume"] += usd
+            d["fraud_count"] += 1 if r["fraud"] else 0
+            d["success_count"] += 1 if r["payment_successful"] else 0
+            _bump(delta["by_currency"], r["transaction_currency"], usd)
+            _bump(delta["by_card_type"], r["credit_card_type"], 1)
+            if r["acquirer"] is not None:
+                _bump(delta["by_acquirer"], r["acquirer"], 1)
+
+        for key, values in delta.items():
+            for name, inc in values.items():
+                _bump(self.state[key], name, inc)
+        return delta
+
+    def snapshot(self) -> Dict[str, Any]:
+        if self.page == "activity":
+            return {"events": list(self.state["events"])}
+        t = self.state["totals"]
+        count = t["count"] or 0.0
+        return {
+            **{k: dict(v) for k, v in self.state.items()},
+            "derived": {
+                "avg_value":    round(t["volume"] / count, 2) if count else 0.0,
+                "fraud_rate":   round(t["fraud_count"] / count * 100, 2) if count else 0.0,
+                "success_rate": round(t["success_count"] / count * 100, 2) if count else 0.0,
+            },
+        }
+
+
+def _bump(bucket: Dict[str, float], key, inc: float) -> None:
+    bucket[key] = bucket.get(key, 0.0) + inc
+
+
+def _activity_event(r) -> Dict[str, Any]:
+    kind = "alert" if r["fraud"] else ("transaction" if r["payment_successful"] else "decline")
+    return {
+        "time":    r["created_at"].isoformat() if isinstance(r["created_at"], (date, datetime)) else r["created_at"],
+        "type":    kind,
+        "message": f"{r['transaction_currency']} {round(r['usd_value'] or 0.0, 2)} USD "
+                   f"via {r['acquirer'] or 'unknown acquirer'} ({r['credit_card_type']})",
+    }
+
+
+# ─── Feed ─────────────────────────────────────────────────────────────
+class LiveFeed:
+    """
+    One database listener per process. New live_transactions rows are read
+    once (everything above the id watermark, plus ids below it that were
+    still uncommitted last time), applied to each shared aggregate and
+    fanned out to the subscribers' asyncio queues.
+
+    Seeding runs on its own connection without the lock; rows drained
+    while a seed is in flight are buffered and replayed before the new
+    aggregate is installed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._watermark: Optional[int] = None
+        self._gaps: Dict[int, float] = {}          # id -> monotonic time it went missing
+        self._aggregates: Dict[Tuple[str, str], _Aggregate] = {}
+        self._subscribers: Dict[Tuple[str, str], Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._backlog: Dict[int, List[List[Dict[str, Any]]]] = {}   # seed token -> batches drained meanwhile
+        self._next_id = 0
+
+    # ─── subscriber side (called from a threadpool worker) ─────────
+    def subscribe(self, page: str, filter_type: str,
+                  loop: asyncio.AbstractEventLoop) -> Tuple[int, asyncio.Queue, Dict[str, Any]]:
+        if page not in LIVE_PAGES:
+            raise ValueError(f"Unsupported live page '{page}'")
+        if filter_type not in LIVE_FILTERS:
+            raise ValueError(f"Live updates are only available for {', '.join(LIVE_FILTERS)}")
+
+        key = (page, filter_type)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        with self._lock:
+            agg = self._aggregates.get(key)
+            if agg is not None:
+                return self._register(key, loop, queue) + (agg.snapshot(),)
+
+        if self._watermark is None:
+            watermark = self._current_max_id()
+            with self._lock:
+                if self._watermark is None:
+                    self._watermark = watermark
+
+        fresh, token = self._seed(page, filter_type)
+        with self._lock:
+            self._catch_up(fresh, token)
+            # another subscriber may have installed the same aggregate meanwhile
+            agg = self._aggregates.setdefault(key, fresh)
+            sub_id, queue = self._register(key, loop, queue)
+            snapshot = agg.snapshot()
+
+        self._ensure_started()
+        return sub_id, queue, snapshot
+
+    def unsubscribe(self, page: str, filter_type: str, sub_id: int) -> None:
+        key = (page, filter_type)
+        with self._lock:
+            subs = self._subscribers.get(key, {})
+            subs.pop(sub_id, None)
+            if not subs:
+                # nobody is watching: drop the state, it is re-seeded on demand
+                self._subscribers.pop(key, None)
+                self._aggregates.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode":        LIVE_MODE,
+                "running":     bool(self._thread and self._thread.is_alive()),
+                "watermark":   self._watermark,
+                "gaps":        len(self._gaps),
+                "seeding":     len(self._backlog),
+                "aggregates":  len(self._aggregates),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+            }
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # caller holds self._lock
+    def _register(self, key, loop, queue) -> Tuple[int, asyncio.Queue]:
+        self._next_id += 1
+        self._subscribers.setdefault(key, {})[self._next_id] = (loop, queue)
+        return self._next_id, queue
+
+    def _seed(self, page: str, filter_type: str) -> Tuple[_Aggregate, int]:
+        """
+        Seeds a new aggregate as of the current watermark, without holding
+        the lock. Returns it with the token whose backlog _catch_up replays.
+        """
+        with self._lock:
+            watermark, gaps = self._watermark, list(self._gaps)
+            self._next_id += 1
+            token = self._next_id
+            self._backlog[token] = []
+        agg = _Aggregate(page, filter_type)
+        try:
+            with get_engine().connect() as conn:
+                agg.seed(conn, watermark, gaps)
+        except Exception:
+            with self._lock:
+                self._backlog.pop(token, None)
+            raise
+        return agg, token
+
+    # caller holds self._lock
+    def _catch_up(self, agg: _Aggregate, token: int) -> None:
+        for rows in self._backlog.pop(token, []):
+            agg.apply(rows)
+
+    # ─── listener side (background thread) ─────────────────────────
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+            self._thread.start()
+
+    def _current_max_id(self) -> int:
+        with get_engine().connect() as conn:
+            return int(conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM live_transactions")).scalar() or 0)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if LIVE_MODE == "notify":
+                    self._listen()
+                else:
+                    while not self._stop.wait(LIVE_POLL_SECONDS):
+                        self._drain()
+            except Exception as e:
+                print("🔴 Live feed error:", e)
+                self._stop.wait(LIVE_RETRY_SECONDS)
+
+    def _listen(self) -> None:
+        raw = get_engine().raw_connection()
+        try:
+            pg = getattr(raw, "driver_connection", None) or raw.connection
+            pg.autocommit = True
+            with pg.cursor() as cur:
+                cur.execute(f"LISTEN {LIVE_CHANNEL}")
+            while not self._stop.is_set():
+                # the timeout doubles as a watermark poll, so a missed
+                # notification only delays an update by LIVE_POLL_SECONDS
+                select.select([pg], [], [], LIVE_POLL_SECONDS)
+                pg.poll()
+                pg.notifies.clear()
+                self._drain()
+            with pg.cursor() as cur:
+                cur.execute(f"UNLISTEN {LIVE_CHANNEL}")
+        finally:
+            raw.close()
+
+    def _drain(self) -> None:
+        with self._lock:
+            if not self._aggregates:
+                return
+            # window rolled over (midnight, new month/year): re-seed
+            rolled = [agg for agg in self._aggregates.values() if agg.current_start() != agg.start]
+        for old in rolled:
+            fresh, token = self._seed(old.page, old.filter_type)
+            with self._lock:
+                self._catch_up(fresh, token)
+                key = (old.page, old.filter_type)
+                if self._aggregates.get(key) is old:
+                    self._aggregates[key] = fresh
+                    self._publish(fresh, {"type": "snapshot", "data": fresh.snapshot()})
+
+        while True:
+            with self._lock:
+                watermark, gaps = self._watermark, list(self._gaps)
+            with get_engine().connect() as conn:
+                rows = [dict(r) for r in conn.execute(
+                    text(_NEW_ROWS_SQL), {"wm": watermark, "gaps": gaps, "lim": LIVE_FETCH_LIMIT}
+                ).mappings().all()]
+            with self._lock:
+                self._advance(watermark, rows)
+                if rows:
+                    for backlog in self._backlog.values():
+                        backlog.append(rows)
+                    for agg in self._aggregates.values():
+                        delta = agg.apply(rows)
+                        if delta is not None:
+                            self._publish(agg, {"type": "delta", "delta": delta, "data": agg.snapshot()})
+            if len(rows) < LIVE_FETCH_LIMIT:
+                return
+
+    # caller holds self._lock
+    def _advance(self, watermark: int, rows: List[Dict[str, Any]]) -> None:
+        """
+        Moves the watermark past the new rows and remembers the ids skipped
+        on the way (uncommitted or rolled back); those within LIVE_GAP_IDS
+        of the watermark are re-read for LIVE_GAP_SECONDS, then given up.
+        """
+        now = time.monotonic()
+        for r in rows:
+            self._gaps.pop(r["id"], None)
+        fresh = [r["id"] for r in rows if r["id"] > watermark]
+        if fresh:
+            seen = set(fresh)
+            for i in range(max(watermark + 1, fresh[-1] - LIVE_GAP_IDS), fresh[-1]):
+                if i not in seen:
+                    self._gaps[i] = now
+            self._watermark = fresh[-1]
+        floor = self._watermark - LIVE_GAP_IDS
+        self._gaps = {i: t for i, t in self._gaps.items() if i > floor and now - t < LIVE_GAP_SECONDS}
+
+    def _publish(self, agg: _Aggregate, message: Dict[str, Any]) -> None:
+        payload = json.dumps({"page": agg.page, "filter_type": agg.filter_type, **message}, default=str)
+        for loop, queue in self._subscribers.get((agg.page, agg.filter_type), {}).values():
+            loop.call_soon_threadsafe(_offer, queue, payload)
+
+
+def _offer(queue: asyncio.Queue, payload: str) -> None:
+    # a slow client loses its oldest pending message rather than stalling the feed
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(payload)
+
+
+live_feed = LiveFeed()
+
+
+if __name__ == "__main__":
+    # python -m KPI.live_feed  → installs the NOTIFY trigger on live_transactions
+    with get_engine().begin() as conn:
+        conn.exec_driver_sql(NOTIFY_TRIGGER_SQL)
+    print(f"Installed NOTIFY trigger on live_transactions (channel '{LIVE_CHANNEL}')")
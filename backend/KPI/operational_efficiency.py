@@ -1,111 +1,117 @@
 from datetime import date
-from sqlalchemy import text
 from DB.connector import get_engine
-from KPI.utils.time_utils import get_date_ranges, pct_diff, fetch_one
-from typing import Optional, Tuple
+from KPI.utils.time_utils import pct_diff, fetch_one
+from KPI.registry import kpi_unit, build_page
+from KPI.query_planner import run_grouped, planned_charts
+from typing import Optional, Tuple, Iterable
 
 engine = get_engine()
+PAGE = "operational"
+SCAN = f"{PAGE}.scan"
 
-def get_operational_efficiency_data(
-    filter_type: str = "YTD",
-    custom: Optional[Tuple[date, date]] = None
-) -> dict:
+
+# ─── Grouped scan ─────────────────────────────────────────────
+@kpi_unit(PAGE, "scan", "data")
+def _scan(ctx) -> dict:
+    # grand total, by acquirer and by card type in one GROUPING SETS pass
+    return run_grouped(ctx.conn, "window", planned_charts(PAGE, "window", ctx),
+                       {"s": ctx.start, "e": ctx.end})
+
+
+# ─── 1. Transaction Success Rate (%) ──────────────────────────
+@kpi_unit(PAGE, "success_rate", "metric", "Transaction Success Rate (%)", depends=[SCAN])
+def _success_rate(ctx) -> dict:
+    total_sql = """
+        SELECT COUNT(*)::float
+          FROM live_transactions t
+         WHERE t.created_at::date BETWEEN :s AND :e
     """
-    Returns operational efficiency KPI metrics and chart data based on the selected date range filter.
-    Uses live_transactions table for all lookups.
+    success_sql = """
+        SELECT COUNT(*)::float
+          FROM live_transactions t
+         WHERE t.created_at::date BETWEEN :s AND :e
+           AND t.payment_successful = true
     """
-    start, end, comp_start, comp_end = get_date_ranges(filter_type, custom)
-    metrics, charts = [], []
+    conn = ctx.conn
+    comp_start, comp_end = ctx.comp_start, ctx.comp_end
 
-    with engine.connect() as conn:
-        # ─── 1. Transaction Success Rate (%) ──────────────────────────
-        total_sql = """
-            SELECT COUNT(*)::float
-              FROM live_transactions t
-             WHERE t.created_at::date BETWEEN :s AND :e
-        """
-        success_sql = """
-            SELECT COUNT(*)::float
-              FROM live_transactions t
-             WHERE t.created_at::date BETWEEN :s AND :e
-               AND t.payment_successful = true
-        """
+    totals = ctx.get(SCAN)[f"{PAGE}.success_rate"]
+    curr_total   = float(totals[0]["txn_count"] if totals else 0) or 1
+    prev_total   = fetch_one(conn, total_sql,   {"s": comp_start, "e": comp_end}) or 1
+    curr_success = float(totals[0]["success_count"] if totals else 0)
+    prev_success = fetch_one(conn, success_sql, {"s": comp_start, "e": comp_end})
 
-        curr_total   = fetch_one(conn, total_sql,   {"s": start, "e": end}) or 1
-        prev_total   = fetch_one(conn, total_sql,   {"s": comp_start, "e": comp_end}) or 1
-        curr_success = fetch_one(conn, success_sql, {"s": start, "e": end})
-        prev_success = fetch_one(conn, success_sql, {"s": comp_start, "e": comp_end})
+    curr_rate = round(curr_success / curr_total * 100, 2)
+    prev_rate = round(prev_success / prev_total * 100, 2)
+    return {
+        "title": "Transaction Success Rate (%)",
+        "value": curr_rate,
+        "diff":  pct_diff(curr_rate, prev_rate)
+    }
 
-        curr_rate = round(curr_success / curr_total * 100, 2)
-        prev_rate = round(prev_success / prev_total * 100, 2)
-        metrics.append({
-            "title": "Transaction Success Rate (%)",
-            "value": curr_rate,
-            "diff":  pct_diff(curr_rate, prev_rate)
-        })
 
-        # ─── 2. Processing Partner Efficiency ─────────────────────────
-        rows = conn.execute(text("""
-            SELECT
-              a.name AS acquirer_name,
-              COUNT(*) FILTER (WHERE t.payment_successful = true)::float AS success_count,
-              COUNT(*)::float                               AS total_txns,
-              ROUND(COUNT(*) FILTER (WHERE t.payment_successful = true) * 100.0
-                    / NULLIF(COUNT(*), 0), 2)               AS success_rate
-            FROM live_transactions t
-            JOIN acquirer a ON t.acquirer_id = a.id
-            WHERE t.created_at::date BETWEEN :s AND :e
-            GROUP BY a.name
-        """), {"s": start, "e": end}).mappings().all()
+# ─── 2. Processing Partner Efficiency ─────────────────────────
+@kpi_unit(PAGE, "partner_efficiency", "chart", "Processing Partner Efficiency", depends=[SCAN])
+def _partner_efficiency(ctx) -> dict:
+    rows = [
+        {
+            "acquirer_name": r["acquirer_name"],
+            "total_txns":    float(r["txn_count"]),
+            "success_rate":  round(r["success_count"] * 100.0 / r["txn_count"], 2) if r["txn_count"] else None,
+        }
+        for r in ctx.get(SCAN)[f"{PAGE}.partner_efficiency"]
+    ]
 
-        charts.append({
-            "title": "Processing Partner Efficiency",
-            "type": "double_bar_dual_axis",
-            "x": [r["acquirer_name"] for r in rows],
-            "yAxis": [
-                {"name": "Success Rate (%)", "type": "value", "min": 0,   "max": 100,     "position": "left"},
-                {"name": "Total Transactions", "type": "value",            "position": "right"},
-            ],
-            "series": [
-                {
-                  "name": "Success Rate (%)",
-                  "type": "bar",
-                  "data": [r["success_rate"] for r in rows],
-                  "yAxisIndex": 0
-                },
-                {
-                  "name": "Total Transactions",
-                  "type": "bar",
-                  "data": [r["total_txns"] for r in rows],
-                  "yAxisIndex": 1
-                }
-            ]
-        })
+    return {
+        "title": "Processing Partner Efficiency",
+        "type": "double_bar_dual_axis",
+        "x": [r["acquirer_name"] for r in rows],
+        "yAxis": [
+            {"name": "Success Rate (%)", "type": "value", "min": 0,   "max": 100,     "position": "left"},
+            {"name": "Total Transactions", "type": "value",            "position": "right"},
+        ],
+        "series": [
+            {
+              "name": "Success Rate (%)",
+              "type": "bar",
+              "data": [r["success_rate"] for r in rows],
+              "yAxisIndex": 0
+            },
+            {
+              "name": "Total Transactions",
+              "type": "bar",
+              "data": [r["total_txns"] for r in rows],
+              "yAxisIndex": 1
+            }
+        ]
+    }
 
-        # ─── 3. Payment Method Distribution ───────────────────────────
-        rows = conn.execute(text("""
-            SELECT
-              t.credit_card_type AS credit_card_type,
-              COUNT(*) FILTER (WHERE t.funding_source = 'CREDIT')::float  AS credit_count,
-              COUNT(*) FILTER (WHERE t.funding_source = 'DEBIT')::float   AS debit_count,
-              COUNT(*) FILTER (WHERE t.funding_source = 'PREPAID')::float AS prepaid_count
-            FROM live_transactions t
-            WHERE t.created_at::date BETWEEN :s AND :e
-            GROUP BY t.credit_card_type
-        """), {"s": start, "e": end}).mappings().all()
 
-        charts.append({
-            "title": "Payment Method Distribution",
-            "type": "stacked_bar",
-            "x": [r["credit_card_type"] for r in rows],
-            "series": [
-                {"name": "Credit Funded", "data": [r["credit_count"]  for r in rows]},
-                {"name": "Debit Funded",  "data": [r["debit_count"]   for r in rows]},
-                {"name": "Prepaid Funded","data": [r["prepaid_count"] for r in rows]},
-            ]
-        })
+# ─── 3. Payment Method Distribution ───────────────────────────
+@kpi_unit(PAGE, "payment_methods", "chart", "Payment Method Distribution", depends=[SCAN])
+def _payment_methods(ctx) -> dict:
+    rows = ctx.get(SCAN)[f"{PAGE}.payment_methods"]
 
     return {
-        "metrics": metrics,
-        "charts":  charts
+        "title": "Payment Method Distribution",
+        "type": "stacked_bar",
+        "x": [r["credit_card_type"] for r in rows],
+        "series": [
+            {"name": "Credit Funded", "data": [r["credit_count"]  for r in rows]},
+            {"name": "Debit Funded",  "data": [r["debit_count"]   for r in rows]},
+            {"name": "Prepaid Funded","data": [r["prepaid_count"] for r in rows]},
+        ]
     }
+
+
+def get_operational_efficiency_data(
+    filter_type: str = "YTD",
+    custom: Optional[Tuple[date, date]] = None,
+    include: Optional[Iterable[str]] = None,
+) -> dict:
+    """
+    Returns operational efficiency KPI metrics and chart data based on the selected date range filter.
+    Uses live_transactions table for all lookups. `include` limits the payload
+    to the named units.
+    """
+    return build_page(PAGE, filter_type, custom, include)
@@ -0,0 +1,281 @@
+"""
+p50 / p90 / p99 of transaction values and gateway fees per acquirer,
+currency and region, over any window, from mergeable daily sketches.
+
+    python -m KPI.quantiles [--measure usd_value] [--dimension acquirer] [--filter YTD]
+
+The first run after `python -m DB.migrations up` backfills every day;
+the app's background refresher then keeps the sketches current (and
+does the backfill itself when the CLI was not run).
+"""
+import os
+import argparse
+import time
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from DB.connector import get_engine
+from DB.replicas import read_connection
+from KPI.utils.dimensions import dimensions
+from KPI.utils.time_utils import pct_diff, get_date_ranges
+from KPI.utils.quantile_sketch import QuantileSketch, bin_sql
+from KPI.utils.refresher import PeriodicRefresher
+
+QUANTILE_REFRESH_EVERY = float(os.getenv("QUANTILE_REFRESH_EVERY", "300"))  # s between background sketch refreshes
+QUANTILE_BACKFILL_DAYS = int(os.getenv("QUANTILE_BACKFILL_DAYS", "14"))      # days of history per backfill transaction
+QUANTILES              = (0.5, 0.9, 0.99)
+
+# ─── Sketches ─────────────────────────────────────────────────────────
+# kpi_sketch_daily (migration 7) holds one QuantileSketch per day, value
+# of each dimension below ("all" = every transaction) and measure. Any
+# window's percentiles merge its daily sketches, so YTD costs a few
+# thousand small arrays instead of sorting every transaction.
+SKETCH_DIMENSIONS = {
+    "all":      "''",
+    "acquirer": "t.acquirer_id::text",   # names from the dimension cache
+    "currency": "t.transaction_currency",
+    "region":   "t.region::text",
+}
+
+SKETCH_MEASURES = {
+    "usd_value":   {"title": "Transaction Value (USD)", "sql": "t.usd_value"},
+    "gateway_fee": {"title": "Gateway Fee (USD)",       "sql": "t.gateway_fee"},
+}
+
+
+def sketch_sql(where: str, dims: Sequence[str] = tuple(SKETCH_DIMENSIONS),
+               measures: Sequence[str] = tuple(SKETCH_MEASURES)) -> str:
+    """
+    One row per (day, dimension, value, measure) with its sketch parts,
+    over the transactions matching `where`.
+    """
+    dim_rows = ", ".join(f"('{d}', {SKETCH_DIMENSIONS[d]})" for d in dims)
+    measure_rows = ", ".join(f"('{m}', {SKETCH_MEASURES[m]['sql']}::float8)" for m in measures)
+    return f"""
+        WITH v AS (
+            SELECT t.created_at::date AS bucket, d.dimension, d.value, m.measure, m.x
+              FROM live_transactions t
+             CROSS JOIN LATERAL (VALUES {dim_rows}) AS d(dimension, value)
+             CROSS JOIN LATERAL (VALUES {measure_rows}) AS m(measure, x)
+             WHERE {where}
+               AND d.value IS NOT NULL AND m.x IS NOT NULL
+        ),
+        b AS (
+            SELECT bucket, dimension, value, measure,
+                   CASE WHEN x > 0 THEN {bin_sql('x')} END AS bin,
+                   COUNT(*) AS n, MIN(x) AS lo, MAX(x) AS hi
+              FROM v
+             GROUP BY 1, 2, 3, 4, 5
+        )
+        SELECT bucket, dimension, value, measure,
+               COALESCE(SUM(n) FILTER (WHERE bin IS NULL), 0)                         AS zeros,
+               COALESCE(array_agg(bin ORDER BY bin) FILTER (WHERE bin IS NOT NULL), '{{}}') AS bins,
+               COALESCE(array_agg(n ORDER BY bin) FILTER (WHERE bin IS NOT NULL), '{{}}')   AS counts,
+               MIN(lo) AS min_value, MAX(hi) AS max_value
+          FROM b
+         GROUP BY 1, 2, 3, 4
+    """
+
+
+_refresh_lock = threading.Lock()
+_ready: Optional[Tuple[float, bool]] = None   # (monotonic time, table filled)
+
+
+def refresh_sketches() -> Optional[int]:
+    """
+    Brings kpi_sketch_daily up to date on the primary: the days from the
+    day before the newest stored one onwards, or every day when the table
+    is empty, in transactions of QUANTILE_BACKFILL_DAYS days so an
+    interrupted backfill resumes where it stopped. Each holds an advisory
+    lock on the table, so one process refreshes at a time. Returns the
+    rows written, None if another process is refreshing. Raises
+    ProgrammingError if the table does not exist (migrations not applied).
+    """
+    global _ready
+    step = timedelta(days=QUANTILE_BACKFILL_DAYS)
+    written, since = 0, None
+    with _refresh_lock:
+        while True:
+            with get_engine().begin() as conn:
+                if not conn.execute(text("SELECT pg_try_advisory_xact_lock(hashtext('kpi_sketch_daily'))")).scalar():
+                    return written if since is not None else None
+                if since is None:
+                    newest = conn.execute(text("SELECT MAX(bucket) FROM kpi_sketch_daily")).scalar()
+                    since = newest - timedelta(days=1) if newest is not None else conn.execute(
+                        text("SELECT MIN(created_at::date) FROM live_transactions")).scalar()
+                    if since is None:
+                        return 0  # no transactions yet
+                until = since + step
+                last = until > date.today()
+                where = "t.created_at >= :since" + ("" if last else " AND t.created_at < :until")
+                result = conn.execute(text(f"""
+                    INSERT INTO kpi_sketch_daily AS k
+                           (bucket, dimension, value, measure, zeros, bins, counts, min_value, max_value)
+                    {sketch_sql(where)}
+                    ON CONFLICT (measure, dimension, bucket, value) DO UPDATE
+                       SET zeros        = EXCLUDED.zeros,
+                           bins         = EXCLUDED.bins,
+                           counts       = EXCLUDED.counts,
+                           min_value    = EXCLUDED.min_value,
+                           max_value    = EXCLUDED.max_value,
+                           refreshed_at = now()
+                """), {"since": since, "until": until})
+                written += result.rowcount
+            if last:
+                _ready = (time.monotonic(), True)
+                return written
+            since = until
+
+
+def sketches_ready() -> bool:
+    """
+    Whether kpi_sketch_daily exists and has been filled, probed at most
+    every QUANTILE_REFRESH_EVERY seconds per process. Requests read the
+    stored sketches when it is and sketch their window live otherwise.
+    """
+    global _ready
+    if _ready is not None and time.monotonic() - _ready[0] < QUANTILE_REFRESH_EVERY:
+        return _ready[1]
+    try:
+        with read_connection(history=True) as conn:
+            ready = bool(conn.execute(text("SELECT EXISTS (SELECT 1 FROM kpi_sketch_daily)")).scalar())
+    except ProgrammingError as e:
+        print("🔴 kpi_sketch_daily unavailable (python -m DB.migrations up), sketching live:",
+              str(e.orig).splitlines()[0])
+        ready = False
+    _ready = (time.monotonic(), ready)
+    return ready
+
+
+sketch_refresher = PeriodicRefresher("quantile-sketches", {"kpi_sketch_daily": refresh_sketches},
+                                     QUANTILE_REFRESH_EVERY)
+
+
+def sketch_stats() -> Dict[str, Any]:
+    return sketch_refresher.stats()
+
+
+def fetch_sketches(conn, measure: str, dimension: str, start: date, end: date) -> Dict[str, QuantileSketch]:
+    """
+    {dimension value: sketch of `measure` from start to end}, merged from
+    the stored daily sketches (or built from live_transactions while the
+    table is missing or not yet backfilled).
+    """
+    if measure not in SKETCH_MEASURES:
+        raise ValueError(f"Unknown measure {measure}; choose from {', '.join(SKETCH_MEASURES)}")
+    if dimension not in SKETCH_DIMENSIONS:
+        raise ValueError(f"Unknown dimension {dimension}; choose from {', '.join(SKETCH_DIMENSIONS)}")
+    params = {"s": start, "e": end, "m": measure, "d": dimension}
+    if sketches_ready():
+        sql = """
+            SELECT value, zeros, bins, counts, min_value, max_value
+              FROM kpi_sketch_daily
+             WHERE measure = :m AND dimension = :d AND bucket BETWEEN :s AND :e
+        """
+    else:
+        sql = sketch_sql("t.created_at::date BETWEEN :s AND :e", [dimension], [measure])
+    parts: Dict[str, List[QuantileSketch]] = defaultdict(list)
+    for r in conn.execute(text(sql), params).mappings():
+        parts[r["value"]].append(QuantileSketch(r["bins"], r["counts"], r["zeros"], r["min_value"], r["max_value"]))
+    return {value: QuantileSketch.merge_all(sketches) for value, sketches in parts.items()}
+
+
+def _label(key: float) -> str:
+    return f"p{key * 100:g}"
+
+
+def percentiles(conn, measure: str, dimension: str, start: date, end: date,
+                qs: Sequence[float] = QUANTILES) -> List[Dict[str, Any]]:
+    """
+    [{"name", "count", "p50", "p90", "p99"}, ...] per dimension value,
+    largest count first.
+    """
+    sketches = fetch_sketches(conn, measure, dimension, start, end)
+    names = {value: value for value in sketches}
+    if dimension == "acquirer":
+        by_id = dimensions.acquirer_names(sketches)
+        names = {value: by_id.get(int(value)) or value for value in sketches}
+    rows = [
+        {
+            "name":  names[value],
+            "count": sketch.count,
+            **{_label(q): round(v, 2) if v is not None else None for q, v in zip(qs, sketch.quantiles(qs))},
+        }
+        for value, sketch in sketches.items()
+    ]
+    return sorted(rows, key=lambda r: (-r["count"], str(r["name"])))
+
+
+def percentile_chart(conn, measure: str, dimension: str, start: date, end: date, title: str) -> Dict[str, Any]:
+    """
+    Grouped bar chart of the QUANTILES of `measure` per dimension value.
+    """
+    rows = percentiles(conn, measure, dimension, start, end)
+    return {
+        "title":  title,
+        "type":   "bar",
+        "x":      [r["name"] for r in rows],
+        "series": [{"name": _label(q), "data": [r[_label(q)] for r in rows]} for q in QUANTILES],
+        "counts": [r["count"] for r in rows],
+    }
+
+
+def percentile_metrics(conn, measure: str, start: date, end: date,
+                       comp_start: date, comp_end: date, title: str) -> List[Dict[str, Any]]:
+    """
+    One metric per QUANTILES over every transaction, with its change
+    against the comparison window.
+    """
+    curr = fetch_sketches(conn, measure, "all", start, end).get("", QuantileSketch())
+    prev = fetch_sketches(conn, measure, "all", comp_start, comp_end).get("", QuantileSketch())
+    out = []
+    for q, c, p in zip(QUANTILES, curr.quantiles(QUANTILES), prev.quantiles(QUANTILES)):
+        out.append({
+            "title": f"{title} {_label(q)}",
+            "value": round(c, 2) if c is not None else None,
+            "diff":  pct_diff(c, p) if c is not None else None,
+        })
+    return out
+
+
+def quantile_options() -> Dict[str, Any]:
+    return {
+        "measures":   [{"measure": key, "title": cfg["title"]} for key, cfg in SKETCH_MEASURES.items()],
+        "dimensions": list(SKETCH_DIMENSIONS),
+        "quantiles":  [_label(q) for q in QUANTILES],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Refresh the daily quantile sketches and print percentiles")
+    parser.add_argument("--measure", choices=list(SKETCH_MEASURES), default="usd_value")
+    parser.add_argument("--dimension", choices=list(SKETCH_DIMENSIONS), default="all")
+    parser.add_argument("--filter", default="YTD", help="date filter (Weekly, MTD, YTD, ...)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        written = refresh_sketches()
+    except ProgrammingError as e:
+        print("🔴 No sketch table (python -m DB.migrations up), sketching live:", str(e.orig).splitlines()[0])
+    else:
+        if written is None:
+            print("🔵 kpi_sketch_daily is being refreshed by another process")
+        else:
+            print(f"🟢 {written} sketch row(s) written in {time.perf_counter() - started:.1f} s")
+    start, end, _, _ = get_date_ranges(args.filter, None)
+    with read_connection(args.filter) as conn:
+        rows = percentiles(conn, args.measure, args.dimension, start, end)
+    print(f"{args.measure} by {args.dimension}, {start} .. {end}")
+    for r in rows:
+        print(f"  {str(r['name'] or '(all)'):<12} n={r['count']:<8} "
+              + "  ".join(f"{_label(q)}={r[_label(q)]}" for q in QUANTILES))
+
+
+if __name__ == "__main__":
+    main()
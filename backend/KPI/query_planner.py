@@ -0,0 +1,136 @@
+from typing import List, Dict, Any, Iterable, Tuple
+
+from KPI.utils.time_utils import fetch_rows
+from KPI.utils.dimensions import dimensions
+from KPI.chart_configs import GROUPED_SCANS, GROUP_MEASURES, GROUPED_CHARTS
+
+
+def build_grouped_query(scan_key: str, chart_keys: Iterable[str]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Merges the given grouped charts (all on one scan) into a single
+    GROUPING SETS query. Returns the SQL plus the layout needed to split
+    the rows back out per chart.
+    """
+    scan = GROUPED_SCANS[scan_key]
+    defs = {key: GROUPED_CHARTS[key] for key in chart_keys}
+    for key, d in defs.items():
+        if d["scan"] != scan_key:
+            raise ValueError(f"{key} does not belong to scan {scan_key}")
+
+    # every distinct grouping expression becomes one output column g<i>
+    exprs: List[str] = []
+    for d in defs.values():
+        for expr in d["group_by"].values():
+            if expr not in exprs:
+                exprs.append(expr)
+    measures: List[str] = []
+    for d in defs.values():
+        for m in d["measures"]:
+            if m not in measures:
+                measures.append(m)
+
+    sets: List[Tuple[str, ...]] = []
+    for d in defs.values():
+        s = tuple(sorted(d["group_by"].values(), key=exprs.index))
+        if s not in sets:
+            sets.append(s)
+
+    select = [f"{expr} AS g{i}" for i, expr in enumerate(exprs)]
+    # GROUPING() sets bit (n-1-i) when exprs[i] is rolled up in a row
+    select.append(f"GROUPING({', '.join(exprs)}) AS gid" if exprs else "0 AS gid")
+    select += [f"{GROUP_MEASURES[m]} AS {m}" for m in measures]
+
+    # ranked charts get a ROW_NUMBER() per grouping set (and "within" group),
+    # so top-N cuts need no sorting in Python; groups dropped for a NULL
+    # label are ranked apart, so they take no rank from the kept ones
+    grouping = f"GROUPING({', '.join(exprs)})" if exprs else "0"
+    ranks: Dict[str, str] = {}
+    for key, d in defs.items():
+        rank = d.get("rank")
+        if rank is None:
+            continue
+        within = [d["group_by"][c] for c in rank.get("within", [])]
+        labels = [e for e in d["group_by"].values() if e not in within]
+        nulls = [f"({d['group_by'][c]} IS NULL)" for c in d.get("drop_null", [])]
+        ranks[key] = f"r{len(ranks)}"
+        select.append(
+            f"ROW_NUMBER() OVER (PARTITION BY {', '.join([grouping] + within + nulls)} "
+            f"ORDER BY {GROUP_MEASURES[rank['by']]} DESC, {', '.join(labels)}) AS {ranks[key]}"
+        )
+
+    sql = f"""
+        SELECT {', '.join(select)}
+          FROM {scan['from']}
+         WHERE {scan['where']}
+         GROUP BY GROUPING SETS ({', '.join('(' + ', '.join(s) + ')' for s in sets)})
+    """
+    layout = {
+        "exprs":  exprs,
+        "charts": {
+            key: {
+                "gid": sum(1 << (len(exprs) - 1 - i)
+                           for i, e in enumerate(exprs) if e not in d["group_by"].values()),
+                "columns":   {alias: f"g{exprs.index(e)}" for alias, e in d["group_by"].items()},
+                "measures":  d["measures"],
+                "drop_null": d.get("drop_null", []),
+                "rank":      ranks.get(key),
+            }
+            for key, d in defs.items()
+        },
+    }
+    return sql, layout
+
+
+def split_grouped_rows(rows: List[Dict[str, Any]], layout: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Routes each GROUPING SETS row to the charts whose grouping it matches.
+    """
+    out: Dict[str, List[Dict[str, Any]]] = {key: [] for key in layout["charts"]}
+    for row in rows:
+        for key, c in layout["charts"].items():
+            if row["gid"] != c["gid"]:
+                continue
+            rec = {alias: row[col] for alias, col in c["columns"].items()}
+            if any(rec[col] is None for col in c["drop_null"]):
+                continue
+            rec.update({m: row[m] for m in c["measures"]})
+            if c["rank"]:
+                rec["rank"] = row[c["rank"]]
+            out[key].append(rec)
+    return out
+
+
+def run_grouped(conn, scan_key: str, chart_keys: Iterable[str], params: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    One scan for all the given charts; returns {chart_key: rows}.
+    """
+    chart_keys = list(chart_keys)
+    if not chart_keys:
+        return {}
+    sql, layout = build_grouped_query(scan_key, chart_keys)
+    out = split_grouped_rows(fetch_rows(conn, sql, params), layout)
+    for key in chart_keys:
+        # grouped by id; the name comes from the dimension cache
+        for column, kind in GROUPED_CHARTS[key].get("names", {}).items():
+            if kind == "acquirer":
+                out[key] = dimensions.name_acquirers(out[key], id_column=column, name_column=column)
+    return out
+
+
+def planned_charts(page: str, scan_key: str, ctx=None) -> List[str]:
+    """
+    Keys of the grouped charts a page reads from the given scan. With a
+    KPIContext, only those whose consuming units were requested (falling
+    back to all of them when none were).
+    """
+    keys = [
+        key for key, d in GROUPED_CHARTS.items()
+        if key.startswith(f"{page}.") and d["scan"] == scan_key
+    ]
+    if ctx is None:
+        return keys
+    wanted = [
+        key for key in keys
+        if any(ctx.wants(u) for u in GROUPED_CHARTS[key].get("units", [key]))
+    ]
+    return wanted or keys
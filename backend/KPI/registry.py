@@ -0,0 +1,242 @@
+from contextlib import ExitStack
+from datetime import date
+from typing import Optional, Tuple, List, Dict, Any, Callable, Iterable
+
+from DB.replicas import read_connection, wants_replica
+from DB.cancellation import RequestAborted
+from KPI.utils.time_utils import get_date_ranges
+from KPI.utils.single_flight import coalesced
+from KPI.utils.shared_cache import cached, CACHE_KPI_TTL
+
+# ─── Unit registry ────────────────────────────────────────────────────
+# Every metric, chart and insight series on a page is registered as an
+# independently computable unit:
+#   key      "<page>.<name>", e.g. "financial.sales_by_currency"
+#   kind     "metric" | "chart" | "data"  (data units are never rendered on
+#            the page unless asked for; they back insights or other units)
+#   title    chart / metric title shown in the UI (used by insight lookups)
+#   depends  other unit keys whose results the unit reads via ctx.get()
+# Units are listed in registration order when a page is built.
+_UNITS: Dict[str, Dict[str, Any]] = {}
+
+UNIT_KINDS = ("metric", "chart", "data")
+
+
+def kpi_unit(
+    page: str,
+    name: str,
+    kind: str,
+    title: Optional[str] = None,
+    depends: Iterable[str] = (),
+):
+    """
+    Decorator registering fn(ctx) as unit "<page>.<name>".
+    """
+    if kind not in UNIT_KINDS:
+        raise ValueError(f"Unknown unit kind {kind}")
+
+    def deco(fn: Callable[["KPIContext"], Any]):
+        key = f"{page}.{name}"
+        _UNITS[key] = {
+            "key":     key,
+            "page":    page,
+            "name":    name,
+            "kind":    kind,
+            "title":   title,
+            "depends": tuple(depends),
+            "fn":      fn,
+        }
+        return fn
+    return deco
+
+
+def page_units(page: str) -> List[Dict[str, Any]]:
+    return [u for u in _UNITS.values() if u["page"] == page]
+
+
+def find_unit(page: str, title: str) -> Optional[Dict[str, Any]]:
+    """
+    Looks up the unit rendering the chart / metric with the given title.
+    """
+    return next((u for u in page_units(page) if u["title"] == title), None)
+
+
+# ─── Evaluation ───────────────────────────────────────────────────────
+class KPIContext:
+    """
+    One evaluation of a set of units: the resolved time windows, an open
+    connection and the results computed so far (each unit runs at most once).
+    limit / offset page the top-N charts that support it (None = all groups).
+    """
+
+    def __init__(self, conn, filter_type: Optional[str], custom: Optional[Tuple[date, date]],
+                 stack: Optional[ExitStack] = None, limit: Optional[int] = None, offset: int = 0):
+        self.conn = conn
+        self.limit = limit
+        self.offset = offset
+        self._stack = stack
+        self._history_conn = None
+        self.filter_type = filter_type
+        self.custom = custom
+        if filter_type is None:  # all-time pages
+            self.start = self.end = self.comp_start = self.comp_end = None
+        else:
+            self.start, self.end, self.comp_start, self.comp_end = get_date_ranges(filter_type, custom)
+        self.results: Dict[str, Any] = {}
+        self.requested: set = set()
+        self._running: set = set()
+
+    def request(self, keys: Iterable[str]) -> None:
+        """
+        Records the units (and, transitively, their dependencies) this
+        evaluation is going to compute, so shared units such as a grouped
+        scan can restrict themselves to what is actually needed.
+        """
+        stack = list(keys)
+        while stack:
+            key = stack.pop()
+            if key in self.requested or key not in _UNITS:
+                continue
+            self.requested.add(key)
+            stack.extend(_UNITS[key]["depends"])
+
+    def history_conn(self):
+        """
+        Connection for long look-back queries (e.g. 180-day baselines). On
+        pages served by the primary it is opened lazily on a replica, if any.
+        """
+        if self._history_conn is None:
+            if self._stack is None or wants_replica(self.filter_type):
+                self._history_conn = self.conn
+            else:
+                self._history_conn = self._stack.enter_context(read_connection(history=True))
+        return self._history_conn
+
+    def wants(self, key: str) -> bool:
+        return key in self.requested
+
+    def get(self, key: str) -> Any:
+        if key in self.results:
+            return self.results[key]
+        unit = _UNITS.get(key)
+        if unit is None:
+            raise ValueError(f"Unknown KPI unit {key}")
+        if key in self._running:
+            raise ValueError(f"Circular dependency at KPI unit {key}")
+        self._running.add(key)
+        try:
+            for dep in unit["depends"]:
+                self.get(dep)
+            self.results[key] = unit["fn"](self)
+        finally:
+            self._running.discard(key)
+        return self.results[key]
+
+
+@cached("kpi", CACHE_KPI_TTL)
+@coalesced("kpi")
+def compute_units(
+    keys: Iterable[str],
+    filter_type: Optional[str] = 'YTD',
+    custom: Optional[Tuple[date, date]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """
+    Computes the requested units (and their dependencies) on one
+    connection and returns {key: result} for the requested keys.
+    If the request is aborted, RequestAborted carries the units finished
+    so far in .partial.
+    """
+    keys = list(keys)
+    ctx = None
+    try:
+        with ExitStack() as stack:
+            conn = stack.enter_context(read_connection(filter_type))
+            ctx = KPIContext(conn, filter_type, custom, stack, limit, offset)
+            ctx.request(keys)
+            for key in keys:
+                ctx.get(key)
+    except RequestAborted as e:
+        done = ctx.results if ctx is not None else {}
+        raise RequestAborted(e.reason, {key: done[key] for key in keys if key in done}) from e
+    return {key: ctx.results[key] for key in keys}
+
+
+def resolve_include(page: str, include: Optional[Iterable[str]]) -> List[str]:
+    """
+    Maps an include= list of unit names to unit keys. With no list, every
+    metric and chart on the page is included (data units only on request).
+    """
+    units = page_units(page)
+    if not include:
+        return [u["key"] for u in units if u["kind"] != "data"]
+    by_name = {u["name"]: u["key"] for u in units}
+    unknown = [name for name in include if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown {page} units: {', '.join(unknown)}")
+    wanted = set(include)
+    return [u["key"] for u in units if u["name"] in wanted]
+
+
+def build_page(
+    page: str,
+    filter_type: Optional[str] = 'YTD',
+    custom: Optional[Tuple[date, date]] = None,
+    include: Optional[Iterable[str]] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """
+    Builds the {"metrics": [...], "charts": [...]} payload for a page from
+    its units. Units may return one item, a list of items or None.
+    Requested data units are returned under "insight_data".
+    If the request runs out of time the units finished so far are returned
+    with "partial": true and the names of the missing ones.
+    """
+    keys = resolve_include(page, include)
+    aborted = None
+    try:
+        results = compute_units(keys, filter_type, custom, limit, offset)
+    except RequestAborted as e:
+        results, aborted = e.partial, e.reason
+
+    payload: Dict[str, Any] = {"metrics": [], "charts": []}
+    insight_data: Dict[str, Any] = {}
+    for key in keys:
+        unit = _UNITS[key]
+        if key not in results:
+            continue
+        value = results[key]
+        if unit["kind"] == "data":
+            insight_data[unit["name"]] = value
+            continue
+        bucket = payload["metrics"] if unit["kind"] == "metric" else payload["charts"]
+        if isinstance(value, list):
+            bucket.extend(value)
+        elif value is not None:
+            bucket.append(value)
+    if insight_data:
+        payload["insight_data"] = insight_data
+    if aborted:
+        payload["partial"] = True
+        payload["missing"] = [_UNITS[key]["name"] for key in keys if key not in results]
+        payload["degraded_reason"] = aborted
+    return payload
+
+
+def degraded_fields(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The partial-response markers of a build_page payload, for endpoints
+    that re-shape it.
+    """
+    return {k: payload[k] for k in ("partial", "missing", "degraded_reason") if k in payload}
+
+
+def parse_include(include: Optional[str]) -> Optional[List[str]]:
+    """
+    Splits the comma-separated include= query parameter.
+    """
+    if not include:
+        return None
+    return [name.strip() for name in include.split(",") if name.strip()]
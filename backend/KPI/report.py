@@ -1,83 +1,73 @@
-from datetime import date
-from typing import Optional, Tuple
-from sqlalchemy import text
+from datetime import date, timedelta
+from typing import Optional, Tuple, Iterable
 from DB.connector import get_engine
-from KPI.utils.time_utils import get_date_ranges
-from KPI.utils.stat_tests import compare_to_historical_single_point
+from KPI.utils.time_utils import fetch_one, fetch_rows
+from KPI.utils.baseline import daily_baseline, compare_to_baseline
+from KPI.utils.dimensions import dimensions
+from KPI.registry import kpi_unit, build_page
 
 engine = get_engine()
+PAGE = "report"
 
-def get_gateway_fee_analysis(filter_type: str = 'YTD',
-                             custom: Optional[Tuple[date, date]] = None) -> dict:
-    """
-    Returns a bar chart showing gateway fee distribution by acquirer
-    from live_transactions within the selected time range, along with
-    statistical insight comparing yesterday's total fee to historical trend.
-    """
-    start, end, _, _ = get_date_ranges(filter_type, custom)
-    print(f"Gateway Fee Analysis: {start} to {end}")
-
-    charts = []
-    metrics = []
 
-    with engine.connect() as conn:
-        # ─── Chart: Gateway Fee Distribution by Acquirer ────────────────
-        rows = conn.execute(text("""
-            SELECT a.name AS acquirer,
-                   SUM(t.gateway_fee) AS total_gateway_fee,
-                   COUNT(*) AS txn_count
-              FROM live_transactions t
-              JOIN acquirer a ON t.acquirer_id = a.id
-             WHERE t.created_at::date BETWEEN :s AND :e
-             GROUP BY a.name
-             ORDER BY total_gateway_fee DESC
-        """), {'s': start, 'e': end}).mappings().all()
+# ─── Chart: Gateway Fee Distribution by Acquirer ────────────────
+@kpi_unit(PAGE, 'gateway_fee_distribution', 'chart', 'Gateway Fee Distribution')
+def _gateway_fee_distribution(ctx) -> dict:
+    rows = dimensions.name_acquirers(fetch_rows(ctx.conn, """
+        SELECT t.acquirer_id,
+               SUM(t.gateway_fee) AS total_gateway_fee,
+               COUNT(*) AS txn_count
+          FROM live_transactions t
+         WHERE t.created_at::date BETWEEN :s AND :e
+         GROUP BY t.acquirer_id
+         ORDER BY total_gateway_fee DESC
+    """, {'s': ctx.start, 'e': ctx.end}), name_column='acquirer')
 
-        chart_data = {
-            'title': 'Gateway Fee Distribution',
-            'type': 'bar',
-            'x': [r['acquirer'] for r in rows],
-            'y': [round(r['total_gateway_fee'], 2) for r in rows],
-            'series': [{
-                'name': 'Gateway Fee (USD)',
-                'data': [round(r['total_gateway_fee'], 2) for r in rows]
-            }]
-        }
-        charts.append(chart_data)
-
-        # ─── Metric: Gateway Fee Statistical Insight ────────────────────
-        hist_rows = conn.execute(text("""
-            SELECT created_at::date AS day,
-                   SUM(gateway_fee)::float AS total_fee
-              FROM live_transactions
-             WHERE created_at::date BETWEEN CURRENT_DATE - INTERVAL '8 days' AND CURRENT_DATE - INTERVAL '1 day'
-             GROUP BY created_at::date
-             ORDER BY day
-        """)).mappings().all()
-        hist_values = [r['total_fee'] for r in hist_rows]
-        hist_avg = sum(hist_values) / len(hist_values) if hist_values else 0
+    return {
+        'title': 'Gateway Fee Distribution',
+        'type': 'bar',
+        'x': [r['acquirer'] for r in rows],
+        'y': [round(r['total_gateway_fee'], 2) for r in rows],
+        'series': [{
+            'name': 'Gateway Fee (USD)',
+            'data': [round(r['total_gateway_fee'], 2) for r in rows]
+        }]
+    }
 
-        yesterday_val = conn.execute(text("""
-            SELECT SUM(gateway_fee)::float AS total_fee
-              FROM live_transactions
-             WHERE created_at::date = CURRENT_DATE - INTERVAL '1 day'
-        """)).scalar() or 0
 
-        comparison_result = compare_to_historical_single_point(yesterday_val, hist_values)
+# ─── Metric: Gateway Fee Statistical Insight ────────────────────
+@kpi_unit(PAGE, 'gateway_fee_stat', 'metric', 'Gateway Fee (Stat Insight)')
+def _gateway_fee_stat(ctx) -> dict:
+    yesterday_val = fetch_one(ctx.conn, """
+        SELECT SUM(gateway_fee)::float AS total_fee
+          FROM live_transactions
+         WHERE created_at::date = CURRENT_DATE - INTERVAL '1 day'
+    """, {})
 
-        metrics.append({
-    'title': 'Gateway Fee (Stat Insight)',
-    'value': round(yesterday_val, 2),
-    'insight': comparison_result['insight'],
-    'z_score': comparison_result['z_score'],
-    'p_value': comparison_result['p_value'],
-    'is_significant': bool(comparison_result['is_significant']),
-    'historical_avg': round(hist_avg, 2)
+    # weekday-aware baseline, fitted once a day (KPI/utils/baseline.py)
+    model = daily_baseline(PAGE, "SUM(gateway_fee)::float")
+    comparison_result = compare_to_baseline(model, yesterday_val, date.today() - timedelta(days=1),
+                                            label="gateway fee total")
+    hist_avg = comparison_result['mean'] or 0
 
-})
+    return {
+        'title': 'Gateway Fee (Stat Insight)',
+        'value': round(yesterday_val, 2),
+        'insight': comparison_result['insight'],
+        'z_score': comparison_result['z_score'],
+        'p_value': comparison_result['p_value'],
+        'is_significant': bool(comparison_result['is_significant']),
+        'historical_avg': round(hist_avg, 2)
+    }
 
 
-    return {
-        'metrics': metrics,
-        'charts': charts
-    }
\ No newline at end of file
+def get_gateway_fee_analysis(filter_type: str = 'YTD',
+                             custom: Optional[Tuple[date, date]] = None,
+                             include: Optional[Iterable[str]] = None) -> dict:
+    """
+    Returns a bar chart showing gateway fee distribution by acquirer
+    from live_transactions within the selected time range, along with
+    statistical insight comparing yesterday's total fee to historical trend.
+    `include` limits the payload to the named units.
+    """
+    return build_page(PAGE, filter_type, custom, include)
@@ -0,0 +1,246 @@
+import os
+import time
+import argparse
+import functools
+import threading
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple, Dict, Any, List
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from DB.connector import get_engine
+from DB.replicas import read_connection
+from KPI.utils.time_utils import get_date_ranges
+from KPI.utils.downsample import lttb
+from KPI.utils.refresher import PeriodicRefresher
+
+TREND_REFRESH_EVERY    = float(os.getenv("TREND_REFRESH_EVERY", "300"))    # s between background rollup refreshes
+TREND_BACKFILL_DAYS    = int(os.getenv("TREND_BACKFILL_DAYS", "31"))       # days of history per backfill transaction
+TREND_DEFAULT_POINTS   = int(os.getenv("TREND_DEFAULT_POINTS", "500"))
+TREND_MAX_POINTS       = int(os.getenv("TREND_MAX_POINTS", "5000"))
+TREND_HOURLY_MAX_DAYS  = int(os.getenv("TREND_HOURLY_MAX_DAYS", "31"))     # grain=auto: hourly up to this range
+
+# ─── Rollups ──────────────────────────────────────────────────────────
+# kpi_rollup_daily / kpi_rollup_hourly (migration 6) hold one row of
+# additive aggregates per bucket. They are written by a background
+# refresher (rollup_refresher, started with the app) or by
+# `python -m KPI.trends`, never by a request: the first run backfills all
+# history a month per transaction, later runs re-aggregate only the
+# buckets from shortly before the newest one onwards, so late rows are
+# picked up without rescanning history.
+GRAINS = {
+    "day":  {"table": "kpi_rollup_daily",  "bucket": "t.created_at::date",               "restate": timedelta(days=1)},
+    "hour": {"table": "kpi_rollup_hourly", "bucket": "date_trunc('hour', t.created_at)", "restate": timedelta(hours=2)},
+}
+
+ROLLUP_COLUMNS = """
+           COUNT(*)                                                   AS txn_count,
+           COALESCE(SUM(t.usd_value), 0)                              AS usd_sum,
+           COUNT(*) FILTER (WHERE t.payment_successful)               AS success_count,
+           COUNT(*) FILTER (WHERE t.fraud)                            AS fraud_count,
+           COALESCE(SUM((t.pricing_ic/100.0)*t.usd_value + t.gateway_fee), 0) AS fee_sum
+"""
+
+# ─── Trend metrics ────────────────────────────────────────────────────
+# value per bucket from the rollup columns; "fill" is the value of a
+# bucket without transactions (None = gap, skipped by the downsampler)
+TREND_METRICS = {
+    "revenue":      {"title": "Revenue (USD)",           "sql": "usd_sum::float",                                         "fill": 0.0},
+    "transactions": {"title": "Transactions",            "sql": "txn_count::float",                                       "fill": 0.0},
+    "avg_ticket":   {"title": "Average Transaction (USD)", "sql": "usd_sum::float / NULLIF(txn_count, 0)",                "fill": None},
+    "success_rate": {"title": "Success Rate (%)",        "sql": "success_count * 100.0 / NULLIF(txn_count, 0)",           "fill": None},
+    "fraud_rate":   {"title": "Fraud Rate (%)",          "sql": "fraud_count * 100.0 / NULLIF(txn_count, 0)",             "fill": None},
+    "fee_rate":     {"title": "Processing Fee (%)",      "sql": "fee_sum * 100.0 / NULLIF(usd_sum, 0)",                   "fill": None},
+}
+
+_refresh_lock = threading.Lock()
+_ready: Dict[str, Tuple[float, bool]] = {}  # grain -> (monotonic time, rollup filled)
+
+
+def _resume_from(conn, g: Dict[str, Any]) -> Optional[datetime]:
+    # shortly before the newest bucket, or the first day of history
+    newest = conn.execute(text(f"SELECT MAX(bucket)::timestamp FROM {g['table']}")).scalar()
+    if newest is not None:
+        return newest - g["restate"]
+    return conn.execute(text("SELECT MIN(created_at::date)::timestamp FROM live_transactions")).scalar()
+
+
+def refresh_rollup(grain: str) -> Optional[int]:
+    """
+    Brings the rollup of one grain up to date on the primary, in
+    transactions of TREND_BACKFILL_DAYS days so an interrupted backfill
+    resumes where it stopped. Each holds an advisory lock on the table,
+    so one process refreshes at a time. Returns the buckets written, None
+    if another process is refreshing. Raises ProgrammingError if the
+    rollup table does not exist (migrations not applied).
+    """
+    g = GRAINS[grain]
+    step = timedelta(days=TREND_BACKFILL_DAYS)
+    written, since = 0, None
+    with _refresh_lock:
+        while True:
+            with get_engine().begin() as conn:
+                if not conn.execute(text("SELECT pg_try_advisory_xact_lock(hashtext(:k))"),
+                                    {"k": g["table"]}).scalar():
+                    return written if since is not None else None
+                if since is None:
+                    since = _resume_from(conn, g)
+                    if since is None:
+                        return 0  # no transactions yet
+                until = since + step
+                last = until > datetime.now()
+                result = conn.execute(text(f"""
+                    INSERT INTO {g['table']} AS r
+                           (bucket, txn_count, usd_sum, success_count, fraud_count, fee_sum)
+                    SELECT {g['bucket']} AS bucket, {ROLLUP_COLUMNS}
+                      FROM live_transactions t
+                     WHERE t.created_at >= :since{"" if last else " AND t.created_at < :until"}
+                     GROUP BY 1
+                    ON CONFLICT (bucket) DO UPDATE
+                       SET txn_count     = EXCLUDED.txn_count,
+                           usd_sum       = EXCLUDED.usd_sum,
+                           success_count = EXCLUDED.success_count,
+                           fraud_count   = EXCLUDED.fraud_count,
+                           fee_sum       = EXCLUDED.fee_sum,
+                           refreshed_at  = now()
+                """), {"since": since, "until": until})
+                written += result.rowcount
+            if last:
+                _ready[grain] = (time.monotonic(), True)
+                return written
+            since = until
+
+
+def rollup_ready(grain: str) -> bool:
+    """
+    Whether the grain's rollup exists and has been filled, probed at most
+    every TREND_REFRESH_EVERY seconds per process. Requests read the
+    rollup when it is and aggregate their window live otherwise.
+    """
+    g = GRAINS[grain]
+    checked = _ready.get(grain)
+    if checked is not None and time.monotonic() - checked[0] < TREND_REFRESH_EVERY:
+        return checked[1]
+    try:
+        with read_connection(history=True) as conn:
+            ready = bool(conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {g['table']})")).scalar())
+    except ProgrammingError as e:
+        print(f"🔴 {g['table']} unavailable (python -m DB.migrations up), aggregating live:", str(e.orig).splitlines()[0])
+        ready = False
+    _ready[grain] = (time.monotonic(), ready)
+    return ready
+
+
+rollup_refresher = PeriodicRefresher(
+    "trend-rollups", {grain: functools.partial(refresh_rollup, grain) for grain in GRAINS}, TREND_REFRESH_EVERY,
+)
+
+
+def rollup_stats() -> Dict[str, Any]:
+    return rollup_refresher.stats()
+
+
+def _buckets(grain: str, start: datetime, end: datetime) -> List[datetime]:
+    step = timedelta(days=1) if grain == "day" else timedelta(hours=1)
+    out, b = [], start
+    while b <= end:
+        out.append(b)
+        b += step
+    return out
+
+
+def fetch_trend(
+    metric: str,
+    filter_type: str = "YTD",
+    custom: Optional[Tuple[date, date]] = None,
+    points: int = TREND_DEFAULT_POINTS,
+    grain: str = "auto",
+) -> Dict[str, Any]:
+    """
+    One metric over the filter's window, one value per day or hour, read
+    from the rollups (up to TREND_REFRESH_EVERY seconds behind live
+    transactions) and downsampled with LTTB to at most `points` points.
+    grain="auto" uses hours for windows up to TREND_HOURLY_MAX_DAYS days.
+    """
+    cfg = TREND_METRICS.get(metric)
+    if cfg is None:
+        raise ValueError(f"Unknown trend metric {metric}")
+    if not 3 <= points <= TREND_MAX_POINTS:
+        raise ValueError(f"points must be between 3 and {TREND_MAX_POINTS}")
+
+    start, end, _, _ = get_date_ranges(filter_type, custom)
+    start = start.date() if isinstance(start, datetime) else start
+    end = end.date() if isinstance(end, datetime) else end
+    if grain == "auto":
+        grain = "hour" if (end - start).days < TREND_HOURLY_MAX_DAYS else "day"
+    if grain not in GRAINS:
+        raise ValueError(f"Unknown grain {grain}")
+    g = GRAINS[grain]
+
+    if rollup_ready(grain):
+        source = g["table"]
+    else:
+        source = f"(SELECT {g['bucket']} AS bucket, {ROLLUP_COLUMNS} FROM live_transactions t " \
+                 f"WHERE t.created_at::date BETWEEN :s AND :e GROUP BY 1)"
+    sql = f"""
+        SELECT bucket, {cfg['sql']} AS value
+          FROM {source} r
+         WHERE bucket >= :s AND bucket < :e_excl
+         ORDER BY bucket
+    """
+    with read_connection(filter_type) as conn:
+        rows = conn.execute(text(sql), {"s": start, "e": end, "e_excl": end + timedelta(days=1)}).all()
+
+    # every bucket of the window, quiet ones filled (or left as gaps)
+    by_bucket = {
+        (datetime.combine(r[0], datetime.min.time()) if grain == "day" else r[0]): r[1] for r in rows
+    }
+    last = datetime.combine(end, datetime.min.time()) + (timedelta(hours=23) if grain == "hour" else timedelta(0))
+    if grain == "hour":
+        # don't pad hours that haven't happened yet
+        last = min(last, datetime.now().replace(minute=0, second=0, microsecond=0))
+    series = _buckets(grain, datetime.combine(start, datetime.min.time()), last)
+    valued = []
+    for b in series:
+        v = by_bucket.get(b, cfg["fill"])
+        if v is not None:
+            valued.append((b, float(v)))
+    keep = lttb([b.timestamp() for b, _ in valued], [v for _, v in valued], points)
+    sampled = [valued[i] for i in keep]
+
+    fmt = (lambda b: b.date().isoformat()) if grain == "day" else (lambda b: b.isoformat(timespec="minutes"))
+    return {
+        "metric":     metric,
+        "title":      cfg["title"],
+        "type":       "line",
+        "grain":      grain,
+        "start":      start,
+        "end":        end,
+        "raw_points": len(series),
+        "points":     len(sampled),
+        "x":          [fmt(b) for b, _ in sampled],
+        "y":          [round(v, 4) for _, v in sampled],
+    }
+
+
+def trend_metrics() -> List[Dict[str, str]]:
+    return [{"metric": key, "title": cfg["title"]} for key, cfg in TREND_METRICS.items()]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Backfill / refresh the trend rollups")
+    parser.add_argument("--grain", choices=list(GRAINS), default=None, help="one grain (default: all)")
+    args = parser.parse_args(argv)
+
+    for grain in [args.grain] if args.grain else GRAINS:
+        started = time.perf_counter()
+        written = refresh_rollup(grain)
+        if written is None:
+            print(f"🔵 {GRAINS[grain]['table']} is being refreshed by another process")
+        else:
+            print(f"🟢 {GRAINS[grain]['table']}: {written} bucket(s) written in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from DB.replicas import read_connection
+from KPI.utils.single_flight import single_flight
+from KPI.utils.stat_tests import compare_to_expected
+
+# ─── Settings ─────────────────────────────────────────────────────────
+BASELINE_HISTORY_DAYS = int(os.getenv("BASELINE_HISTORY_DAYS", "182"))  # 26 weeks
+BASELINE_MIN_SAMPLES  = int(os.getenv("BASELINE_MIN_SAMPLES", "3"))     # per weekday, else pooled
+BASELINE_KEEP_FILES   = int(os.getenv("BASELINE_KEEP_FILES", "7"))      # days of fits kept on disk
+BASELINE_CACHE_DIR    = Path(os.getenv(
+    "BASELINE_CACHE_DIR", Path(__file__).resolve().parents[2] / ".cache" / "baselines"
+))
+
+# ─── Model ────────────────────────────────────────────────────────────
+# A baseline is a plain (JSON-serialisable) dict:
+#   {"fitted_on": "2024-05-02", "n": 180,
+#    "pooled": {"mean", "std", "n"},
+#    "dow":    {"0": {"mean", "std", "n"}, ... "6": {...}}}   # Monday = 0
+# Each weekday has its own expected value; its spread is the weekday's
+# own when it has BASELINE_MIN_SAMPLES days, else the pooled spread of
+# the residuals around every weekday's mean. Weekends thus stop being
+# flagged just for being weekends.
+
+
+def fit_day_of_week(days: Dict[date, float], fitted_on: date) -> Dict[str, Any]:
+    """
+    Fits a weekday-aware expected value and spread to one daily series.
+    """
+    if not days:
+        return {"fitted_on": fitted_on.isoformat(), "n": 0, "pooled": None, "dow": {}}
+    dows = np.array([d.weekday() for d in days])
+    vals = np.array(list(days.values()), dtype=float)
+    means = {d: float(vals[dows == d].mean()) for d in set(dows.tolist())}
+    residuals = vals - np.array([means[d] for d in dows])
+    dof = max(len(vals) - len(means), 1)
+    pooled_std = float(np.sqrt((residuals ** 2).sum() / dof))
+
+    model = {
+        "fitted_on": fitted_on.isoformat(),
+        "n":         int(len(vals)),
+        "pooled":    {"mean": float(vals.mean()), "std": pooled_std, "n": int(len(vals))},
+        "dow":       {},
+    }
+    for d, mean in means.items():
+        sample = vals[dows == d]
+        if len(sample) >= BASELINE_MIN_SAMPLES:
+            model["dow"][str(d)] = {"mean": mean, "std": float(sample.std(ddof=1)), "n": int(len(sample))}
+        else:
+            # too few days for its own spread: keep its mean, borrow the pooled spread
+            model["dow"][str(d)] = {"mean": mean, "std": pooled_std, "n": int(len(vals))}
+    return model
+
+
+def expected(model: Dict[str, Any], day: date) -> Optional[Dict[str, Any]]:
+    """
+    {"mean", "std", "n"} expected for the given day, or None without history.
+    A weekday never seen in the history falls back to the all-days mean.
+    """
+    if not model or not model.get("pooled"):
+        return None
+    return model["dow"].get(str(day.weekday()), model["pooled"])
+
+
+def compare_to_baseline(model: Dict[str, Any], value: float, day: date,
+                        label: str = "payment method diversity") -> dict:
+    """
+    compare_to_historical_single_point against the fitted baseline: O(1),
+    no history is read. Same result shape, plus the expected value used.
+    """
+    exp = expected(model, day)
+    if exp is None or exp["n"] < 2:
+        return {
+            "z_score": None,
+            "p_value": None,
+            "mean": None,
+            "std": None,
+            "is_significant": False,
+            "insight": "Not enough valid historical data to compare."
+        }
+    return compare_to_expected(value, exp["mean"], exp["std"], exp["n"], label=label)
+
+
+# ─── Store ────────────────────────────────────────────────────────────
+class BaselineStore:
+    """
+    Baselines fitted today, in memory and in one JSON file per day under
+    BASELINE_CACHE_DIR (so restarts and other workers skip the refit).
+    A baseline is fitted at most once per day and key; concurrent first
+    requests share one fit.
+    """
+
+    def __init__(self, directory: Path = BASELINE_CACHE_DIR):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._day: Optional[date] = None
+        self._models: Dict[str, Any] = {}
+        self.fits = 0
+        self.hits = 0
+
+    def _path(self, day: date) -> Path:
+        return self.directory / f"baselines-{day.isoformat()}.json"
+
+    def _roll(self, today: date) -> None:
+        # called with the lock held: a new day starts from that day's file
+        if self._day == today:
+            return
+        self._day = today
+        self._models = {}
+        try:
+            self._models = json.loads(self._path(today).read_text())
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print("🔴 Baseline cache unreadable, refitting:", e)
+
+    def _save(self, today: date) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self._path(today)
+            try:
+                # keep what other workers fitted today
+                self._models = {**json.loads(path.read_text()), **self._models}
+            except (FileNotFoundError, ValueError):
+                pass
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._models))
+            tmp.replace(path)
+            for old in sorted(self.directory.glob("baselines-*.json"))[:-BASELINE_KEEP_FILES]:
+                old.unlink(missing_ok=True)
+        except OSError as e:
+            print("🔴 Baseline cache not written:", e)
+
+    def get(self, key: str, fit) -> Any:
+        today = date.today()
+        with self._lock:
+            self._roll(today)
+            if key in self._models:
+                self.hits += 1
+                return self._models[key]
+
+        def run():
+            model = fit(today)
+            with self._lock:
+                self._roll(today)
+                self._models[key] = model
+                self.fits += 1
+                self._save(today)
+            return model
+        return single_flight("baseline").do((key, today), run, label=key.split("|")[0])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"day": self._day, "models": len(self._models), "fits": self.fits, "hits": self.hits}
+
+
+baselines = BaselineStore()
+
+
+def daily_baseline(
+    name: str,
+    agg_sql: str,
+    where: str = "",
+    params: Optional[Dict[str, Any]] = None,
+    dimension: Optional[str] = None,
+    as_of: Optional[date] = None,
+) -> Dict[str, Any]:
+    """
+    Baseline of the daily series SELECT {agg_sql} FROM live_transactions
+    [WHERE {where}] over the BASELINE_HISTORY_DAYS days before `as_of`
+    (default today). With a dimension, one baseline per dimension value:
+    {str(value): model}. The history query runs once a day per key (on a
+    replica if any).
+    """
+    params = params or {}
+    digest = hashlib.sha1(json.dumps([agg_sql, where, params, dimension], default=str).encode()).hexdigest()[:12]
+    key = f"{name}|{dimension or ''}|{digest}" + (f"|{as_of.isoformat()}" if as_of else "")
+
+    def fit(today: date):
+        ref = as_of or today
+        dim_col = f", {dimension} AS dim" if dimension else ""
+        sql = f"""
+            SELECT created_at::date AS day{dim_col}, {agg_sql} AS val
+              FROM live_transactions t
+             WHERE created_at::date BETWEEN :hs AND :he
+               {f'AND {where}' if where else ''}
+             GROUP BY 1{', 2' if dimension else ''}
+        """
+        with read_connection(history=True) as conn:
+            rows = conn.execute(text(sql), {
+                **params,
+                "hs": ref - timedelta(days=BASELINE_HISTORY_DAYS),
+                "he": ref - timedelta(days=1),
+            }).mappings().all()
+
+        if not dimension:
+            return fit_day_of_week({r["day"]: float(r["val"]) for r in rows if r["val"] is not None}, ref)
+        series: Dict[str, Dict[date, float]] = {}
+        for r in rows:
+            if r["val"] is not None:
+                series.setdefault(str(r["dim"]), {})[r["day"]] = float(r["val"])
+        return {value: fit_day_of_week(days, ref) for value, days in series.items()}
+
+    return baselines.get(key, fit)
+
+
+def baseline_stats() -> Dict[str, Any]:
+    return baselines.stats()
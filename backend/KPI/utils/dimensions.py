@@ -0,0 +1,240 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+
+from DB.replicas import read_connection
+from KPI.utils.single_flight import single_flight
+
+DIMENSION_REFRESH     = float(os.getenv("DIMENSION_REFRESH", "3600"))    # s between full reloads
+DIMENSION_CHECK_EVERY = float(os.getenv("DIMENSION_CHECK_EVERY", "60"))  # s between change probes
+DIMENSION_MISS_RELOAD = float(os.getenv("DIMENSION_MISS_RELOAD", "10"))  # min s between acquirer reloads on an unknown id
+
+# ─── Snapshot ─────────────────────────────────────────────────────────
+# Small, slow-changing lookup data KPI queries used to join or query on
+# every request: acquirer names by id, merchant counts, the region_enum
+# labels (in enum order), and the currencies / card types seen in
+# live_transactions. Queries group by the integer id and map it to the
+# name in Python with the snapshot.
+
+# cheap probe: any change here triggers a reload before DIMENSION_REFRESH
+FINGERPRINT_SQL = """
+    SELECT (SELECT md5(COALESCE(string_agg(id || ':' || name, ',' ORDER BY id), '')) FROM acquirer) AS acquirers,
+           (SELECT COUNT(*) FROM merchant)                                            AS merchants,
+           (SELECT MAX(id) FROM merchant)                                             AS max_merchant,
+           enum_range(NULL::region_enum)::text                                        AS regions
+"""
+
+
+class DimensionSnapshot:
+    """
+    One load of the dimension tables; never mutated once built.
+    """
+
+    def __init__(self, acquirers: Dict[int, str], merchants: int, merchant_countries: int,
+                 regions: List[str], currencies: List[str], card_types: List[str], fingerprint: tuple):
+        self.acquirers = acquirers
+        self.merchants = merchants
+        self.merchant_countries = merchant_countries
+        self.regions = regions
+        self.currencies = currencies
+        self.card_types = card_types
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+
+
+def _fingerprint(conn) -> tuple:
+    return tuple(conn.execute(text(FINGERPRINT_SQL)).one())
+
+
+def _load_acquirers(conn) -> Dict[int, str]:
+    return {r.id: r.name for r in conn.execute(text("SELECT id, name FROM acquirer ORDER BY id"))}
+
+
+def load_dimensions() -> DimensionSnapshot:
+    with read_connection(history=True) as conn:
+        fingerprint = _fingerprint(conn)
+        acquirers = _load_acquirers(conn)
+        merchants, countries = conn.execute(text(
+            "SELECT COUNT(*), COUNT(DISTINCT country) FROM merchant"
+        )).one()
+        regions = list(conn.execute(text("SELECT unnest(enum_range(NULL::region_enum))::text")).scalars())
+        currencies = list(conn.execute(text("""
+            SELECT DISTINCT transaction_currency FROM live_transactions
+             WHERE transaction_currency IS NOT NULL ORDER BY 1
+        """)).scalars())
+        card_types = list(conn.execute(text("""
+            SELECT DISTINCT credit_card_type FROM live_transactions
+             WHERE credit_card_type IS NOT NULL ORDER BY 1
+        """)).scalars())
+    return DimensionSnapshot(acquirers, int(merchants), int(countries), regions,
+                             currencies, card_types, fingerprint)
+
+
+# ─── Cache ────────────────────────────────────────────────────────────
+class DimensionCache:
+    """
+    The current DimensionSnapshot. Loaded at startup, then a background
+    thread probes FINGERPRINT_SQL every DIMENSION_CHECK_EVERY seconds and
+    reloads when it changed or DIMENSION_REFRESH seconds have passed.
+    A lookup of an unknown acquirer id reloads just the acquirer table (at
+    most every DIMENSION_MISS_RELOAD seconds), so new rows show up without
+    waiting; ids still unknown after that are remembered as such until the
+    next full reload, so orphan ids in live_transactions cost nothing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.snapshot: Optional[DimensionSnapshot] = None
+        self._loaded_mono = 0.0
+        self._acquirers_mono = 0.0
+        self._unknown: Set[int] = set()   # acquirer ids missing after the last reload
+        self.counters = {"loads": 0, "load_errors": 0, "checks": 0, "changes": 0, "miss_reloads": 0}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="dimensions", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def reload(self) -> DimensionSnapshot:
+        """
+        Loads a fresh snapshot; concurrent callers share one load.
+        """
+        def run():
+            try:
+                snapshot = load_dimensions()
+            except Exception:
+                with self._lock:
+                    self.counters["load_errors"] += 1
+                raise
+            with self._lock:
+                self.snapshot = snapshot
+                self._loaded_mono = self._acquirers_mono = time.monotonic()
+                self._unknown = set()
+                self.counters["loads"] += 1
+            return snapshot
+        return single_flight("dimensions").do("load", run, label="dimensions")
+
+    def reload_acquirers(self, ids: Set[int]) -> DimensionSnapshot:
+        """
+        Re-reads only the acquirer table into a copy of the snapshot; the
+        ids of `ids` still missing afterwards are remembered as unknown.
+        """
+        if self.snapshot is None:
+            return self.reload()
+
+        def run():
+            with read_connection(history=True) as conn:
+                acquirers = _load_acquirers(conn)
+            with self._lock:
+                old = self.snapshot
+                # the old fingerprint stays, so the next probe still sees the
+                # change and does a full reload
+                snapshot = DimensionSnapshot(acquirers, old.merchants, old.merchant_countries, old.regions,
+                                             old.currencies, old.card_types, old.fingerprint)
+                self.snapshot = snapshot
+                self._acquirers_mono = time.monotonic()
+                self.counters["miss_reloads"] += 1
+                return snapshot
+        snapshot = single_flight("dimensions").do("acquirers", run, label="dimensions")
+        with self._lock:
+            self._unknown |= ids - snapshot.acquirers.keys()
+        return snapshot
+
+    def invalidate(self) -> None:
+        """
+        Drops the snapshot; the next lookup reloads it.
+        """
+        with self._lock:
+            self.snapshot = None
+
+    def _changed(self, snapshot: DimensionSnapshot) -> bool:
+        with read_connection(history=True) as conn:
+            fingerprint = _fingerprint(conn)
+        with self._lock:
+            self.counters["checks"] += 1
+        return fingerprint != snapshot.fingerprint
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                snapshot = self.snapshot
+                if snapshot is None or time.monotonic() - self._loaded_mono >= DIMENSION_REFRESH:
+                    self.reload()
+                elif self._changed(snapshot):
+                    with self._lock:
+                        self.counters["changes"] += 1
+                    self.reload()
+            except Exception as e:
+                print("🔴 Dimension cache refresh failed:", str(e).splitlines()[0])
+            self._stop.wait(DIMENSION_CHECK_EVERY)
+
+    def current(self) -> DimensionSnapshot:
+        """
+        The snapshot, loaded in the caller's thread if there is none yet.
+        """
+        return self.snapshot or self.reload()
+
+    # ─── Lookups ──────────────────────────────────────────────────────
+    def acquirer_names(self, ids: Iterable[Any]) -> Dict[int, Optional[str]]:
+        """
+        {id: name} for the given acquirer ids; None for ids unknown even
+        after a reload.
+        """
+        ids = {int(i) for i in ids if i is not None}
+        snapshot = self.current()
+        with self._lock:
+            missing = ids - snapshot.acquirers.keys() - self._unknown
+            due = time.monotonic() - self._acquirers_mono >= DIMENSION_MISS_RELOAD
+        if missing and due:
+            snapshot = self.reload_acquirers(missing)
+        return {i: snapshot.acquirers.get(i) for i in ids}
+
+    def name_acquirers(self, rows: List[Dict[str, Any]], id_column: str = "acquirer_id",
+                       name_column: str = "name") -> List[Dict[str, Any]]:
+        """
+        Copies of rows with name_column set from their acquirer id (the id
+        column removed); rows of unknown acquirers are dropped, as the
+        former inner JOIN did.
+        """
+        names = self.acquirer_names(r[id_column] for r in rows)
+        out = []
+        for r in rows:
+            name = names.get(int(r[id_column])) if r[id_column] is not None else None
+            if name is None:
+                continue
+            rec = {k: v for k, v in r.items() if k != id_column}
+            rec[name_column] = name
+            out.append(rec)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = self.snapshot
+            return {
+                **self.counters,
+                "loaded_at":  snapshot.loaded_at if snapshot else None,
+                "unknown_acquirers": sorted(self._unknown),
+                "acquirers":  len(snapshot.acquirers) if snapshot else None,
+                "merchants":  snapshot.merchants if snapshot else None,
+                "regions":    len(snapshot.regions) if snapshot else None,
+                "currencies": len(snapshot.currencies) if snapshot else None,
+                "card_types": len(snapshot.card_types) if snapshot else None,
+            }
+
+
+dimensions = DimensionCache()
+
+
+def dimension_stats() -> Dict[str, Any]:
+    return dimensions.stats()
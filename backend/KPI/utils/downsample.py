@@ -0,0 +1,35 @@
+from typing import List, Sequence
+
+import numpy as np
+
+
+def lttb(x: Sequence[float], y: Sequence[float], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets: picks `threshold` of the points so the
+    line keeps its visual shape (peaks and dips survive, flat runs don't
+    waste points). Returns the indices of the kept points, first and last
+    always included. x must be increasing.
+    """
+    n = len(x)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        return [0, n - 1][:max(threshold, 0)]
+
+    xs = np.asarray(x, dtype=float)
+    ys = np.asarray(y, dtype=float)
+    # interior points split into threshold-2 buckets of (almost) equal size
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # the next bucket's average is the third corner of the triangle
+        nlo, nhi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = xs[nlo:nhi].mean(), ys[nlo:nhi].mean()
+        area = np.abs((xs[a] - cx) * (ys[lo:hi] - ys[a]) - (xs[a] - xs[lo:hi]) * (cy - ys[a]))
+        a = lo + int(area.argmax())
+        kept.append(a)
+    kept.append(n - 1)
+    return kept
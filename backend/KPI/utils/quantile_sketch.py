@@ -0,0 +1,92 @@
+import math
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Relative accuracy of every quantile. Stored sketches are only mergeable
+# with sketches of the same accuracy, so changing it means rebuilding them.
+SKETCH_ACCURACY = 0.01
+GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+LN_GAMMA = math.log(GAMMA)
+
+
+def bin_sql(expr: str) -> str:
+    """
+    SQL for the bin of a positive value, the same as QuantileSketch uses.
+    """
+    return f"CEIL(LN({expr}) / {LN_GAMMA!r})::int"
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch (DDSketch): a histogram over logarithmic
+    bins, bin k holding the values in (GAMMA^(k-1), GAMMA^k]. Any
+    quantile is within SKETCH_ACCURACY of the true value (relative), and
+    two sketches merge exactly by adding their bin counts, so daily
+    sketches combine into any window. Values <= 0 share one zero bin.
+    """
+
+    __slots__ = ("bins", "counts", "zeros", "min", "max")
+
+    def __init__(self, bins: Sequence[int] = (), counts: Sequence[int] = (), zeros: int = 0,
+                 min_value: Optional[float] = None, max_value: Optional[float] = None):
+        self.bins = np.asarray(bins, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.zeros = int(zeros)
+        self.min = min_value
+        self.max = max_value
+
+    @classmethod
+    def from_values(cls, values: Iterable[float]) -> "QuantileSketch":
+        x = np.asarray(list(values), dtype=float)
+        x = x[~np.isnan(x)]
+        if not len(x):
+            return cls()
+        pos = x[x > 0]
+        bins, counts = np.unique(np.ceil(np.log(pos) / LN_GAMMA).astype(np.int64), return_counts=True)
+        return cls(bins, counts, len(x) - len(pos), float(x.min()), float(x.max()))
+
+    @classmethod
+    def merge_all(cls, sketches: Iterable["QuantileSketch"]) -> "QuantileSketch":
+        sketches = list(sketches)
+        if not sketches:
+            return cls()
+        bins, inverse = np.unique(np.concatenate([s.bins for s in sketches]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([s.counts for s in sketches]),
+                             minlength=len(bins)).astype(np.int64)
+        mins = [s.min for s in sketches if s.min is not None]
+        maxs = [s.max for s in sketches if s.max is not None]
+        return cls(bins, counts, sum(s.zeros for s in sketches),
+                   min(mins) if mins else None, max(maxs) if maxs else None)
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        return QuantileSketch.merge_all([self, other])
+
+    @property
+    def count(self) -> int:
+        return self.zeros + int(self.counts.sum())
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        The q-quantile (0 <= q <= 1), None for an empty sketch. Ranks
+        follow Postgres' percentile_disc: the value at ceil(q * n).
+        """
+        n = self.count
+        if n == 0:
+            return None
+        rank = max(math.ceil(q * n) - 1, 0)   # 0-based
+        if rank < self.zeros:
+            value = 0.0
+        else:
+            idx = int(np.searchsorted(np.cumsum(self.counts), rank - self.zeros, side="right"))
+            idx = min(idx, len(self.bins) - 1)
+            value = 2 * GAMMA ** int(self.bins[idx]) / (GAMMA + 1)
+        # the exact extremes are known, so estimates never leave them
+        if self.min is not None:
+            value = max(value, self.min)
+        if self.max is not None:
+            value = min(value, self.max)
+        return value
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        return [self.quantile(q) for q in qs]
@@ -0,0 +1,79 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Entry:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class QueryMemo:
+    """
+    Per-scope memo of query results keyed on (normalised SQL, params).
+    The first caller for a key runs the query; concurrent callers for the
+    same key wait for it and share the result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, _Entry] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_run(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if owner:
+            try:
+                entry.value = fn()
+            except BaseException as e:
+                entry.error = e
+                raise
+            finally:
+                entry.done.set()
+        else:
+            entry.done.wait()
+            if entry.error is not None:
+                raise entry.error
+        return entry.value
+
+
+_active_memo: ContextVar[Optional[QueryMemo]] = ContextVar("_active_memo", default=None)
+
+
+@contextmanager
+def query_memo_scope(memo: Optional[QueryMemo] = None):
+    """
+    Activates a QueryMemo for the current context (and for any thread that
+    runs a copy of it), e.g. for the duration of one /batch request.
+    """
+    memo = memo or QueryMemo()
+    token = _active_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _active_memo.reset(token)
+
+
+def memoized(mode: str, sql: str, params: dict, fn: Callable[[], Any]) -> Any:
+    """
+    Runs fn() through the active memo, or directly when no scope is active.
+    """
+    memo = _active_memo.get()
+    if memo is None:
+        return fn()
+    key = (mode, " ".join(sql.split()), tuple(sorted((params or {}).items())))
+    return memo.get_or_run(key, fn)
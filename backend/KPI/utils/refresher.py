@@ -0,0 +1,72 @@
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+class PeriodicRefresher:
+    """
+    Runs refresh jobs on a daemon thread, once at start and then every
+    `every` seconds. Jobs run outside any request, so no request deadline
+    cancels them and no request waits on them; a failing job is logged
+    and retried on the next round.
+    """
+
+    def __init__(self, name: str, jobs: Dict[str, Callable[[], Any]], every: float):
+        self.name = name
+        self.jobs = jobs
+        self.every = every
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last: Dict[str, Dict[str, Any]] = {}
+        self.counters = {"rounds": 0, "errors": 0}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        Runs every job now, in the caller's thread; {job: result}.
+        """
+        out = {}
+        for key, job in self.jobs.items():
+            started = time.perf_counter()
+            try:
+                out[key] = job()
+            except Exception as e:
+                print(f"🔴 {self.name} refresh of {key} failed:", str(e).splitlines()[0])
+                with self._lock:
+                    self.counters["errors"] += 1
+                    self.last[key] = {"at": time.time(), "error": str(e).splitlines()[0]}
+                continue
+            with self._lock:
+                self.last[key] = {
+                    "at":     time.time(),
+                    "ms":     round((time.perf_counter() - started) * 1000, 1),
+                    "result": out[key],
+                }
+        with self._lock:
+            self.counters["rounds"] += 1
+        return out
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.every)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                "running": bool(self._thread and self._thread.is_alive()),
+                "every_s": self.every,
+                "jobs":    {key: dict(last) for key, last in self.last.items()},
+            }
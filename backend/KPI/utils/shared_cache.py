@@ -0,0 +1,461 @@
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from KPI.utils.single_flight import single_flight, _freeze
+
+try:
+    import redis  # optional: CACHE_NETWORK=redis://host:6379/0
+except ImportError:  # pragma: no cover
+    redis = None
+
+# ─── Settings ─────────────────────────────────────────────────────────
+CACHE_ENABLED          = os.getenv("CACHE", "1") != "0"
+CACHE_MEMORY_ENTRIES   = int(os.getenv("CACHE_MEMORY_ENTRIES", "512"))      # per namespace, per worker
+CACHE_DISK             = os.getenv("CACHE_DISK", "1") != "0"                # tier shared by the workers of a node
+CACHE_DISK_PATH        = Path(os.getenv(
+    "CACHE_DISK_PATH", Path(__file__).resolve().parents[2] / ".cache" / "shared_cache.sqlite3"
+))
+CACHE_DISK_MAX_ENTRIES = int(os.getenv("CACHE_DISK_MAX_ENTRIES", "20000"))
+CACHE_NETWORK          = os.getenv("CACHE_NETWORK", "")                     # "" | standin | redis://...
+CACHE_NETWORK_TIMEOUT  = float(os.getenv("CACHE_NETWORK_TIMEOUT", "0.2"))   # s per network call
+CACHE_KPI_TTL          = float(os.getenv("CACHE_KPI_TTL", "60"))            # s KPI results are served for
+CACHE_INSIGHT_TTL      = float(os.getenv("CACHE_INSIGHT_TTL", "3600"))      # s per LLM insight (same prompt)
+
+# How often (in writes) the disk tier drops expired / surplus rows
+_PRUNE_EVERY = 200
+
+# ─── Tiers ────────────────────────────────────────────────────────────
+# Every tier maps a string key to (value, expires_at). Expiry is wall-clock
+# time (time.time()), since entries outlive the process that wrote them.
+# The shared tiers store pickles: only point them at stores this service
+# alone writes to.
+
+
+class CacheBackend:
+    """
+    One cache tier. get() returns (value, expires_at) or None.
+    """
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[tuple]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In-process LRU; values are kept as given (no copy).
+    """
+
+    name = "memory"
+
+    def __init__(self, size: int = CACHE_MEMORY_ENTRIES):
+        self.size = size
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DiskBackend(CacheBackend):
+    """
+    SQLite file (WAL mode) shared by every worker process on the node.
+    Point CACHE_DISK_PATH at /dev/shm to keep it in memory.
+    """
+
+    name = "disk"
+
+    def __init__(self, path: Path = CACHE_DISK_PATH, max_entries: int = CACHE_DISK_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=2.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key        TEXT PRIMARY KEY,
+                    value      BLOB NOT NULL,
+                    expires_at REAL NOT NULL,
+                    stored_at  REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_stored ON cache (stored_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[tuple]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return (pickle.loads(row[0]), row[1]) if row else None
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)",
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at, time.time()),
+        )
+        self._writes += 1
+        if self._writes % _PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        """
+        Drops expired rows, then the oldest beyond max_entries.
+        """
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        conn.execute("""
+            DELETE FROM cache WHERE key IN (
+                SELECT key FROM cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class StandInStore:
+    """
+    Local stand-in for a network key/value store (the subset of the
+    redis-py client NetworkBackend uses), for tests and single-node runs.
+    Every NetworkBackend in the process built with CACHE_NETWORK=standin
+    shares one store, as separate workers would share the server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items: Dict[str, tuple] = {}   # key -> (bytes, expires_at)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] <= time.time():
+                self._items.pop(key, None)
+                return None
+            return item[0]
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None) -> None:
+        with self._lock:
+            self._items[key] = (value, time.time() + ex if ex else float("inf"))
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def flushdb(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+standin_store = StandInStore()
+
+
+def network_client(url: str = CACHE_NETWORK) -> Any:
+    """
+    The client for CACHE_NETWORK: "standin", or a redis:// URL (needs the
+    redis package).
+    """
+    if url == "standin":
+        return standin_store
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        if redis is None:
+            raise ValueError("CACHE_NETWORK is a redis URL but the redis package is not installed")
+        return redis.Redis.from_url(url, socket_timeout=CACHE_NETWORK_TIMEOUT,
+                                    socket_connect_timeout=CACHE_NETWORK_TIMEOUT)
+    raise ValueError(f"Unknown CACHE_NETWORK {url}; use standin or a redis:// URL")
+
+
+class NetworkBackend(CacheBackend):
+    """
+    A key/value server shared across nodes, through any client with
+    get / set(ex=) / delete (redis-py, or the stand-in).
+    """
+
+    name = "network"
+
+    def __init__(self, client: Any, prefix: str = "a360:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[tuple]:
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        ttl = max(1, int(expires_at - time.time()))
+        self.client.set(self.prefix + key, pickle.dumps((value, expires_at), pickle.HIGHEST_PROTOCOL), ex=ttl)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        pass  # a shared server is not flushed from one worker
+
+
+_disk: Optional[DiskBackend] = None
+_network: Optional[NetworkBackend] = None
+_shared_lock = threading.Lock()
+
+
+def shared_tiers() -> List[CacheBackend]:
+    """
+    The process-wide shared tiers enabled by CACHE_DISK / CACHE_NETWORK.
+    """
+    global _disk, _network
+    with _shared_lock:
+        tiers: List[CacheBackend] = []
+        if CACHE_DISK:
+            _disk = _disk or DiskBackend()
+            tiers.append(_disk)
+        if CACHE_NETWORK:
+            _network = _network or NetworkBackend(network_client())
+            tiers.append(_network)
+        return tiers
+
+
+# ─── Tiered cache ─────────────────────────────────────────────────────
+class TieredCache:
+    """
+    One namespace of cached values looked up tier by tier: the worker's
+    own LRU, then the shared tiers (disk, network). A hit in a lower tier
+    is copied into the tiers above it; a miss in all of them builds the
+    value once per worker (single flight) and writes it to every tier.
+
+    A failing shared tier is skipped and counted, never raised: the cache
+    only ever makes requests faster. With copy=True the memory tier keeps
+    pickles, so callers can mutate what they get back.
+    """
+
+    def __init__(self, namespace: str, ttl: float, size: int = CACHE_MEMORY_ENTRIES,
+                 copy: bool = True, tiers: Optional[List[CacheBackend]] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.copy = copy
+        self.memory = MemoryBackend(size)
+        self.tiers: List[CacheBackend] = [self.memory, *(shared_tiers() if tiers is None else tiers)]
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"builds": 0, "misses": 0}
+        for tier in self.tiers:
+            self.counters[f"{tier.name}_hits"] = 0
+        for tier in self.tiers[1:]:
+            self.counters[f"{tier.name}_errors"] = 0
+
+    def _key(self, key: Any) -> str:
+        # stable across processes (unlike hash())
+        return f"{self.namespace}:{hashlib.sha1(repr(_freeze(key)).encode()).hexdigest()}"
+
+    def _bump(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _tier_call(self, tier: CacheBackend, fn: Callable[[], Any]) -> Any:
+        try:
+            return fn()
+        except Exception as e:
+            self._bump(f"{tier.name}_errors")
+            print(f"🔴 Cache tier {tier.name} ({self.namespace}) failed:", str(e).splitlines()[0])
+            return None
+
+    def _out(self, value: Any) -> Any:
+        return pickle.loads(value) if self.copy else value
+
+    def _store(self, skey: str, value: Any, expires_at: float, tiers: List[CacheBackend]) -> None:
+        for tier in tiers:
+            if tier is self.memory:
+                self.memory.set(skey, pickle.dumps(value, pickle.HIGHEST_PROTOCOL) if self.copy else value,
+                                expires_at)
+            else:
+                self._tier_call(tier, lambda: tier.set(skey, value, expires_at))
+
+    def get(self, key: Any) -> Any:
+        """
+        The cached value, or None on a miss in every tier.
+        """
+        return self._lookup(self._key(key))
+
+    def _lookup(self, skey: str, count_miss: bool = True) -> Any:
+        item = self.memory.get(skey)
+        if item is not None:
+            self._bump("memory_hits")
+            return self._out(item[0])
+        for i, tier in enumerate(self.tiers[1:], start=1):
+            item = self._tier_call(tier, lambda: tier.get(skey))
+            if item is not None:
+                self._bump(f"{tier.name}_hits")
+                self._store(skey, item[0], item[1], self.tiers[:i])
+                return item[0]
+        if count_miss:
+            self._bump("misses")
+        return None
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        self._store(self._key(key), value, time.time() + (self.ttl if ttl is None else ttl), self.tiers)
+
+    def get_or_build(self, key: Any, build: Callable[[], Any], label: Optional[str] = None) -> Any:
+        """
+        The cached value for key, else build() (shared by concurrent
+        callers in this worker) stored in every tier.
+        """
+        if not CACHE_ENABLED or self.ttl <= 0 or _bypass.get():
+            return build()
+        skey = self._key(key)
+        value = self._lookup(skey)
+        if value is not None:
+            return value
+
+        def run():
+            value = self._lookup(skey, count_miss=False)  # stored by another caller meanwhile?
+            if value is None:
+                value = build()
+                self._bump("builds")
+                if value is not None:
+                    self.set(key, value)
+            return value
+        value = single_flight(f"cache:{self.namespace}").do(skey, run, label=label)
+        # followers of the single flight must not share the leader's object
+        return pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) if self.copy else value
+
+    def delete(self, key: Any) -> None:
+        skey = self._key(key)
+        self.memory.delete(skey)
+        for tier in self.tiers[1:]:
+            self._tier_call(tier, lambda: tier.delete(skey))
+
+    def clear(self) -> None:
+        """
+        Clears this worker's memory tier only; shared tiers expire by TTL.
+        """
+        self.memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = sum(v for k, v in self.counters.items() if k.endswith("_hits")) + self.counters["misses"]
+            hits = lookups - self.counters["misses"]
+            return {
+                **self.counters,
+                "ttl":      self.ttl,
+                "tiers":    [t.name for t in self.tiers],
+                "entries":  len(self.memory),
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+            }
+
+
+_bypass: ContextVar[bool] = ContextVar("_cache_bypass", default=False)
+
+
+@contextmanager
+def cache_bypass():
+    """
+    Runs the enclosed calls without reading or filling any cache, e.g.
+    to see the queries a page really issues.
+    """
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+_CACHES: Dict[str, TieredCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def tiered_cache(namespace: str, ttl: float, size: int = CACHE_MEMORY_ENTRIES, copy: bool = True) -> TieredCache:
+    """
+    Returns the process-wide cache for this namespace, creating it on first use.
+    """
+    with _CACHES_LOCK:
+        cache = _CACHES.get(namespace)
+        if cache is None:
+            cache = _CACHES[namespace] = TieredCache(namespace, ttl, size, copy)
+        return cache
+
+
+def cached(namespace: str, ttl: float):
+    """
+    Decorator serving fn's result from the tiered cache `namespace`,
+    keyed on the function and its arguments.
+    """
+    def deco(fn: Callable[..., Any]):
+        cache = tiered_cache(namespace, ttl)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (fn.__module__, fn.__qualname__, args, kwargs)
+            return cache.get_or_build(key, lambda: fn(*args, **kwargs), label=fn.__qualname__)
+        return wrapper
+    return deco
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _CACHES_LOCK:
+        caches = dict(_CACHES)
+    stats: Dict[str, Any] = {"enabled": CACHE_ENABLED, "network": CACHE_NETWORK or None,
+                             "namespaces": {name: c.stats() for name, c in caches.items()}}
+    if _disk is not None:
+        try:
+            stats["disk"] = {"path": str(_disk.path), "entries": len(_disk)}
+        except Exception as e:
+            stats["disk"] = {"path": str(_disk.path), "error": str(e).splitlines()[0]}
+    return stats
@@ -0,0 +1,149 @@
+import os
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from DB.cancellation import RequestAborted, current_budget
+
+SINGLE_FLIGHT_ENABLED    = os.getenv("SINGLE_FLIGHT", "1") != "0"
+SINGLE_FLIGHT_STATS_KEYS = int(os.getenv("SINGLE_FLIGHT_STATS_KEYS", "256"))
+
+
+class _Call:
+    __slots__ = ("done", "value", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent work. The first caller for a key runs
+    fn(); callers arriving while it runs wait and get the same result (or
+    exception). Unlike QueryMemo nothing is kept once the call finishes, so
+    the next caller after that computes afresh.
+
+    Per-key counters (most recent SINGLE_FLIGHT_STATS_KEYS keys) record how
+    many callers were coalesced into each execution.
+    """
+
+    def __init__(self, name: str, max_keys: int = SINGLE_FLIGHT_STATS_KEYS):
+        self.name = name
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._key_stats: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        self.executions = 0
+        self.shared = 0
+
+    def _stat(self, label: str) -> Dict[str, int]:
+        stat = self._key_stats.get(label)
+        if stat is None:
+            stat = self._key_stats[label] = {"calls": 0, "executions": 0, "shared": 0, "max_waiters": 0}
+            while len(self._key_stats) > self.max_keys:
+                self._key_stats.popitem(last=False)
+        self._key_stats.move_to_end(label)
+        return stat
+
+    def do(self, key: Hashable, fn: Callable[[], Any], label: Optional[str] = None) -> Any:
+        if not SINGLE_FLIGHT_ENABLED:
+            return fn()
+        label = label or str(key)[:200]
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            stat = self._stat(label)
+            stat["calls"] += 1
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                stat["executions"] += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+                stat["shared"] += 1
+
+        if not leader:
+            budget = current_budget()
+            while not call.done.wait(0.05):
+                if budget is not None:
+                    budget.check()  # our own deadline / disconnect
+            if isinstance(call.error, RequestAborted):
+                # the leader's request was aborted, not the work itself
+                return self.do(key, fn, label)
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                stat["max_waiters"] = max(stat["max_waiters"], call.waiters)
+            call.done.set()
+        return call.value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "shared":     self.shared,
+                "in_flight":  {str(k)[:200]: c.waiters for k, c in self._calls.items()},
+                "keys":       {k: dict(v) for k, v in reversed(self._key_stats.items())},
+            }
+
+
+_GROUPS: Dict[str, SingleFlight] = {}
+_GROUPS_LOCK = threading.Lock()
+
+
+def single_flight(name: str) -> SingleFlight:
+    """
+    Returns the process-wide group with this name, creating it on first use.
+    """
+    with _GROUPS_LOCK:
+        group = _GROUPS.get(name)
+        if group is None:
+            group = _GROUPS[name] = SingleFlight(name)
+        return group
+
+
+def single_flight_stats() -> Dict[str, Any]:
+    with _GROUPS_LOCK:
+        groups = list(_GROUPS.values())
+    return {"enabled": SINGLE_FLIGHT_ENABLED, "groups": {g.name: g.stats() for g in groups}}
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, set):
+        return tuple(sorted(value))
+    return value
+
+
+def coalesced(name: str):
+    """
+    Decorator running every call of fn through the single-flight group
+    `name`, keyed on the function and its arguments.
+    """
+    def deco(fn: Callable[..., Any]):
+        group = single_flight(name)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (fn.__module__, fn.__qualname__, _freeze(args), _freeze(kwargs))
+            label = f"{fn.__qualname__}{_freeze(args)}" + (f"{_freeze(kwargs)}" if kwargs else "")
+            return group.do(key, lambda: fn(*args, **kwargs), label)
+        return wrapper
+    return deco
@@ -2,63 +2,117 @@ from scipy.stats import norm
 import numpy as np
 import math
 
-def compare_to_historical_single_point(yesterday_val: float, historical_values: list[float], alpha=0.05) -> dict:
+# status of each row of a batch comparison
+STATUS_OK           = 0
+STATUS_TOO_FEW      = 1  # fewer than 2 valid history points
+STATUS_NO_VARIATION = 2  # std == 0
+STATUS_INVALID      = 3  # z-score not finite
+
+_STATUS_INSIGHTS = {
+    STATUS_TOO_FEW:      "Not enough valid historical data to compare.",
+    STATUS_NO_VARIATION: "No variation in historical data.",
+    STATUS_INVALID:      "Invalid z-score due to problematic input values.",
+}
+
+
+def history_stats(history) -> tuple:
     """
-    Perform z-test and prediction interval check to compare yesterday's value to historical distribution.
+    Per-row (n, mean, std) of a history array shaped (..., days), ignoring
+    NaNs (missing days). Rows with fewer than 2 points get NaN mean / std.
     """
-    # Filter out any NaNs from the historical list
-    historical_values = [x for x in historical_values if isinstance(x, (int, float)) and not math.isnan(x)]
+    history = np.asarray(history, dtype=float)
+    valid = ~np.isnan(history)
+    n = valid.sum(axis=-1)
+    filled = np.where(valid, history, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=-1) / n
+        sq = np.where(valid, (history - mean[..., None]) ** 2, 0.0).sum(axis=-1)
+        std = np.sqrt(sq / (n - 1))
+    mean = np.where(n >= 2, mean, np.nan)
+    std = np.where(n >= 2, std, np.nan)
+    return n, mean, std
 
-    n = len(historical_values)
-    if n < 2:
-        return {
-            "z_score": None,
-            "p_value": None,
-            "mean": None,
-            "std": None,
-            "is_significant": False,
-            "insight": "Not enough valid historical data to compare."
-        }
 
-    mean = np.mean(historical_values)
-    std = np.std(historical_values, ddof=1) 
+def batch_compare_to_expected(values, mean, std, n, alpha=0.05) -> dict:
+    """
+    Vectorised z-test and prediction interval check of many values against
+    their expected mean / std (estimated from n points), all arrays of the
+    same (broadcastable) shape, e.g. metrics x dimension values.
 
-    if std == 0:
-        return {
-            "z_score": None,
-            "p_value": None,
-            "mean": round(mean, 2),
-            "std": round(std, 2),
-            "is_significant": False,
-            "insight": "No variation in historical data."
-        }
+    Returns arrays: z_score, p_value, lower, upper, is_significant and
+    status (STATUS_*); z / p are NaN where status != STATUS_OK.
+    """
+    values = np.asarray(values, dtype=float)
+    mean = np.asarray(mean, dtype=float)
+    std = np.asarray(std, dtype=float)
+    n = np.asarray(n)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (values - mean) / std
+        status = np.select(
+            [n < 2, std == 0, ~np.isfinite(z)],
+            [STATUS_TOO_FEW, STATUS_NO_VARIATION, STATUS_INVALID],
+            STATUS_OK,
+        )
+        ok = status == STATUS_OK
+        z = np.where(ok, z, np.nan)
+        p = 2 * norm.sf(np.abs(z))
+
+        # prediction interval for one new observation
+        multiplier = round(float(norm.isf(alpha / 2)), 2)  # 1.96 at alpha = 0.05
+        margin = multiplier * std * np.sqrt(1 + 1 / n)
+        lower, upper = mean - margin, mean + margin
+    is_significant = ok & ((values < lower) | (values > upper))
 
-    z = (yesterday_val - mean) / std
+    return {
+        "z_score":        z,
+        "p_value":        p,
+        "mean":           mean,
+        "std":            std,
+        "lower":          lower,
+        "upper":          upper,
+        "is_significant": is_significant,
+        "status":         status,
+    }
 
-    # Check for NaN or infinite z-scores
-    if not np.isfinite(z):
+
+def batch_compare_to_historical(values, history, alpha=0.05) -> dict:
+    """
+    compare_to_historical_single_point for a whole matrix in one NumPy
+    pass: values shaped (...), history shaped (..., days) with NaN for
+    missing days, e.g. (metrics, dimension values) and (metrics,
+    dimension values, days). Adds "n" to the batch_compare_to_expected
+    result.
+    """
+    n, mean, std = history_stats(history)
+    return {"n": n, **batch_compare_to_expected(values, mean, std, n, alpha)}
+
+
+def _row_result(res: dict, i=(), label: str = "payment method diversity") -> dict:
+    """
+    One row of a batch result in the single-point dict format.
+    """
+    status = int(res["status"][i])
+    mean = res["mean"][i]
+    std = res["std"][i]
+    if status == STATUS_TOO_FEW:
+        mean = std = None
+    if status != STATUS_OK:
         return {
             "z_score": None,
             "p_value": None,
-            "mean": round(mean, 2),
-            "std": round(std, 2),
+            "mean": None if mean is None else round(mean, 2),
+            "std": None if std is None else round(std, 2),
             "is_significant": False,
-            "insight": "Invalid z-score due to problematic input values."
+            "insight": _STATUS_INSIGHTS[status],
         }
 
-    p = 2 * norm.sf(abs(z)) 
-
-    # Prediction interval check
-    t_multiplier = 1.96 
-    pred_margin = t_multiplier * std * np.sqrt(1 + 1/n)
-    lower_bound = mean - pred_margin
-    upper_bound = mean + pred_margin
-    is_outlier = yesterday_val < lower_bound or yesterday_val > upper_bound
-
+    z, p = res["z_score"][i], res["p_value"][i]
+    is_outlier = bool(res["is_significant"][i])
     summary = (
-        f"Yesterday’s payment method diversity was {'unusually high' if z > 0 else 'unusually low'} "
+        f"Yesterday’s {label} was {'unusually high' if z > 0 else 'unusually low'} "
         f"compared to the historical average ({mean:.2f}, p = {p:.4f})."
-    ) if is_outlier else "Yesterday’s payment method diversity was within the expected range."
+    ) if is_outlier else f"Yesterday’s {label} was within the expected range."
 
     return {
         "z_score": round(z, 2),
@@ -68,3 +122,25 @@ def compare_to_historical_single_point(yesterday_val: float, historical_values:
         "is_significant": is_outlier,
         "insight": summary,
     }
+
+
+def compare_to_historical_single_point(yesterday_val: float, historical_values: list[float], alpha=0.05) -> dict:
+    """
+    Perform z-test and prediction interval check to compare yesterday's value to historical distribution.
+    """
+    # Filter out any NaNs from the historical list
+    historical_values = [x for x in historical_values if isinstance(x, (int, float)) and not math.isnan(x)]
+
+    res = batch_compare_to_historical([yesterday_val], [historical_values], alpha)
+    return _row_result(res, 0)
+
+
+def compare_to_expected(value: float, mean: float, std: float, n: int, alpha=0.05,
+                        label: str = "payment method diversity") -> dict:
+    """
+    The z-test and prediction interval check of compare_to_historical_single_point
+    against an already known expected value and spread (e.g. a fitted
+    baseline), estimated from n observations.
+    """
+    res = batch_compare_to_expected([value], [mean], [std], [n], alpha)
+    return _row_result(res, 0, label)
@@ -1,8 +1,28 @@
 # services/utils/time_filters.py
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Dict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import date, datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from sqlalchemy import text
+from KPI.utils.query_memo import memoized
+
+_resolved_windows: ContextVar[Optional[Dict[tuple, tuple]]] = ContextVar("_resolved_windows", default=None)
+
+
+@contextmanager
+def date_window_scope(windows: Dict[tuple, tuple]):
+    """
+    Makes get_date_ranges return these already resolved windows, keyed on
+    (filter_type, custom), in the current context (and any thread running
+    a copy of it), e.g. for one /batch request.
+    """
+    token = _resolved_windows.set(windows)
+    try:
+        yield windows
+    finally:
+        _resolved_windows.reset(token)
+
 
 def get_date_ranges(filter_type: str, custom: Optional[tuple[date, date]]) -> tuple[date, date, date, date]:
     """
@@ -10,6 +30,10 @@ def get_date_ranges(filter_type: str, custom: Optional[tuple[date, date]]) -> tu
     returns (start, end, comp_start, comp_end) date windows
     for current vs. comparison periods.
     """
+    resolved = _resolved_windows.get()
+    if resolved is not None and (filter_type, custom) in resolved:
+        return resolved[(filter_type, custom)]
+
     #get current date and time
     today_date = datetime.now().date()
 
@@ -78,7 +102,30 @@ def fetch_one(conn, sql: str, params: dict):
     Executes a scalar SQL query and returns its single numeric result.
     Falls back to 0.0 if nothing is returned.
     """
-    return float(conn.execute(text(sql), params).scalar() or 0.0)
+    return memoized(
+        "one", sql, params,
+        lambda: float(conn.execute(text(sql), params).scalar() or 0.0),
+    )
+
+
+def fetch_scalars(conn, sql: str, params: dict) -> list:
+    """
+    Executes a single-column SQL query and returns its values as a list.
+    """
+    return memoized(
+        "scalars", sql, params,
+        lambda: list(conn.execute(text(sql), params).scalars().all()),
+    )
+
+
+def fetch_rows(conn, sql: str, params: dict) -> list[dict]:
+    """
+    Executes a SQL query and returns its rows as plain dicts.
+    """
+    return memoized(
+        "rows", sql, params,
+        lambda: [dict(r) for r in conn.execute(text(sql), params).mappings().all()],
+    )
 
 
 def pct_diff(current: float, previous: float) -> float:
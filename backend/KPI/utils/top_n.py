@@ -0,0 +1,112 @@
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+OTHER_LABEL = "Other"
+
+_BARE_AGG = re.compile(r"^[A-Za-z_]+$")
+
+# top_n_rows' Other row: bare aggregates over the values of the rows below
+# the page (NULLs skipped, as in SQL)
+_ROW_AGGS = {
+    "SUM":   lambda vs: sum(vs),
+    "COUNT": lambda vs: len(vs),
+    "MIN":   lambda vs: min(vs) if vs else None,
+    "MAX":   lambda vs: max(vs) if vs else None,
+    "AVG":   lambda vs: sum(vs) / len(vs) if vs else None,
+}
+
+
+def _other_expr(column: str, agg: str) -> str:
+    # "SUM" → SUM(column); anything else is taken as a full expression
+    return f"{agg}({column})" if _BARE_AGG.match(agg) else agg
+
+
+def top_n_query(
+    grouped_sql: str,
+    label: str,
+    measures: Dict[str, str],
+    order_by: str,
+    limit: int,
+    offset: int = 0,
+    partition_by: Sequence[str] = (),
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Wraps an aggregated query (one row per group) so Postgres ranks the
+    groups with ROW_NUMBER() and returns ranks offset+1 .. offset+limit
+    plus one "Other" row aggregating every group ranked below the page.
+
+      label         column holding the group name (cast to text)
+      measures      {column: aggregate for the Other row}; "SUM" / "AVG" /
+                    "MAX" ..., or a full expression over the ranked rows,
+                    e.g. "SUM(ok)::float / NULLIF(SUM(n), 0)" for a rate
+      order_by      measure column to rank by (descending)
+      partition_by  rank separately within these columns (e.g. country)
+
+    Rows carry "rank" (NULL for Other) and "groups" (groups in the partition).
+    """
+    part = ", ".join(partition_by)
+    part_clause = f"PARTITION BY {part}" if part else ""
+    cols = ", ".join(measures)
+    other_cols = ", ".join(f"{_other_expr(c, agg)} AS {c}" for c, agg in measures.items())
+    lead = f"{part}, " if part else ""
+    sql = f"""
+        WITH grouped AS (
+            {grouped_sql}
+        ),
+        ranked AS (
+            SELECT grouped.*,
+                   ROW_NUMBER() OVER ({part_clause} ORDER BY {order_by} DESC NULLS LAST, {label}) AS rank,
+                   COUNT(*)     OVER ({part_clause})                                            AS groups
+              FROM grouped
+        )
+        SELECT {lead}{label}::text AS {label}, {cols}, rank, groups
+          FROM ranked
+         WHERE rank > :tn_offset AND rank <= :tn_offset + :tn_limit
+        UNION ALL
+        SELECT {lead}'{OTHER_LABEL}' AS {label}, {other_cols}, NULL AS rank, MAX(groups) AS groups
+          FROM ranked
+         WHERE rank > :tn_offset + :tn_limit
+        {f'GROUP BY {part}' if part else 'HAVING COUNT(*) > 0'}
+        ORDER BY {lead}rank NULLS LAST
+    """
+    return sql, {"tn_limit": limit, "tn_offset": offset}
+
+
+def top_n_rows(
+    rows: List[Dict[str, Any]],
+    label: str,
+    measures: Dict[str, str],
+    limit: Optional[int],
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    The same top-N + Other cut for rows already ranked in SQL (sorted by
+    their "rank" column), e.g. from a shared GROUPING SETS scan. Other
+    rolls up SUM / COUNT / MIN / MAX / AVG measures; full expressions
+    (which need the underlying columns) are set to None, so Other carries
+    every measure key the page rows have. limit=None returns every row,
+    in rank order.
+    """
+    ranked = sorted(rows, key=lambda r: r.get("rank") or 0)
+    if limit is None:
+        return ranked
+    page, rest = ranked[offset:offset + limit], ranked[offset + limit:]
+    if rest:
+        other = {label: OTHER_LABEL, "rank": None}
+        for col, agg in measures.items():
+            roll_up = _ROW_AGGS.get(agg.upper())
+            other[col] = roll_up([r[col] for r in rest if r[col] is not None]) if roll_up else None
+        page = page + [other]
+    return page
+
+
+def paging(rows: List[Dict[str, Any]], limit: Optional[int], offset: int = 0,
+           groups: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Paging block for a response; groups defaults to the "groups" column.
+    """
+    if limit is None:
+        return None
+    if groups is None:
+        groups = max((r.get("groups") or 0 for r in rows), default=0)
+    return {"limit": limit, "offset": offset, "groups": groups, "has_more": offset + limit < groups}
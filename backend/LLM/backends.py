@@ -0,0 +1,119 @@
+# backend/LLM/backends.py
+
+import os
+import json
+import urllib.request
+from typing import Iterator, Optional
+
+from dotenv import load_dotenv
+
+from LLM.resilience import LLM_CALL_TIMEOUT
+
+load_dotenv()
+
+# ─── Settings ─────────────────────────────────────────────────────────
+LLM_BACKEND     = os.getenv("LLM_BACKEND", "xai")        # xai | standin
+LLM_MODEL       = os.getenv("LLM_MODEL", "grok-4")
+LLM_STANDIN_URL = os.getenv("LLM_STANDIN_URL", "http://127.0.0.1:8090")
+
+
+class LLMBackend:
+    """
+    A text-completion provider. complete() returns the whole answer,
+    stream() yields it in chunks as the provider produces them.
+    """
+
+    name = "base"
+
+    def complete(self, prompt: str, system_prompt: str) -> str:
+        return "".join(self.stream(prompt, system_prompt))
+
+    def stream(self, prompt: str, system_prompt: str) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class XAIBackend(LLMBackend):
+    """
+    xAI chat API. The SDK client is created on first use, so importing the
+    insight endpoints works without XAI_API_KEY; calls fail until it is set.
+    """
+
+    name = "xai"
+
+    def __init__(self, api_key: Optional[str] = None, model: str = LLM_MODEL, timeout: float = LLM_CALL_TIMEOUT):
+        self.api_key = api_key or os.getenv("XAI_API_KEY")
+        self.model = model
+        self.timeout = timeout
+        self._client = None
+
+    def _chat(self, prompt: str, system_prompt: str):
+        if self._client is None:
+            if not self.api_key:
+                raise ValueError("XAI_API_KEY is not set in the .env file")
+            from xai_sdk import Client
+            self._client = Client(api_key=self.api_key, timeout=self.timeout)
+        from xai_sdk.chat import user, system
+
+        chat = self._client.chat.create(model=self.model)
+        chat.append(system(system_prompt))
+        chat.append(user(prompt))
+        return chat
+
+    def complete(self, prompt: str, system_prompt: str) -> str:
+        return self._chat(prompt, system_prompt).sample().content.strip()
+
+    def stream(self, prompt: str, system_prompt: str) -> Iterator[str]:
+        for _response, chunk in self._chat(prompt, system_prompt).stream():
+            if chunk.content:
+                yield chunk.content
+
+
+class StandInBackend(LLMBackend):
+    """
+    Client for the local stand-in server (python -m LLM.standin_server):
+    deterministic text, configurable latency, no network access needed.
+    """
+
+    name = "standin"
+
+    def __init__(self, url: str = LLM_STANDIN_URL, model: str = LLM_MODEL, timeout: float = LLM_CALL_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+
+    def _post(self, prompt: str, system_prompt: str, stream: bool):
+        body = json.dumps({
+            "model": self.model, "system": system_prompt, "prompt": prompt, "stream": stream,
+        }).encode("utf-8")
+        req = urllib.request.Request(
+            f"{self.url}/v1/complete", data=body, headers={"Content-Type": "application/json"}
+        )
+        return urllib.request.urlopen(req, timeout=self.timeout)
+
+    def complete(self, prompt: str, system_prompt: str) -> str:
+        with self._post(prompt, system_prompt, stream=False) as resp:
+            return json.loads(resp.read())["text"].strip()
+
+    def stream(self, prompt: str, system_prompt: str) -> Iterator[str]:
+        # newline-delimited JSON chunks: {"delta": "..."} … {"done": true}
+        with self._post(prompt, system_prompt, stream=True) as resp:
+            for line in resp:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event.get("done"):
+                    break
+                yield event["delta"]
+
+
+BACKENDS = {
+    "xai":     XAIBackend,
+    "standin": StandInBackend,
+}
+
+
+def get_backend(name: Optional[str] = None) -> LLMBackend:
+    name = name or LLM_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend {name}; choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
@@ -1,59 +1,97 @@
 # backend/LLM/grok_client.py
 
-import os
-from dotenv import load_dotenv
-from xai_sdk import Client
-from xai_sdk.chat import user, system
-import tiktoken
+from typing import Optional
+from LLM.backends import get_backend
+from LLM.prompt_budget import count_tokens
+from LLM.resilience import ResilientCaller, FallbackCache, LLMUnavailable
+from KPI.utils.single_flight import single_flight
+from KPI.utils.shared_cache import tiered_cache, CACHE_INSIGHT_TTL
 
-# Load API key from .env
-load_dotenv()
-XAI_API_KEY = os.getenv("XAI_API_KEY")
+SYSTEM_PROMPT = "You are a financial analyst. Be concise, helpful, and insightful."
 
-if not XAI_API_KEY:
-    raise ValueError("XAI_API_KEY is not set in the .env file")
+# Provider picked by LLM_BACKEND (xai | standin); no API key needed at import
+backend = get_backend()
 
-client = Client(api_key=XAI_API_KEY)
+# Concurrency limit, deadlines and circuit breaker shared by all insight calls
+caller = ResilientCaller()
+fallbacks = FallbackCache()
 
-# Token counter
-def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
-    enc = tiktoken.encoding_for_model(model)
-    return len(enc.encode(text))
+# identical prompts in flight at the same time are sent to the provider once
+inflight = single_flight("llm")
 
-def generate_grok_insight(prompt: str, return_usage: bool = False) -> dict | str:
-    try:
-        chat = client.chat.create(model="grok-4")
-        chat.append(system("You are a financial analyst. Be concise, helpful, and insightful."))
-        chat.append(user(prompt))
-
-        response = chat.sample()
-        insight = response.content.strip()
+# answers to identical prompts, shared by the workers (KPI/utils/shared_cache.py)
+insights = tiered_cache("insight", CACHE_INSIGHT_TTL)
 
-        if return_usage:
-            input_tokens = count_tokens(prompt)
-            output_tokens = count_tokens(insight)
-            total_tokens = input_tokens + output_tokens
 
-            return {
-                "text": insight,
-                "usage": {
-                    "prompt_tokens": input_tokens,
-                    "completion_tokens": output_tokens,
-                    "total_tokens": total_tokens
-                }
-            }
+def _sample(prompt: str) -> str:
+    return backend.complete(prompt, SYSTEM_PROMPT)
 
-        return insight
 
+def generate_grok_insight(
+    prompt: str,
+    return_usage: bool = False,
+    fallback_key: Optional[str] = None,
+) -> dict | str:
+    """
+    fallback_key names the chart / page the insight is for; the last good
+    insight for it is served when the provider is unavailable.
+    """
+    fallback = None
+    try:
+        insight = insights.get_or_build(
+            (backend.name, backend.model, SYSTEM_PROMPT, prompt),
+            lambda: inflight.do(
+                (backend.name, prompt),
+                lambda: caller.call(lambda: _sample(prompt)),
+                label=fallback_key or prompt[:80],
+            ),
+            label=fallback_key or prompt[:80],
+        )
+        fallbacks.put(fallback_key, insight)
+    except LLMUnavailable as e:
+        print("🔴 Grok LLM unavailable:", e.reason)
+        fallback = fallbacks.get(fallback_key)
     except Exception as e:
         print("🔴 Grok LLM Error:", e)
+        fallback = fallbacks.get(fallback_key, template=False) or {
+            "text": f"Insight generation failed: {str(e)}", "source": "error"
+        }
+
+    if fallback is not None:
         if return_usage:
             return {
-                "text": f"Insight generation failed: {str(e)}",
+                "text": fallback["text"],
+                "fallback": fallback["source"],
                 "usage": {
                     "prompt_tokens": 0,
                     "completion_tokens": 0,
                     "total_tokens": 0
                 }
             }
-        return f"Insight generation failed: {str(e)}"
+        return fallback["text"]
+
+    if return_usage:
+        input_tokens = count_tokens(prompt)
+        output_tokens = count_tokens(insight)
+        total_tokens = input_tokens + output_tokens
+
+        return {
+            "text": insight,
+            "usage": {
+                "prompt_tokens": input_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": total_tokens
+            }
+        }
+
+    return insight
+
+
+def llm_stats() -> dict:
+    return {
+        "backend":       backend.name,
+        "client":        caller.stats(),
+        "fallbacks":     fallbacks.stats(),
+        "single_flight": inflight.stats(),
+        "cache":         insights.stats(),
+    }
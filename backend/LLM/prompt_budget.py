@@ -0,0 +1,175 @@
+# backend/LLM/prompt_budget.py
+
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:  # exact counts need tiktoken; otherwise we estimate
+    import tiktoken
+except ImportError:  # pragma: no cover
+    tiktoken = None
+
+# ─── Settings ─────────────────────────────────────────────────────────
+PROMPT_TOKEN_BUDGET  = int(os.getenv("PROMPT_TOKEN_BUDGET", "350"))
+PROMPT_TOP_K         = int(os.getenv("PROMPT_TOP_K", "8"))
+PROMPT_PRECISION     = int(os.getenv("PROMPT_PRECISION", "2"))
+PROMPT_SERIES_POINTS = int(os.getenv("PROMPT_SERIES_POINTS", "8"))
+
+OTHER_LABEL = "Other"
+
+_ENCODINGS: Dict[str, Any] = {}
+
+
+# ─── Token counting ───────────────────────────────────────────────────
+def _encoding(model: str):
+    if model not in _ENCODINGS:
+        try:
+            _ENCODINGS[model] = tiktoken.encoding_for_model(model) if tiktoken else None
+        except Exception as e:  # encoding files not downloadable, unknown model
+            print("🔴 Token encoder unavailable, estimating counts:", e)
+            _ENCODINGS[model] = None
+    return _ENCODINGS[model]
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    enc = _encoding(model)
+    if enc is not None:
+        return len(enc.encode(text))
+    return (len(text) + 3) // 4  # ~4 characters per token
+
+
+# ─── Formatting ───────────────────────────────────────────────────────
+def fmt_num(value: Any, precision: Optional[int] = None) -> str:
+    """
+    Rounds to a fixed precision and drops trailing zeros, so every number
+    in a prompt is rendered the same way (1234.5, 0.12, 17).
+    """
+    if value is None:
+        return "n/a"
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return str(value)
+    p = PROMPT_PRECISION if precision is None else precision
+    text = f"{float(value):.{p}f}"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return "0" if text in ("-0", "") else text
+
+
+def top_k(
+    pairs: Iterable[Tuple[str, float]],
+    k: Optional[int],
+    rollup: str = "sum",
+) -> List[Tuple[str, float]]:
+    """
+    Keeps the k largest (label, value) pairs and rolls the rest into one
+    "Other" entry (summed, or averaged for rates with rollup="mean").
+    k=None keeps every pair in its original order.
+    """
+    pairs = [(str(label), float(value or 0)) for label, value in pairs]
+    if k is None or len(pairs) <= k:
+        return pairs
+    ranked = sorted(pairs, key=lambda p: p[1], reverse=True)
+    kept, rest = ranked[:k], ranked[k:]
+    total = sum(v for _, v in rest)
+    other = total / len(rest) if rollup == "mean" else total
+    return kept + [(f"{OTHER_LABEL} ({len(rest)})", other)]
+
+
+def pair_lines(
+    pairs: Iterable[Tuple[str, float]],
+    k: Optional[int],
+    template: str = "{name}: {value}",
+    rollup: str = "sum",
+) -> List[str]:
+    """
+    One "name: value" line per kept category; template receives the
+    already formatted value, e.g. "{name}: ${value}" or "{name}: {value}%".
+    """
+    return [template.format(name=name, value=fmt_num(value)) for name, value in top_k(pairs, k, rollup)]
+
+
+def compact_series(values: Sequence[Any], max_points: Optional[int] = None) -> str:
+    """
+    Renders a numeric series on one line. Long series keep their summary
+    (n/min/mean/max) and only the most recent points.
+    """
+    values = [float(v) for v in values if v is not None]
+    if not values:
+        return "[]"
+    max_points = PROMPT_SERIES_POINTS if max_points is None else max_points
+    if len(values) <= max_points:
+        return "[" + ", ".join(fmt_num(v) for v in values) + "]"
+    mean = sum(values) / len(values)
+    tail = ", ".join(fmt_num(v) for v in values[-max_points:])
+    return (f"n={len(values)} min={fmt_num(min(values))} mean={fmt_num(mean)} "
+            f"max={fmt_num(max(values))} last=[{tail}]")
+
+
+def compact_chart(chart: Dict[str, Any], k: Optional[int]) -> str:
+    """
+    Text rendering of a chart payload for a prompt: title and scalar fields
+    on one line each, categories as top-k "name: value" lines. With k=None
+    the chart is rendered in full (the uncompacted baseline).
+    """
+    if k is None:
+        return f"{chart}"
+    lines: List[str] = []
+    for key, value in chart.items():
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            lines.append(f"{key}: {fmt_num(value) if not isinstance(value, str) else value}")
+
+    if isinstance(chart.get("data"), list):
+        pairs = [(d.get("name"), d.get("value")) for d in chart["data"] if isinstance(d, dict)]
+        lines += pair_lines(pairs, k)
+    x = chart.get("x") or []
+    if isinstance(chart.get("y"), list):
+        lines += pair_lines(zip(x, chart["y"]), k)
+    for s in chart.get("series") or []:
+        if not isinstance(s, dict):
+            continue
+        data = s.get("data") or []
+        if x and len(x) == len(data):
+            lines.append(f"{s.get('name', 'series')}: " + "; ".join(pair_lines(zip(x, data), k)))
+        else:
+            lines.append(f"{s.get('name', 'series')}: {compact_series(data)}")
+    return "\n".join(lines)
+
+
+# ─── Budgeting ────────────────────────────────────────────────────────
+def fit_prompt(
+    render: Callable[[Optional[int]], str],
+    budget: Optional[int] = None,
+    k: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    render(k) builds the prompt keeping k categories (k=None: everything,
+    as the builders did before compaction). k is halved until the prompt
+    fits the token budget or only one category is left.
+
+    Returns {"prompt", "input_tokens", "raw_input_tokens", "tokens_saved", "top_k"}.
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    k = PROMPT_TOP_K if k is None else k
+
+    raw = render(None)
+    raw_tokens = count_tokens(raw)
+
+    prompt = render(k)
+    tokens = count_tokens(prompt)
+    while tokens > budget and k > 1:
+        k = max(1, k // 2)
+        prompt = render(k)
+        tokens = count_tokens(prompt)
+
+    if raw_tokens < tokens:  # nothing to gain, e.g. a handful of categories
+        prompt, tokens, k = raw, raw_tokens, None
+
+    return {
+        "prompt":           prompt,
+        "input_tokens":     tokens,
+        "raw_input_tokens": raw_tokens,
+        "tokens_saved":     raw_tokens - tokens,
+        "top_k":            k,
+    }
@@ -0,0 +1,232 @@
+# backend/LLM/resilience.py
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+
+# ─── Settings ─────────────────────────────────────────────────────────
+LLM_CALL_TIMEOUT        = float(os.getenv("LLM_CALL_TIMEOUT", "20"))     # per-call deadline (s)
+LLM_MAX_IN_FLIGHT       = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))       # concurrent provider calls
+LLM_QUEUE_TIMEOUT       = float(os.getenv("LLM_QUEUE_TIMEOUT", "2"))     # max wait for a free slot (s)
+LLM_BREAKER_FAILURES    = int(os.getenv("LLM_BREAKER_FAILURES", "5"))    # consecutive failures to open
+LLM_BREAKER_SLOW_CALL   = float(os.getenv("LLM_BREAKER_SLOW_CALL", "10"))  # slower calls count as failures
+LLM_BREAKER_COOLDOWN    = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))  # open → half-open after (s)
+LLM_FALLBACK_CACHE_SIZE = int(os.getenv("LLM_FALLBACK_CACHE_SIZE", "256"))
+
+FALLBACK_TEMPLATE = (
+    "AI insight is temporarily unavailable. The figures above are current; "
+    "please retry in a moment for commentary."
+)
+
+
+class LLMUnavailable(Exception):
+    """
+    Raised when a call is not attempted or does not finish in time:
+    breaker open, no free slot within the queue deadline, or call timeout.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# ─── Circuit breaker ──────────────────────────────────────────────────
+class CircuitBreaker:
+    """
+    closed    → calls go through; LLM_BREAKER_FAILURES consecutive failures
+                (errors, timeouts or calls slower than LLM_BREAKER_SLOW_CALL)
+                open the circuit
+    open      → calls fail fast until LLM_BREAKER_COOLDOWN has passed
+    half_open → a single probe call is let through; success closes the
+                circuit, failure opens it again
+    """
+
+    STATES = ("closed", "open", "half_open")
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN,
+                 slow_call: float = LLM_BREAKER_SLOW_CALL):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.slow_call = slow_call
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probe_out = False
+        self.transitions = {state: 0 for state in self.STATES}
+        self.time_in_state = {state: 0.0 for state in self.STATES}
+        self._since = time.monotonic()
+
+    def _move(self, state: str) -> None:
+        now = time.monotonic()
+        self.time_in_state[self.state] += now - self._since
+        self._since = now
+        self.state = state
+        self.transitions[state] += 1
+        if state == "open":
+            self._opened_at = now
+            print(f"🔴 LLM circuit opened after {self._consecutive} failures")
+        elif state == "closed":
+            print("🟢 LLM circuit closed")
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self._move("half_open")
+                self._probe_out = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_out:
+                self._probe_out = True
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float) -> None:
+        ok = ok and latency <= self.slow_call
+        with self._lock:
+            if ok:
+                self._consecutive = 0
+                if self.state != "closed":
+                    self._move("closed")
+                return
+            self._consecutive += 1
+            if self.state == "half_open" or (self.state == "closed" and self._consecutive >= self.failures):
+                self._move("open")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            time_in_state = dict(self.time_in_state)
+            time_in_state[self.state] += time.monotonic() - self._since
+            return {
+                "state":                self.state,
+                "consecutive_failures": self._consecutive,
+                "transitions":          dict(self.transitions),
+                "seconds_in_state":     {k: round(v, 1) for k, v in time_in_state.items()},
+            }
+
+
+# ─── Resilient caller ─────────────────────────────────────────────────
+class ResilientCaller:
+    """
+    Runs provider calls with a global in-flight limit (callers wait at most
+    LLM_QUEUE_TIMEOUT for a slot), a per-call deadline and a circuit breaker.
+    A slot is only released when the provider call really returns, so calls
+    abandoned at their deadline still count against the limit.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, call_timeout: float = LLM_CALL_TIMEOUT,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT, breaker: Optional[CircuitBreaker] = None):
+        self.call_timeout = call_timeout
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._max_in_flight = max_in_flight
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self.counters = {
+            "calls":            0,
+            "succeeded":        0,
+            "failed":           0,
+            "timed_out":        0,
+            "queue_rejected":   0,
+            "short_circuited":  0,
+        }
+
+    def _bump(self, name: str, by: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += by
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        self._bump("calls")
+        if not self.breaker.allow():
+            self._bump("short_circuited")
+            raise LLMUnavailable("circuit open")
+
+        with self._lock:
+            self._queued += 1
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self._queued -= 1
+            if acquired:
+                self._in_flight += 1
+        if not acquired:
+            self._bump("queue_rejected")
+            # a saturated provider is a latency spike too
+            self.breaker.record(False, self.queue_timeout)
+            raise LLMUnavailable("no free slot")
+
+        started = time.monotonic()
+        future = self._pool.submit(fn)
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=self.call_timeout)
+        except FutureTimeout:
+            self._bump("timed_out")
+            self.breaker.record(False, time.monotonic() - started)
+            raise LLMUnavailable(f"timed out after {self.call_timeout:g}s")
+        except Exception:
+            self._bump("failed")
+            self.breaker.record(False, time.monotonic() - started)
+            raise
+        self._bump("succeeded")
+        self.breaker.record(True, time.monotonic() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats.update(in_flight=self._in_flight, queued=self._queued, max_in_flight=self._max_in_flight)
+        stats["breaker"] = self.breaker.stats()
+        return stats
+
+
+# ─── Fallback insights ────────────────────────────────────────────────
+class FallbackCache:
+    """
+    Last good insight per key (chart / page), served while the provider
+    is unavailable; otherwise a templated message.
+    """
+
+    def __init__(self, size: int = LLM_FALLBACK_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.counters = {"cached": 0, "templated": 0}
+
+    def put(self, key: Optional[str], text: str) -> None:
+        if not key:
+            return
+        with self._lock:
+            self._items[key] = {"text": text, "at": time.time()}
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def get(self, key: Optional[str], template: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        The cached insight for key, else the templated one (or None with
+        template=False).
+        """
+        with self._lock:
+            item = self._items.get(key) if key else None
+            if item is not None:
+                self.counters["cached"] += 1
+                return {"text": item["text"], "source": "cached", "cached_at": item["at"]}
+            if not template:
+                return None
+            self.counters["templated"] += 1
+            return {"text": FALLBACK_TEMPLATE, "source": "template"}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counters, "entries": len(self._items)}
@@ -0,0 +1,193 @@
+# backend/LLM/standin_server.py
+"""
+Local stand-in for the LLM provider, for load tests and benchmarks without
+network access. Answers are deterministic for a given prompt; latency is
+drawn from a configurable distribution.
+
+    python -m LLM.standin_server --port 8090 --latency lognormal:800,0.6
+    LLM_BACKEND=standin LLM_STANDIN_URL=http://127.0.0.1:8090 uvicorn main:app
+
+Latency specs (milliseconds):
+    fixed:<ms>                 every call takes <ms>
+    uniform:<lo>,<hi>
+    normal:<mean>,<stdev>
+    lognormal:<median>,<sigma>  heavy right tail, closest to real providers
+    bimodal:<fast>,<slow>,<p>  <slow> with probability p, else <fast>
+
+The first streamed chunk arrives after the drawn latency (time to first
+token), then one word every --token-ms.
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+
+STANDIN_LATENCY  = os.getenv("LLM_STANDIN_LATENCY", "lognormal:600,0.5")
+STANDIN_TOKEN_MS = float(os.getenv("LLM_STANDIN_TOKEN_MS", "15"))
+STANDIN_ERROR_RATE = float(os.getenv("LLM_STANDIN_ERROR_RATE", "0"))
+STANDIN_SEED     = int(os.getenv("LLM_STANDIN_SEED", "7"))
+
+_OPENERS = [
+    "Volume is concentrated in a few partners",
+    "The mix shifted modestly versus the 7-day baseline",
+    "Yesterday tracked close to the historical average",
+    "A small number of categories drive most of the change",
+    "Performance is stable with no material outliers",
+]
+_ACTIONS = [
+    "rebalance routing toward the most cost-efficient acquirers",
+    "monitor the lagging segment for another week before acting",
+    "pilot a volume shift on a low-risk slice of traffic",
+    "review pricing with the highest-cost partner",
+    "keep the current setup and watch for a repeat of the spike",
+]
+_RISKS = [
+    "concentration risk if the leading partner degrades",
+    "short-term noise rather than a trend",
+    "FX exposure on the dominant currency",
+    "seasonal effects around month end",
+    "lower approval rates on smaller card types",
+]
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Returns a sampler of seconds for a latency spec (see module docstring).
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed" and len(values) == 1:
+        ms, = values
+        return lambda rng: ms / 1000
+    if kind == "uniform" and len(values) == 2:
+        lo, hi = values
+        return lambda rng: rng.uniform(lo, hi) / 1000
+    if kind == "normal" and len(values) == 2:
+        mean, stdev = values
+        return lambda rng: max(0.0, rng.gauss(mean, stdev)) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0, sigma) / 1000
+    if kind == "bimodal" and len(values) == 3:
+        fast, slow, p = values
+        return lambda rng: (slow if rng.random() < p else fast) / 1000
+    raise ValueError(f"Bad latency spec {spec!r}")
+
+
+def deterministic_text(prompt: str) -> str:
+    """
+    Same prompt, same answer: sentences are picked by the prompt's hash.
+    """
+    h = hashlib.sha256(prompt.encode("utf-8")).digest()
+    return (
+        f"{_OPENERS[h[0] % len(_OPENERS)]}. "
+        f"Recommendation: {_ACTIONS[h[1] % len(_ACTIONS)]}. "
+        f"Watch for {_RISKS[h[2] % len(_RISKS)]}."
+    )
+
+
+def _words(text: str) -> List[str]:
+    parts = text.split(" ")
+    return [w + (" " if i < len(parts) - 1 else "") for i, w in enumerate(parts)]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    latency: Callable[[random.Random], float] = staticmethod(parse_latency(STANDIN_LATENCY))
+    token_ms: float = STANDIN_TOKEN_MS
+    error_rate: float = STANDIN_ERROR_RATE
+    rng = random.Random(STANDIN_SEED)
+    rng_lock = threading.Lock()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # keep load tests quiet
+        pass
+
+    def _json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self._json(200, {"status": "ok"})
+        self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/v1/complete":
+            return self._json(404, {"error": "not found"})
+        length = int(self.headers.get("Content-Length", 0))
+        req = json.loads(self.rfile.read(length) or b"{}")
+        with self.rng_lock:
+            delay = self.latency(self.rng)
+            fail = self.rng.random() < self.error_rate
+
+        time.sleep(delay)
+        if fail:
+            return self._json(503, {"error": "stand-in injected failure"})
+
+        text = deterministic_text(req.get("prompt", ""))
+        if not req.get("stream"):
+            return self._json(200, {"text": text, "model": req.get("model"), "latency_ms": round(delay * 1000, 1)})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for word in _words(text):
+            self._chunk(json.dumps({"delta": word}) + "\n")
+            time.sleep(self.token_ms / 1000)
+        self._chunk(json.dumps({"done": True}) + "\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, data: str) -> None:
+        raw = data.encode("utf-8")
+        self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(host: str = "127.0.0.1", port: int = 8090, latency: str = STANDIN_LATENCY,
+          token_ms: float = STANDIN_TOKEN_MS, error_rate: float = STANDIN_ERROR_RATE,
+          seed: int = STANDIN_SEED) -> ThreadingHTTPServer:
+    """
+    Builds (but does not start) a stand-in server; call serve_forever() on it,
+    or run it in a thread from a benchmark.
+    """
+    handler = type("ConfiguredStandInHandler", (StandInHandler,), {
+        "latency":    staticmethod(parse_latency(latency)),
+        "token_ms":   token_ms,
+        "error_rate": error_rate,
+        "rng":        random.Random(seed),
+        "rng_lock":   threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deterministic local LLM stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", default=STANDIN_LATENCY)
+    parser.add_argument("--token-ms", type=float, default=STANDIN_TOKEN_MS)
+    parser.add_argument("--error-rate", type=float, default=STANDIN_ERROR_RATE)
+    parser.add_argument("--seed", type=int, default=STANDIN_SEED)
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency, args.token_ms, args.error_rate, args.seed)
+    print(f"🟢 LLM stand-in on http://{args.host}:{args.port} (latency {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
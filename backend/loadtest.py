@@ -0,0 +1,260 @@
+# backend/loadtest.py
+"""
+Replays the request mix the React pages produce against a running API and
+reports throughput, latency percentiles per endpoint and DB pool saturation.
+
+    # LLM stand-in + API, then the load
+    python -m LLM.standin_server --latency lognormal:800,0.6 &
+    LLM_BACKEND=standin uvicorn main:app --port 8001 --workers 2 &
+    python loadtest.py --base-url http://localhost:8001 --users 20 --duration 60
+
+Each virtual user loops over "sessions": open a page with a filter (as the
+page's filter buttons do), sometimes click an insight, and on the dashboard
+sometimes drill DRILL_LVL1 → DRILL_LVL2 using values from the previous
+response. Pool usage is sampled from /api/health/pool; with several uvicorn
+workers each sample shows the pool of whichever worker answered.
+"""
+
+import os
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from KPI.chart_configs import chart_drill_options
+
+# ─── Request mix ──────────────────────────────────────────────────────
+# weights are relative; filters mirror the FILTER_OPTIONS of each page
+FILTERS = ["YTD", "MTD", "Weekly", "Daily", "Monthly", "Yesterday", "Today"]
+FILTER_WEIGHTS = [30, 25, 15, 10, 10, 5, 5]
+REPORT_FILTERS = ["YTD", "MTD", "Weekly", "Daily"]
+
+PAGES = {
+    # page: (weight, path, filtered, insight path, insight chart titles)
+    "dashboard":   (30, "/api/dashboard", False, "/api/dashboard/insights",
+                    ["Revenue by Currency", "Top 5 Acquirers by Volume", "Payment Method Distribution"]),
+    "financial":   (15, "/api/financial-performance", True, "/api/financial-performance/insights",
+                    ["Sales by Currency", "Processing Fee Analysis"]),
+    "customer":    (15, "/api/customer-insights", True, "/api/customer-insights/insight",
+                    ["Transactions by Acquirer", "Transaction Type Distribution", "Payment Creation Patterns"]),
+    "demographic": (10, "/api/demographic", True, "/api/demographic/insight", [None]),
+    "operational": (10, "/api/operational-efficiency", True, None, []),
+    "risk":        (10, "/api/risk-and-fraud", True, None, []),
+    "reports":     (10, "/api/gateway-fee", True, "/api/gateway-fee/insight", [None]),
+}
+
+INSIGHT_RATE = float(os.getenv("LOADTEST_INSIGHT_RATE", "0.3"))   # per page load
+DRILL_RATE   = float(os.getenv("LOADTEST_DRILL_RATE", "0.4"))     # per dashboard load
+LVL2_RATE    = float(os.getenv("LOADTEST_LVL2_RATE", "0.6"))      # per LVL1 drill
+
+
+# ─── HTTP ─────────────────────────────────────────────────────────────
+class Recorder:
+    """
+    Thread-safe latency / status collection per endpoint label.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def add(self, label: str, seconds: float, status: str) -> None:
+        with self._lock:
+            self.latencies[label].append(seconds)
+            self.statuses[label][status] += 1
+
+
+def _get(base_url: str, path: str, params: Dict[str, Any], timeout: float) -> Tuple[str, Any]:
+    query = urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+    url = f"{base_url}{path}" + (f"?{query}" if query else "")
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return str(resp.status), json.loads(resp.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return str(e.code), None
+    except Exception as e:  # timeouts, refused connections
+        return type(e).__name__, None
+
+
+class VirtualUser:
+    def __init__(self, base_url: str, recorder: Recorder, rng: random.Random,
+                 think: float, timeout: float):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.think = think
+        self.timeout = timeout
+
+    def call(self, label: str, path: str, params: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        status, body = _get(self.base_url, path, params, self.timeout)
+        self.recorder.add(label, time.perf_counter() - started, status)
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+        return body
+
+    def session(self) -> None:
+        rng = self.rng
+        page = rng.choices(list(PAGES), weights=[p[0] for p in PAGES.values()])[0]
+        _, path, filtered, insight_path, charts = PAGES[page]
+        params: Dict[str, Any] = {}
+        if filtered:
+            params["filter_type"] = (rng.choice(REPORT_FILTERS) if page == "reports"
+                                     else rng.choices(FILTERS, weights=FILTER_WEIGHTS)[0])
+
+        body = self.call(path, path, params)
+
+        if insight_path and rng.random() < INSIGHT_RATE:
+            chart = rng.choice(charts)
+            self.call(insight_path, insight_path, {**params, "chart_id": chart})
+
+        if page == "dashboard" and body and rng.random() < DRILL_RATE:
+            self.drill(body)
+
+    def drill(self, dashboard: Any) -> None:
+        charts = [c for c in dashboard if isinstance(c, dict)
+                  and c.get("chartKey") in chart_drill_options and c.get("data")]
+        if not charts:
+            return
+        chart = self.rng.choice(charts)
+        key = chart["chartKey"]
+        base_value = self.rng.choice(chart["data"])["name"]
+        dims = list(chart_drill_options[key])
+        dim1 = self.rng.choice(dims)
+
+        lvl1 = self.call("/api/drill DRILL_LVL1", "/api/drill", {
+            "chartKey": key, "level": "DRILL_LVL1", "dimension": dim1, "baseValue": base_value,
+        })
+        if not lvl1 or not lvl1.get("data") or self.rng.random() >= LVL2_RATE:
+            return
+        parent = self.rng.choice(lvl1["data"])["name"]
+        dim2 = self.rng.choice([d for d in dims if d != dim1])
+        self.call("/api/drill DRILL_LVL2", "/api/drill", {
+            "chartKey": key, "level": "DRILL_LVL2", "dimension": dim2, "dimension1": dim1,
+            "parentValue": parent, "baseValue": base_value,
+        })
+
+
+# ─── Pool sampling ────────────────────────────────────────────────────
+def sample_pool(base_url: str, stop: threading.Event, interval: float, out: List[Dict[str, Any]]) -> None:
+    while not stop.wait(interval):
+        status, body = _get(base_url, "/api/health/pool", {}, timeout=5)
+        if status == "200" and body:
+            out.append(body)
+
+
+# ─── Reporting ────────────────────────────────────────────────────────
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    idx = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+def summarise(recorder: Recorder, elapsed: float, pool_samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    endpoints = {}
+    total = 0
+    for label, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        total += len(values)
+        statuses = dict(recorder.statuses[label])
+        endpoints[label] = {
+            "requests": len(values),
+            "rps":      round(len(values) / elapsed, 2),
+            "errors":   sum(n for s, n in statuses.items() if s != "200"),
+            "statuses": statuses,
+            "p50_ms":   round(percentile(values, 50) * 1000, 1),
+            "p95_ms":   round(percentile(values, 95) * 1000, 1),
+            "p99_ms":   round(percentile(values, 99) * 1000, 1),
+            "max_ms":   round(values[-1] * 1000, 1),
+        }
+
+    pool: Dict[str, Any] = {"samples": len(pool_samples)}
+    if pool_samples:
+        used = [s["checked_out"] for s in pool_samples]
+        capacity = max(s["capacity"] for s in pool_samples)
+        pool.update(
+            capacity=capacity,
+            workers_seen=len({s.get("pid") for s in pool_samples}),
+            checked_out_mean=round(sum(used) / len(used), 2),
+            checked_out_max=max(used),
+            saturated_pct=round(100 * sum(u >= capacity for u in used) / len(used), 1),
+            overflow_max=max(s["overflow"] for s in pool_samples),
+        )
+    return {
+        "elapsed_s":  round(elapsed, 1),
+        "requests":   total,
+        "throughput": round(total / elapsed, 2) if elapsed else 0.0,
+        "endpoints":  endpoints,
+        "pool":       pool,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s "
+          f"→ {report['throughput']} req/s\n")
+    header = f"{'endpoint':45} {'n':>6} {'rps':>7} {'err':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    print(header)
+    print("─" * len(header))
+    for label, e in report["endpoints"].items():
+        print(f"{label:45} {e['requests']:>6} {e['rps']:>7} {e['errors']:>5} "
+              f"{e['p50_ms']:>8} {e['p95_ms']:>8} {e['p99_ms']:>8} {e['max_ms']:>8}")
+    pool = report["pool"]
+    if pool.get("samples"):
+        print(f"\nDB pool: capacity {pool['capacity']}, checked out mean {pool['checked_out_mean']} / "
+              f"max {pool['checked_out_max']}, saturated {pool['saturated_pct']}% of samples "
+              f"({pool['samples']} samples, {pool['workers_seen']} worker(s))")
+
+
+# ─── Driver ───────────────────────────────────────────────────────────
+def run(base_url: str, users: int, duration: float, think: float = 0.0, timeout: float = 60.0,
+        seed: Optional[int] = None, pool_interval: float = 0.5) -> Dict[str, Any]:
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+    stop = threading.Event()
+    pool_samples: List[Dict[str, Any]] = []
+    sampler = threading.Thread(target=sample_pool, args=(base_url, stop, pool_interval, pool_samples), daemon=True)
+    master = random.Random(seed)
+
+    def loop(user_seed: int) -> None:
+        user = VirtualUser(base_url, recorder, random.Random(user_seed), think, timeout)
+        while time.monotonic() < deadline:
+            user.session()
+
+    started = time.monotonic()
+    sampler.start()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        for _ in range(users):
+            pool.submit(loop, master.randrange(1 << 30))
+    elapsed = time.monotonic() - started
+    stop.set()
+    sampler.join()
+    return summarise(recorder, elapsed, pool_samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay dashboard traffic against a running API")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--think", type=float, default=0.0, help="mean think time between requests (s)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args.base_url.rstrip("/"), args.users, args.duration, args.think, args.timeout, args.seed)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
@@ -9,6 +9,21 @@ from API.risk_and_fraud_management import router as risk_and_fraud_router
 from API.customer_insight import router as customer_insight_router
 from API.report import router as report_router
 from API.drill import router as drill_router
+from API.batch import router as batch_router
+from API.live import router as live_router
+from API.export import router as export_router
+from API.llm import router as llm_router
+from API.health import router as health_router
+from API.trends import router as trends_router
+from API.anomalies import router as anomalies_router
+from API.percentiles import router as percentiles_router
+from API.deadlines import DeadlineMiddleware, request_aborted_handler
+from DB.cancellation import RequestAborted
+from KPI.live_feed import live_feed
+from KPI.drill_bitmap import DRILL_BITMAP, drill_bitmaps
+from KPI.utils.dimensions import dimensions
+from KPI.trends import rollup_refresher
+from KPI.quantiles import sketch_refresher
 
 app = FastAPI(title="A360 Prototype Dashboard API")
 
@@ -21,6 +36,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ─── DEADLINES ─────────────────────────────────────────────────────────
+# per-endpoint deadlines; running queries are cancelled on overrun or
+# client disconnect
+app.add_middleware(DeadlineMiddleware)
+app.add_exception_handler(RequestAborted, request_aborted_handler)
+
 # ─── ROUTES ────────────────────────────────────────────────────────────
 app.include_router(dashboard_router, prefix="/api")
 app.include_router(financial_analysis_router, prefix="/api")
@@ -29,4 +50,30 @@ app.include_router(demographic_router, prefix="/api")
 app.include_router(risk_and_fraud_router, prefix="/api")
 app.include_router(customer_insight_router, prefix="/api")
 app.include_router(report_router, prefix="/api")
-app.include_router(drill_router, prefix="/api")
\ No newline at end of file
+app.include_router(drill_router, prefix="/api")
+app.include_router(batch_router, prefix="/api")
+app.include_router(live_router, prefix="/api")
+app.include_router(export_router, prefix="/api")
+app.include_router(llm_router, prefix="/api")
+app.include_router(health_router, prefix="/api")
+app.include_router(trends_router, prefix="/api")
+app.include_router(anomalies_router, prefix="/api")
+app.include_router(percentiles_router, prefix="/api")
+
+
+@app.on_event("startup")
+def start_background_workers():
+    dimensions.start()
+    rollup_refresher.start()
+    sketch_refresher.start()
+    if DRILL_BITMAP:
+        drill_bitmaps.start()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    live_feed.stop()
+    drill_bitmaps.stop()
+    rollup_refresher.stop()
+    sketch_refresher.stop()
+    dimensions.stop()
\ No newline at end of file